@@ -3,10 +3,11 @@ Vercel Entry Point - Flask Application
 This file defines the Flask app directly so Vercel can detect it.
 All routes and logic are imported from backend modules.
 """
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import pathlib
+import json
 import os
 import sys
 
@@ -15,8 +16,12 @@ backend_path = pathlib.Path(__file__).parent / 'backend'
 sys.path.insert(0, str(backend_path))
 
 # Import backend modules
-from letterboxd_scraper import get_user_movies, get_user_watched_movies, get_movie_details
-from recommender import generate_recommendations
+from analysis import analyze, analyze_group, iter_analysis_events
+from compatibility import top_matches
+from taste_vectors import similar_users, recommend_films
+from group import GROUP_MAX_USERS
+from jobs import get_job_manager
+import metrics
 
 # Load environment variables from .env file in project root
 project_root = pathlib.Path(__file__).parent
@@ -59,6 +64,10 @@ CORS(app, resources={
     }
 })
 
+def wants_timings(data):
+    """Whether the request asked for its metrics breakdown ("timings": true or ?timings=1)"""
+    return bool(data.get('timings') or request.args.get('timings'))
+
 @app.route('/api/analyze', methods=['POST', 'OPTIONS'])
 def analyze_users():
     """
@@ -66,8 +75,23 @@ def analyze_users():
     
     POST body: {
         "user1": "username1",
-        "user2": "username2" (optional)
+        "user2": "username2" (optional),
+        "async": true (optional),
+        "timings": true (optional),
+        "fast": true (optional)
     }
+    
+    With "async": true the analysis runs in the background: the response is
+    202 with a job id right away, and GET /api/jobs/<job_id> reports progress
+    and the final result. Identical requests share one job.
+    
+    With "timings": true (or ?timings=1) the response also has a 'timings'
+    key: how long each step took and what was fetched or cached for this
+    request (see backend/metrics.py).
+    
+    With "fast": true only as much of the rated lists is scraped as the top
+    10s need, and 'section_status' says which sections are 'exact' and
+    which are 'provisional' (see backend/fast_mode.py).
     """
     # Handle preflight requests
     if request.method == 'OPTIONS':
@@ -84,37 +108,166 @@ def analyze_users():
     if not user1:
         return jsonify({'error': 'At least one username required'}), 400
     
+    # Job mode: start the analysis in the background and answer right away
+    if data.get('async'):
+        job, created = get_job_manager().submit(user1, user2, fast=bool(data.get('fast')))
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/api/jobs/{job.id}',
+            'reused': not created
+        }), 202
+    
     try:
-        # Fetch rated movies for user(s) (used for "both loved" and "both hated")
-        print(f"Fetching rated movies for {user1}...")
-        user1_movies = get_user_movies(user1)
-        
-        # Fetch watched movies for user(s) (used for recommendations)
-        print(f"Fetching watched movies for {user1}...")
-        user1_watched = get_user_watched_movies(user1)
-        
-        if user2:
-            print(f"Fetching rated movies for {user2}...")
-            user2_movies = get_user_movies(user2)
-            print(f"Fetching watched movies for {user2}...")
-            user2_watched = get_user_watched_movies(user2)
-            # Generate recommendations comparing both users
-            recommendations = generate_recommendations(user1_movies, user2_movies, user1_watched, user2_watched)
-        else:
-            # Single user mode - just return their data
-            recommendations = {
-                'both_enjoyed': [],
-                'user1_recommends': [],
-                'user2_recommends': [],
-                'new_suggestions': [],
-                'user1_movies': user1_movies
-            }
-        
-        return jsonify(recommendations)
+        # Scrape the user(s) and generate recommendations (see backend/analysis.py)
+        with metrics.trace() as request_trace:
+            recommendations = analyze(user1, user2, fast=bool(data.get('fast')))
+            with metrics.span('serialize'):
+                body = app.json.dumps(recommendations)
+        if wants_timings(data):
+            # Added after the trace closes so serializing the result is in it
+            body = body[:-1] + ', "timings": ' + app.json.dumps(request_trace.breakdown()) + '}'
+        return Response(body, mimetype=app.json.mimetype)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analyze/stream', methods=['POST', 'OPTIONS'])
+def analyze_users_stream():
+    """
+    Streaming version of /api/analyze
+    
+    Same POST body, but the response is newline-delimited JSON (NDJSON):
+    one event per line, sent as soon as it happens. Scrape progress arrives
+    while pages download, and each recommendation section arrives as soon
+    as it's computed, so the page can start showing results right away.
+    
+    Example lines:
+        {"type": "progress", "user": "alice", "list": "rated", "rating": 5.0, "page": 1, "pages": 3, "films": 72}
+        {"type": "section", "name": "both_hated", "data": [...]}
+        {"type": "timings", "data": {...}}  (with "timings": true)
+        {"type": "done"}
+    """
+    # Handle preflight requests
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response
+    
+    data = request.json
+    user1 = data.get('user1')
+    user2 = data.get('user2')
+    
+    if not user1:
+        return jsonify({'error': 'At least one username required'}), 400
+    
+    def generate():
+        for event in iter_analysis_events(user1, user2, fast=bool(data.get('fast')), timings=wants_timings(data)):
+            yield json.dumps(event) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Ask proxies not to buffer the stream
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/analyze/group', methods=['POST', 'OPTIONS'])
+def analyze_group_users():
+    """
+    Group version of /api/analyze for watch parties
+    
+    POST body: {
+        "users": ["username1", "username2", "username3", ...]
+    }
+    
+    Returns the films the group shares as favourites and dislikes, and what
+    each member should show the others (see backend/group.py).
+    """
+    # Handle preflight requests
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response
+    
+    data = request.json
+    users = [user.strip() for user in data.get('users') or [] if isinstance(user, str) and user.strip()]
+    
+    if len(users) < 2:
+        return jsonify({'error': 'At least two usernames required'}), 400
+    if len(users) > GROUP_MAX_USERS:
+        return jsonify({'error': f'At most {GROUP_MAX_USERS} usernames allowed'}), 400
+    
+    try:
+        return jsonify(analyze_group(users))
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/compatibility/<username>', methods=['GET'])
+def get_compatibility(username):
+    """
+    The users in the precomputed roster most compatible with username
+    
+    Query parameters:
+        k: How many users to return (default 10)
+        metric: pearson (default), cosine, overlap or both_loved
+    
+    The roster is built offline with `python backend/compatibility.py build`.
+    """
+    try:
+        k = int(request.args.get('k', 10))
+        matches = top_matches(username, k=max(k, 1), metric=request.args.get('metric', 'pearson'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if matches is None:
+        return jsonify({'error': f"No compatibility data for '{username}'"}), 404
+    return jsonify({'username': username, 'matches': matches})
+
+@app.route('/api/taste/<username>/<kind>', methods=['GET'])
+def get_taste_neighbours(username, kind):
+    """
+    Nearest neighbours of a user's taste vector
+    
+    kind is 'users' (people with similar taste) or 'films' (films they
+    haven't watched with the highest predicted rating). The k query
+    parameter sets how many to return (default 10).
+    
+    The index is built offline with `python backend/taste_vectors.py build`.
+    """
+    queries = {'users': similar_users, 'films': recommend_films}
+    if kind not in queries:
+        return jsonify({'error': "Use /users or /films"}), 404
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        return jsonify({'error': 'k must be a number'}), 400
+    results = queries[kind](username, k=max(k, 1))
+    if results is None:
+        return jsonify({'error': f"No taste vector for '{username}'"}), 404
+    return jsonify({'username': username, kind: results})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Reports on a background analysis started with "async": true
+    
+    Returns the job's status (queued, running, done or error), per-list scrape
+    progress, any sections computed so far, and the full result once done.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found (it may have expired)'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Process-wide timings and counters in the Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health():
     """Simple health check endpoint"""
@@ -0,0 +1,152 @@
+"""
+AI Response Cache
+Remembers Claude's answers so the same question isn't paid for twice
+
+Asking Claude for suggestions takes several seconds and costs money, and the
+answer only depends on the prompt - the films both users loved and what
+they've already watched. Re-running the same pair of users builds exactly the
+same prompt, so the parsed answer is stored in the cache database under a
+hash of the prompt inputs and reused until it's AI_CACHE_TTL old.
+
+The table keeps at most AI_CACHE_MAX_ENTRIES answers; when it's full, the
+ones used least recently are dropped first.
+
+LEARNING NOTE: Two identical requests arriving at the same time would both
+miss the cache and both call the API. get_or_compute() makes the second one
+wait for the first one's answer instead ("single-flight").
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import cache_db
+import metrics
+
+# How long an answer is reused (default 7 days)
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', str(7 * 24 * 3600)))
+# How many answers are kept
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '1000'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_responses (
+    key TEXT PRIMARY KEY,         -- sha256 of the normalized prompt inputs
+    response TEXT NOT NULL,       -- JSON of the parsed answer
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ai_responses_last_used ON ai_responses (last_used_at);
+"""
+
+# Requests being computed right now: {key: _Flight}
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+class _Flight:
+    """One in-progress computation that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def _connection():
+    cache_db.ensure_schema('ai_cache', SCHEMA)
+    return cache_db.get_connection()
+
+def make_key(inputs):
+    """
+    Hashes prompt inputs into a cache key
+
+    Args:
+        inputs: Anything JSON-serializable. Callers should normalize it first
+            (e.g. sort lists whose order doesn't change the answer).
+    """
+    text = json.dumps(inputs, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def get(key):
+    """Returns the cached answer for a key, or None if there isn't a fresh one"""
+    if not cache_db.CACHE_ENABLED:
+        return None
+    now = time.time()
+    try:
+        conn = _connection()
+        row = conn.execute(
+            'SELECT response FROM ai_responses WHERE key = ? AND created_at > ?', (key, now - AI_CACHE_TTL)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE ai_responses SET last_used_at = ? WHERE key = ?', (now, key))
+        conn.commit()
+        return json.loads(row['response'])
+    except (sqlite3.Error, ValueError) as e:
+        print(f"  AI cache read failed: {e}")
+        return None
+
+def put(key, response):
+    """Stores an answer, evicting expired and least recently used ones"""
+    if not cache_db.CACHE_ENABLED:
+        return
+    now = time.time()
+    try:
+        conn = _connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO ai_responses (key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(response), now, now)
+        )
+        conn.execute('DELETE FROM ai_responses WHERE created_at <= ?', (now - AI_CACHE_TTL,))
+        conn.execute(
+            'DELETE FROM ai_responses WHERE key NOT IN '
+            '(SELECT key FROM ai_responses ORDER BY last_used_at DESC LIMIT ?)',
+            (AI_CACHE_MAX_ENTRIES,)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  AI cache write failed: {e}")
+
+def get_or_compute(key, compute):
+    """
+    Returns the cached answer for key, or computes and caches it
+
+    If another thread is already computing the same key, waits for its
+    answer instead of computing it again. Empty answers ([] / None) mean the
+    call failed, so they're returned but not cached.
+
+    Args:
+        compute: Function with no arguments that produces the answer
+    """
+    cached = get(key)
+    if cached is not None:
+        print("DEBUG: Using cached AI response")
+        metrics.count('letterboxd_cache_requests_total', cache='ai_responses', result='hit')
+        return cached
+
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = _Flight()
+
+    metrics.count('letterboxd_cache_requests_total', cache='ai_responses', result='miss' if leader else 'shared')
+    if not leader:
+        print("DEBUG: Waiting for an identical AI request already in progress")
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = compute()
+        if flight.result:
+            put(key, flight.result)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+        flight.done.set()
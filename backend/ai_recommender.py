@@ -5,22 +5,225 @@ Uses Claude (Anthropic) to analyze movies and generate recommendations
 import os
 import json
 import re
-from anthropic import Anthropic
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from anthropic import Anthropic, NotFoundError
 from dotenv import load_dotenv
 import pathlib
 
+import ai_cache
+import metrics
+from film_catalog import find_slug, film_url
+from film_metadata import get_films
+
 # Load environment variables from .env file in project root
 project_root = pathlib.Path(__file__).parent.parent
 load_dotenv(dotenv_path=project_root / '.env')
 
-def get_ai_recommendations(both_5star_movies, user1_watched, user2_watched):
+# Claude models to try, in order of preference
+MODELS_TO_TRY = [
+    "claude-3-7-sonnet-20250219",  # Latest Sonnet model
+    "claude-3-5-haiku-latest",     # Fallback to Haiku
+    "claude-3-opus-latest",        # Fallback to Opus
+]
+
+# Seconds before a hedged request also tries the next model (0 = off: only
+# fall back after a model fails)
+AI_HEDGE_AFTER = float(os.getenv('AI_HEDGE_AFTER', '0'))
+# Most hedged calls allowed in flight across all requests, and the timeout
+# they get (shorter than the normal 60s, so losers free their thread sooner)
+AI_MAX_HEDGES = int(os.getenv('AI_MAX_HEDGES', '2'))
+AI_HEDGE_TIMEOUT = float(os.getenv('AI_HEDGE_TIMEOUT', '20'))
+# Threads hedged requests run their API calls on, shared by every request
+AI_CALL_WORKERS = int(os.getenv('AI_CALL_WORKERS', '32'))
+# How long a model that returned 404 is skipped before we try it again
+AI_MODEL_MISSING_TTL = int(os.getenv('AI_MODEL_MISSING_TTL', '3600'))
+
+# Bump when the prompt wording changes, so cached answers to the old prompt aren't reused
+PROMPT_VERSION = 1
+
+# Shared by every request (see _get_client)
+_client = None
+_client_settings = None
+_client_lock = threading.Lock()
+# {model: time until which it's assumed missing}
+_missing_until = {}
+# Threads hedged requests' calls run on, so a hedge can start while another
+# call waits (without hedging, calls run on the request's own thread)
+_call_pool = ThreadPoolExecutor(max_workers=max(AI_CALL_WORKERS, 1), thread_name_prefix='claude')
+# Hedged calls nobody waits for anymore still hold a thread until they
+# finish, so only AI_MAX_HEDGES of them may run at once
+_hedge_slots = threading.BoundedSemaphore(max(AI_MAX_HEDGES, 1))
+
+def _get_client(api_key):
+    """
+    Returns the shared Anthropic client, creating it on first use
+    
+    One client is reused for every request, so its connection pool (and the
+    TLS connections in it) stay warm. ANTHROPIC_BASE_URL points it somewhere
+    other than the real API, e.g. benchmarks/stub_anthropic.py.
+    """
+    global _client, _client_settings
+    settings = (api_key, os.getenv('ANTHROPIC_BASE_URL') or None)
+    with _client_lock:
+        if _client is None or _client_settings != settings:
+            _client = Anthropic(api_key=api_key, base_url=settings[1])
+            _client_settings = settings
+        return _client
+
+def _is_model_missing(error):
+    """
+    Checks whether an API error might mean the model isn't available
+    
+    This loose check only decides whether this call falls back to the next
+    model. Remembering a model as missing needs a real 404 (_is_not_found).
+    """
+    error_str = str(error)
+    return '404' in error_str or 'not_found' in error_str.lower() or ('error' in error_str.lower() and 'model' in error_str.lower())
+
+def _is_not_found(error):
+    """Checks whether an API error is a definite 404 Not Found"""
+    return isinstance(error, NotFoundError) or getattr(error, 'status_code', None) == 404
+
+def _available_models():
+    """MODELS_TO_TRY minus models that recently returned 404 (all of them if every model did)"""
+    now = time.time()
+    with _client_lock:
+        available = [model for model in MODELS_TO_TRY if _missing_until.get(model, 0) <= now]
+    return available or list(MODELS_TO_TRY)
+
+def _mark_missing(model_name):
+    with _client_lock:
+        _missing_until[model_name] = time.time() + AI_MODEL_MISSING_TTL
+
+def _ask_claude(api_key, prompt):
+    """
+    Sends the prompt to Claude, trying each model in MODELS_TO_TRY until one works
+    
+    Models are tried one after another, on this thread. With AI_HEDGE_AFTER
+    set, the calls run on _call_pool instead and the next model is also
+    started whenever the current ones have taken that many seconds without
+    answering, and the first good response wins.
+    
+    Returns:
+        The parsed JSON array of {title, year, reason} suggestions ([] if the
+        response couldn't be parsed)
+    
+    Raises:
+        Exception: If no model worked (e.g. the API key is invalid)
+    """
+    client = _get_client(api_key)
+    
+    def create(model_name, timeout=60.0):
+        return client.messages.create(
+            model=model_name,
+            max_tokens=2000,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            timeout=timeout  # 60 seconds, less for hedged calls
+        )
+    
+    def hedge(model_name):
+        try:
+            return create(model_name, timeout=AI_HEDGE_TIMEOUT)
+        finally:
+            _hedge_slots.release()
+    
+    message = None
+    last_error = None
+    waiting = _available_models()
+    running = {}
+    
+    def result(model_name, call):
+        """Runs call() for model_name; returns its message, or None if the next model should be tried"""
+        nonlocal last_error
+        try:
+            response = call()
+        except Exception as e:
+            last_error = e
+            # Check for model not found errors (404)
+            metrics.count('ai_model_calls_total', model=model_name, result='missing' if _is_model_missing(e) else 'error')
+            if _is_model_missing(e):
+                print(f"DEBUG: Model {model_name} not available, trying next...")
+                if _is_not_found(e):
+                    _mark_missing(model_name)
+            elif not running:
+                # For other errors (like auth), don't try other models
+                raise  # Re-raise if it's not a 404/model not found error
+            return None
+        metrics.count('ai_model_calls_total', model=model_name, result='ok')
+        print(f"DEBUG: Successfully used model: {model_name}")
+        return response
+    
+    while message is None and (running or waiting):
+        if not running:
+            model_name = waiting.pop(0)
+            if AI_HEDGE_AFTER <= 0 or not waiting:
+                # Nothing to hedge with - no need for another thread
+                message = result(model_name, lambda: create(model_name))
+                continue
+            running[_call_pool.submit(create, model_name)] = model_name
+        
+        # Without hedging, wait for the running call however long it takes
+        hedge_after = AI_HEDGE_AFTER if AI_HEDGE_AFTER > 0 and waiting else None
+        done, _ = wait(running, timeout=hedge_after, return_when=FIRST_COMPLETED)
+        if not done:
+            if not _hedge_slots.acquire(blocking=False):
+                # Too many hedges in flight already - just keep waiting
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+            else:
+                model_name = waiting.pop(0)
+                print(f"DEBUG: No response after {AI_HEDGE_AFTER}s, also trying {model_name}")
+                metrics.count('ai_hedged_requests_total')
+                running[_call_pool.submit(hedge, model_name)] = model_name
+                continue
+        
+        for future in done:
+            message = result(running.pop(future), future.result)
+            if message is not None:
+                break  # Success, exit the loop
+    
+    # Slower hedged calls are left to finish in the background; their answers are ignored
+    
+    if message is None:
+        raise Exception(f"None of the available models worked. Last error: {last_error}")
+    
+    # Extract response text
+    response_text = message.content[0].text
+    print(f"DEBUG: AI response received (length: {len(response_text)})")
+    
+    # Parse JSON from response (may be wrapped in markdown code blocks)
+    json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
+    if not json_match:
+        print("Warning: Could not find JSON array in AI response")
+        print(f"DEBUG: Response text: {response_text[:500]}")
+        return []
+    json_str = json_match.group(0)
+    try:
+        recommendations = json.loads(json_str)
+    except json.JSONDecodeError as e:
+        print(f"ERROR: Failed to parse JSON: {e}")
+        print(f"DEBUG: JSON string: {json_str[:500]}")
+        return []
+    # Keep only well-formed entries, so cached answers are safe to reuse
+    return [rec for rec in recommendations if isinstance(rec, dict) and rec.get('title')]
+
+def get_ai_recommendations(both_5star_movies, user1_watched, user2_watched, candidates=None):
     """
     Uses Claude AI to analyze movies both users rated 5 stars and generate recommendations
     
     Args:
         both_5star_movies: List of movies both users rated exactly 5.0 stars
-        user1_watched: Dict of all movies user1 has watched
-        user2_watched: Dict of all movies user2 has watched
+        user1_watched: UserProfile of all movies user1 has watched
+        user2_watched: UserProfile of all movies user2 has watched
+        candidates: Optional list of {title, year, url} films (e.g. from
+            item_similarity.suggest) - the AI then only picks from these and
+            explains why, instead of suggesting any film
     
     Returns:
         List of recommended movies with title, year, reason, and url
@@ -37,25 +240,45 @@ def get_ai_recommendations(both_5star_movies, user1_watched, user2_watched):
         return []
     
     try:
-        # Initialize Anthropic client
-        client = Anthropic(api_key=api_key)
-        
         # Format movie list for prompt
+        # Directors and genres come from the local film catalog - these films were
+        # just looked up for the "both enjoyed" sort, so this rarely hits the network
+        films = get_films([movie.get('url') for movie in both_5star_movies])
         movie_list = []
         for movie in both_5star_movies:
             title = movie.get('title', '')
             year = movie.get('year', '')
-            if year:
-                movie_list.append(f"- {title} ({year})")
-            else:
-                movie_list.append(f"- {title}")
+            line = f"- {title} ({year})" if year else f"- {title}"
+            film = films.get(movie.get('url')) or {}
+            facts = []
+            if film.get('directors'):
+                facts.append(f"directed by {', '.join(film['directors'][:2])}")
+            if film.get('genres'):
+                facts.append(', '.join(film['genres'][:3]))
+            if facts:
+                line += f" [{'; '.join(facts)}]"
+            movie_list.append(line)
         
         # Format watched movies list (combined, to exclude from recommendations)
-        all_watched_titles = set(user1_watched.keys()) | set(user2_watched.keys())
+        all_watched_titles = set(user1_watched.titles()) | set(user2_watched.titles())
         watched_list = []
         for title in sorted(all_watched_titles)[:100]:  # Limit to first 100 to avoid token limits
             watched_list.append(f"- {title}")
         
+        # When we already have candidates, the AI just chooses among them
+        candidate_rule = ""
+        candidates_by_title = {}
+        if candidates:
+            candidate_lines = []
+            for candidate in candidates:
+                candidates_by_title[candidate['title'].lower()] = candidate
+                year = candidate.get('year')
+                candidate_lines.append(f"- {candidate['title']} ({year})" if year else f"- {candidate['title']}")
+            candidate_rule = f"""
+Only suggest movies from this list of candidates (neither user has seen them):
+{chr(10).join(candidate_lines)}
+"""
+        
         # Create prompt
         prompt = f"""You are a movie recommendation expert. Analyze the following movies that two users both rated 5 stars:
 
@@ -63,7 +286,7 @@ def get_ai_recommendations(both_5star_movies, user1_watched, user2_watched):
 
 Both users have already watched these movies (do not recommend these):
 {chr(10).join(watched_list[:50])}
-
+{candidate_rule}
 IMPORTANT: 
 1. Analyze the 5-star movies to find common themes in actors, genres, directors, composers, cinematographers, etc.
 2. Truly hone in on the themes and connections between the movies - don't just suggest movies that are similar to the ones the users have already watched
@@ -74,85 +297,60 @@ IMPORTANT:
 
 Format your response as a JSON array: [{{"title": "Movie Title", "year": 2023, "reason": "why they'd like it based on the themes"}}]"""
 
-        # Call Claude API - try multiple models in order of preference
-        models_to_try = [
-            "claude-3-7-sonnet-20250219",  # Latest Sonnet model
-            "claude-3-5-haiku-latest",     # Fallback to Haiku
-            "claude-3-opus-latest",        # Fallback to Opus
-        ]
-        
-        message = None
-        last_error = None
+        # Same inputs, same answer: reuse it if we've asked before (see ai_cache.py).
+        # Order doesn't matter to the answer, so the lists are sorted for the key.
+        cache_key = ai_cache.make_key({
+            'prompt_version': PROMPT_VERSION,
+            'models': MODELS_TO_TRY,
+            'loved': sorted(movie_list),
+            'watched': watched_list[:50],
+            'candidates': sorted(candidates_by_title)
+        })
+        with metrics.span('ai.request'):
+            recommendations = ai_cache.get_or_compute(cache_key, lambda: _ask_claude(api_key, prompt))
         
-        for model_name in models_to_try:
-            try:
-                message = client.messages.create(
-                    model=model_name,
-                    max_tokens=2000,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    timeout=60.0  # 60 second timeout
-                )
-                print(f"DEBUG: Successfully used model: {model_name}")
-                break  # Success, exit the loop
-            except Exception as e:
-                last_error = e
-                error_str = str(e)
-                # Check for model not found errors (404)
-                if '404' in error_str or 'not_found' in error_str.lower() or ('error' in error_str.lower() and 'model' in error_str.lower()):
-                    print(f"DEBUG: Model {model_name} not available, trying next...")
-                    continue  # Try next model
-                else:
-                    # For other errors (like auth), don't try other models
-                    raise  # Re-raise if it's not a 404/model not found error
-        
-        if message is None:
-            raise Exception(f"None of the available models worked. Last error: {last_error}")
-        
-        # Extract response text
-        response_text = message.content[0].text
-        print(f"DEBUG: AI response received (length: {len(response_text)})")
+        # Convert to our format and add Letterboxd URLs
+        result = []
+        for rec in recommendations[:10]:  # Limit to 10
+            title = rec.get('title', '')
+            year = rec.get('year', '')
+            reason = rec.get('reason', '')
+            
+            if candidates_by_title:
+                # Keep only films from the candidate list, with its year and URL
+                candidate = candidates_by_title.get(str(title).lower())
+                if candidate is None:
+                    print(f"DEBUG: Skipping {title} - not one of the candidates")
+                    continue
+                result.append({
+                    'title': candidate['title'],
+                    'year': candidate.get('year'),
+                    'reason': reason,
+                    'url': candidate.get('url')
+                })
+                continue
+            
+            # Use the real slug if the film catalog has seen this film,
+            # otherwise construct the Letterboxd URL (basic format)
+            film_slug = find_slug(title, year)
+            if film_slug and (film_slug in user1_watched or film_slug in user2_watched):
+                # We know this exact film and one of them has already seen it
+                print(f"DEBUG: Skipping {title} - already watched")
+                continue
+            if not film_slug:
+                film_slug = title.lower().replace(' ', '-').replace("'", '').replace(':', '').replace(',', '')
+                film_slug = re.sub(r'[^a-z0-9-]', '', film_slug)
+            url = film_url(film_slug)
+            
+            result.append({
+                'title': title,
+                'year': year,
+                'reason': reason,
+                'url': url
+            })
         
-        # Parse JSON from response (may be wrapped in markdown code blocks)
-        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            try:
-                recommendations = json.loads(json_str)
-                
-                # Convert to our format and add Letterboxd URLs
-                result = []
-                for rec in recommendations[:10]:  # Limit to 10
-                    title = rec.get('title', '')
-                    year = rec.get('year', '')
-                    reason = rec.get('reason', '')
-                    
-                    # Construct Letterboxd URL (basic format)
-                    film_slug = title.lower().replace(' ', '-').replace("'", '').replace(':', '').replace(',', '')
-                    film_slug = re.sub(r'[^a-z0-9-]', '', film_slug)
-                    url = f"https://letterboxd.com/film/{film_slug}/"
-                    
-                    result.append({
-                        'title': title,
-                        'year': year,
-                        'reason': reason,
-                        'url': url
-                    })
-                
-                print(f"DEBUG: Successfully parsed {len(result)} recommendations")
-                return result
-            except json.JSONDecodeError as e:
-                print(f"ERROR: Failed to parse JSON: {e}")
-                print(f"DEBUG: JSON string: {json_str[:500]}")
-                return []
-        else:
-            print("Warning: Could not find JSON array in AI response")
-            print(f"DEBUG: Response text: {response_text[:500]}")
-            return []
+        print(f"DEBUG: Successfully parsed {len(result)} recommendations")
+        return result
             
     except Exception as e:
         error_str = str(e)
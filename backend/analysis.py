@@ -0,0 +1,266 @@
+"""
+Analysis Pipeline
+Runs a full analysis: scrape the user(s), then build the recommendation sections
+
+Both Flask entry points (app.py for Vercel, backend/app.py for local dev) use
+this module, so the regular and streaming endpoints share one implementation.
+
+LEARNING NOTE: The streaming version runs the analysis on a background thread
+and hands events to the web request through a queue.Queue - a thread-safe
+"mailbox" where one thread puts items and another takes them out.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
+
+import fast_mode
+from group import compare_group
+import metrics
+import prewarm
+from letterboxd_scraper import get_user_movies, get_user_watched_movies
+from recommender import iter_recommendation_sections, SECTIONS
+from user_profile import UserProfile
+
+# Send a heartbeat line if nothing else happened for this many seconds,
+# so proxies don't close a quiet connection (e.g. while the AI call runs)
+HEARTBEAT_INTERVAL = 10
+
+def _fetch_profiles(usernames, emit, fetch_rated_list=None):
+    """
+    Scrapes every user's rated and watched lists at the same time
+
+    The fetches are independent, so they all run concurrently; the shared
+    politeness budget in http_client still caps how hard we hit Letterboxd
+    overall. Each fetch fails on its own: a missing rated list is fatal
+    (there's nothing to compare), but a watched list that fails is replaced
+    by the user's rated movies and reported as a warning.
+
+    Args:
+        usernames: Users to fetch (duplicates are fetched once)
+        emit: Event callback, called from worker threads
+        fetch_rated_list: Replaces get_user_movies(username, progress=...)
+            for the rated lists (fast mode passes fast_mode.load_first)
+
+    Returns:
+        ({username: (movies, watched)}, warnings) - watched is a UserProfile,
+        or None when it failed
+    """
+    usernames = list(dict.fromkeys(usernames))
+    results = {username: {} for username in usernames}
+    # Popular users get kept warm by the pre-warming crawler (see prewarm.py)
+    prewarm.record_requests(usernames)
+    warnings = []
+
+    def progress_for(username):
+        return lambda list_event: emit(dict(list_event, type='progress', user=username))
+
+    def fetch_rated(username):
+        print(f"Fetching rated movies for {username}...")
+        with metrics.span('scrape.rated'):
+            return (fetch_rated_list or get_user_movies)(username, progress=progress_for(username))
+
+    def fetch_watched(username):
+        print(f"Fetching watched movies for {username}...")
+        # Watched lists run to thousands of films and are only used for
+        # matching, so keep them in the compact array form
+        with metrics.span('scrape.watched'):
+            return UserProfile.from_movies(get_user_watched_movies(username, progress=progress_for(username)))
+
+    executor = ThreadPoolExecutor(max_workers=2 * len(usernames))
+    try:
+        tasks = {}
+        for username in usernames:
+            # in_context carries this request's metrics trace onto the worker threads
+            tasks[executor.submit(metrics.in_context(fetch_rated), username)] = (username, 'movies')
+            tasks[executor.submit(metrics.in_context(fetch_watched), username)] = (username, 'watched')
+
+        for future in as_completed(tasks):
+            username, kind = tasks[future]
+            try:
+                results[username][kind] = future.result()
+            except Exception as e:
+                if kind == 'movies':
+                    # Without the rated list there's nothing to compare
+                    raise
+                warning = f"Couldn't load {username}'s watched list ({e}); using their rated movies instead"
+                print(f"Warning: {warning}")
+                warnings.append(warning)
+                emit({'type': 'warning', 'message': warning})
+                results[username][kind] = None
+    finally:
+        # Don't wait for the other fetches if one failed - answer right away
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return {username: (data['movies'], data['watched']) for username, data in results.items()}, warnings
+
+def _fetch_pair_fast(user1, user2, emit):
+    """
+    Like _fetch_profiles for two users, but loads only the parts of the rated
+    lists the top 10s need (see fast_mode.py)
+
+    Returns:
+        (profiles, warnings, section_status)
+    """
+    profiles, warnings = _fetch_profiles([user1, user2], emit, fetch_rated_list=fast_mode.load_first)
+    (stream1, watched1), (stream2, watched2) = profiles[user1], profiles[user2]
+    with metrics.span('scrape.rated'):
+        section_status = fast_mode.finish(stream1, stream2, watched1, watched2)
+
+    for username, stream in ((user1, stream1), (user2, stream2)):
+        if not stream.movies():
+            raise Exception(f"User '{username}' not found or has no rated movies")
+    print(f"Fast mode loaded {stream1.pages} + {stream2.pages} rated pages; sections: {section_status}")
+    profiles = {user1: (stream1.movies(), watched1), user2: (stream2.movies(), watched2)}
+    return profiles, warnings, section_status
+
+def _run_analysis(user1, user2, emit, fast=False):
+    """
+    Does the actual work for analyze and iter_analysis_events
+
+    Args:
+        emit: Function called with each event dict as it happens
+        fast: Stop scraping rated lists once the top 10s are settled (two users only)
+
+    Returns:
+        The full result dictionary
+    """
+    # Fetch rated movies (used for "both loved" and "both hated") and
+    # watched movies (used for recommendations) for every user at once
+    section_status = None
+    if fast and user2:
+        profiles, warnings, section_status = _fetch_pair_fast(user1, user2, emit)
+        emit({'type': 'section_status', 'data': section_status})
+    else:
+        profiles, warnings = _fetch_profiles([user1, user2] if user2 else [user1], emit)
+    user1_movies, user1_watched = profiles[user1]
+
+    if user2:
+        user2_movies, user2_watched = profiles[user2]
+        # Generate recommendations comparing both users
+        # (a watched list of None falls back to the rated list)
+        sections = {}
+        for name, value in iter_recommendation_sections(user1_movies, user2_movies, user1_watched, user2_watched):
+            sections[name] = value
+            emit({'type': 'section', 'name': name, 'data': value})
+        recommendations = {name: sections[name] for name in SECTIONS}
+    else:
+        # Single user mode - just return their data
+        recommendations = {
+            'both_enjoyed': [],
+            'user1_recommends': [],
+            'user2_recommends': [],
+            'new_suggestions': [],
+            'user1_movies': user1_movies
+        }
+        for name, value in recommendations.items():
+            emit({'type': 'section', 'name': name, 'data': value})
+
+    if section_status is not None:
+        recommendations['section_status'] = section_status
+    if warnings:
+        recommendations['warnings'] = warnings
+    return recommendations
+
+def analyze(user1, user2=None, emit=None, fast=False):
+    """
+    Analyzes one or two users and returns the full result at the end
+
+    Args:
+        emit: Optional callback that receives each event while the analysis
+            runs (see iter_analysis_events for the event shapes). It may be
+            called from worker threads.
+        fast: Only scrape as much of the rated lists as the top 10s need
+            (see fast_mode.py). The result then has a 'section_status' key
+            saying which sections are 'exact' and which 'provisional'.
+
+    Returns:
+        Dictionary of recommendation sections (see recommender.generate_recommendations)
+    """
+    return _run_analysis(user1, user2, emit or (lambda event: None), fast=fast)
+
+def analyze_group(usernames, emit=None):
+    """
+    Analyzes a group of users together (see group.py)
+    
+    Every member is scraped at the same time, exactly like a two-user
+    analysis, and then compared in one pass over a users x films matrix.
+    
+    Args:
+        usernames: The members (duplicates, ignoring case, are dropped)
+        emit: Optional event callback, like analyze's
+    
+    Returns:
+        Dictionary from group.compare_group, plus 'warnings' if any
+        watched lists couldn't be loaded
+    """
+    emit = emit or (lambda event: None)
+    # Letterboxd usernames are case-insensitive, so keep the first spelling of each
+    members = []
+    for username in usernames:
+        if username.lower() not in (member.lower() for member in members):
+            members.append(username)
+    
+    profiles, warnings = _fetch_profiles(members, emit)
+    rated = [UserProfile.from_movies(profiles[username][0]) for username in members]
+    # A watched list that failed falls back to the member's rated movies
+    watched = [
+        profiles[username][1] if profiles[username][1] is not None else rated_profile
+        for username, rated_profile in zip(members, rated)
+    ]
+    
+    result = compare_group(members, rated, watched)
+    for name, value in result.items():
+        emit({'type': 'section', 'name': name, 'data': value})
+    if warnings:
+        result['warnings'] = warnings
+    return result
+
+def iter_analysis_events(user1, user2=None, fast=False, timings=False):
+    """
+    Analyzes one or two users, yielding events as the work happens
+
+    Args:
+        timings: Send the analysis's metrics breakdown (see metrics.py) as a
+            'timings' event just before 'done'
+
+    Events are dicts with a 'type':
+        {'type': 'progress', 'user': 'alice', 'list': 'rated', 'rating': 4.5,
+         'page': 2, 'pages': 7, 'films': 72}
+        {'type': 'section', 'name': 'both_hated', 'data': [...]}
+        {'type': 'warning', 'message': "Couldn't load ..."}
+        {'type': 'section_status', 'data': {'both_enjoyed': 'exact', ...}}  (fast mode)
+        {'type': 'heartbeat'}
+        {'type': 'error', 'error': 'User ... not found'}
+        {'type': 'timings', 'data': {'total_seconds': 1.8, 'spans': {...}, 'counters': {...}}}
+        {'type': 'done'}
+
+    Cheap sections arrive as soon as both profiles are scraped; both_enjoyed
+    and new_suggestions follow once their network lookups finish.
+    """
+    events = queue.Queue()
+    finished = object()
+
+    def run():
+        try:
+            # The trace is started here because this thread does the work
+            with metrics.trace() as analysis_trace:
+                _run_analysis(user1, user2, events.put, fast=fast)
+            if timings:
+                events.put({'type': 'timings', 'data': analysis_trace.breakdown()})
+            events.put({'type': 'done'})
+        except Exception as e:
+            events.put({'type': 'error', 'error': str(e)})
+        finally:
+            events.put(finished)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    while True:
+        try:
+            event = events.get(timeout=HEARTBEAT_INTERVAL)
+        except queue.Empty:
+            yield {'type': 'heartbeat'}
+            continue
+        if event is finished:
+            return
+        yield event
@@ -0,0 +1,106 @@
+"""
+Local Cache Database
+Shared SQLite file where the backend remembers what it has already scraped
+
+LEARNING NOTE: SQLite is a whole database stored in a single file. Python ships
+with it (the sqlite3 module), so there's nothing extra to install. Several
+modules keep their own tables in the same file.
+"""
+import os
+import pathlib
+import sqlite3
+import threading
+
+project_root = pathlib.Path(__file__).parent.parent
+
+# Set LETTERBOXD_CACHE=0 to turn all on-disk caching off
+CACHE_ENABLED = os.getenv('LETTERBOXD_CACHE', '1') != '0'
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_ready_schemas = set()
+
+def get_db_path():
+    """
+    Returns the path of the cache database file
+
+    LETTERBOXD_CACHE_DB overrides the location. On Vercel only /tmp is
+    writable, so the cache lives there.
+    """
+    path = os.getenv('LETTERBOXD_CACHE_DB')
+    if path:
+        return path
+    if os.getenv('VERCEL') == '1':
+        return '/tmp/letterboxd-cache.sqlite3'
+    return str(project_root / '.cache' / 'letterboxd-cache.sqlite3')
+
+def get_data_path(filename):
+    """
+    Returns a path for a data file that lives next to the cache database
+    (e.g. precomputed matrices), creating the directory if needed
+    """
+    directory = pathlib.Path(get_db_path()).parent
+    directory.mkdir(parents=True, exist_ok=True)
+    return str(directory / filename)
+
+def save_arrays(path, **arrays):
+    """
+    Saves arrays to a compressed .npz file, replacing the old one in one step
+
+    The archive is written to a temporary file next to path and then renamed
+    over it, so a server reloading the file never reads a half-written one.
+    Writing through a file object also stops NumPy from adding ".npz" to a
+    path that doesn't end in it.
+    """
+    # Imported here: only the offline builds need NumPy from this module
+    import numpy as np
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+def get_connection():
+    """
+    Returns this thread's connection to the cache database
+
+    sqlite3 connections can't be shared between threads, so each thread
+    (e.g. each scraper worker) gets its own. WAL mode lets readers and a
+    writer - even in other processes - use the file at the same time.
+    """
+    path = get_db_path()
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        connections[path] = conn
+    return conn
+
+def ensure_schema(name, sql):
+    """
+    Creates a module's tables the first time it touches the database
+
+    Args:
+        name: Unique name for the schema (usually the module name)
+        sql: CREATE TABLE IF NOT EXISTS ... statements
+    """
+    key = (name, get_db_path())
+    if key in _ready_schemas:
+        return
+    with _schema_lock:
+        if key not in _ready_schemas:
+            conn = get_connection()
+            conn.executescript(sql)
+            conn.commit()
+            _ready_schemas.add(key)
@@ -0,0 +1,252 @@
+"""
+Compatibility Module
+Precomputes how compatible every pair of users in a roster is
+
+For a "most compatible friends" board over a few hundred users, running
+/api/analyze for every pair would scrape and compare the same profiles
+hundreds of times. Instead we build one users x films rating matrix from the
+cached profiles and work out every pair's scores from a handful of matrix
+products:
+
+- overlap:     how many films both users rated
+- both_loved:  how many films both users rated 4+ stars
+- cosine:      cosine similarity of their ratings on the films both rated
+- pearson:     Pearson correlation of their ratings on the films both rated
+
+The results are saved to a .npz file next to the cache database, and
+top_matches() / GET /api/compatibility/<username> read from it.
+
+Build it from the command line:
+    python backend/compatibility.py build roster.txt [--fetch]
+    python backend/compatibility.py top someuser
+
+LEARNING NOTE: If R is the users x films rating matrix, then (R @ R.T)[u, v]
+adds up rating_u * rating_v over every film - and since unrated films are 0,
+only films both users rated count. Sums of squares and plain sums over the
+co-rated films come out the same way with a 0/1 "has rated" matrix, and
+those sums are all cosine and Pearson need.
+"""
+import argparse
+import os
+import sys
+import threading
+
+import numpy as np
+
+import cache_db
+import profile_cache
+from group import build_matrices
+from recommender import ENJOYED_MIN
+from user_profile import UserProfile
+
+# Users per block of rows; memory per block is about BLOCK_SIZE x roster size
+COMPATIBILITY_BLOCK_SIZE = int(os.getenv('COMPATIBILITY_BLOCK_SIZE', '256'))
+# Pairs with fewer co-rated films than this get no cosine / Pearson score
+COMPATIBILITY_MIN_OVERLAP = int(os.getenv('COMPATIBILITY_MIN_OVERLAP', '5'))
+
+METRICS = ('pearson', 'cosine', 'overlap', 'both_loved')
+
+def get_matrix_path():
+    """Where the precomputed matrix is stored (COMPATIBILITY_PATH overrides it)"""
+    return os.getenv('COMPATIBILITY_PATH') or cache_db.get_data_path('compatibility.npz')
+
+def load_roster_profiles(usernames, fetch=False):
+    """
+    Loads each user's ratings from their cached watched-list snapshot
+
+    The watched list has every rating (the rated buckets we scrape only
+    cover 0.5-1 and 4-5 stars), so it's what the scores are computed from.
+
+    Args:
+        usernames: The roster
+        fetch: Scrape users who aren't in the cache instead of skipping them
+
+    Returns:
+        (usernames, profiles, missing) - the users we have profiles for, their
+        UserProfiles in the same order, and the users that were skipped
+    """
+    found, profiles, missing = [], [], []
+    for username in usernames:
+        snapshot = profile_cache.get_snapshot(username, 'watched')
+        movies = snapshot['movies'] if snapshot else None
+        if movies is None and fetch:
+            from letterboxd_scraper import get_user_watched_movies
+            try:
+                movies = get_user_watched_movies(username)
+            except Exception as e:
+                print(f"  Couldn't fetch {username}: {e}")
+        if not movies:
+            missing.append(username)
+            continue
+        found.append(username)
+        profiles.append(UserProfile.from_movies(movies))
+    return found, profiles, missing
+
+def compute_compatibility(ratings, block_size=None, min_overlap=None):
+    """
+    Computes every pair's scores from a users x films rating matrix
+
+    The roster is processed in blocks of rows, so memory stays at
+    block_size x roster size no matter how many users there are.
+
+    Args:
+        ratings: scipy sparse matrix of ratings (0 = not rated)
+
+    Returns:
+        Dictionary of roster x roster arrays: 'overlap' and 'both_loved'
+        (int32), 'cosine' and 'pearson' (float32, NaN where the pair has
+        fewer than min_overlap co-rated films or no variation)
+    """
+    block_size = block_size or COMPATIBILITY_BLOCK_SIZE
+    min_overlap = COMPATIBILITY_MIN_OVERLAP if min_overlap is None else min_overlap
+
+    ratings = ratings.astype(np.float64).tocsr()
+    rated = (ratings > 0).astype(np.float64)
+    loved = (ratings >= ENJOYED_MIN).astype(np.float64)
+    squares = ratings.multiply(ratings).tocsr()
+    rated_t, ratings_t, loved_t = rated.T.tocsc(), ratings.T.tocsc(), loved.T.tocsc()
+
+    count = ratings.shape[0]
+    result = {
+        'overlap': np.zeros((count, count), dtype=np.int32),
+        'both_loved': np.zeros((count, count), dtype=np.int32),
+        'cosine': np.full((count, count), np.nan, dtype=np.float32),
+        'pearson': np.full((count, count), np.nan, dtype=np.float32)
+    }
+
+    for start in range(0, count, block_size):
+        rows = slice(start, min(start + block_size, count))
+        # Every entry below is [u, v] for u in this block and every v, summed
+        # over the films both u and v rated
+        n = (rated[rows] @ rated_t).toarray()
+        sum_xy = (ratings[rows] @ ratings_t).toarray()
+        sum_x = (ratings[rows] @ rated_t).toarray()      # u's ratings
+        sum_xx = (squares[rows] @ rated_t).toarray()     # u's ratings squared
+        sum_y = (rated[rows] @ ratings_t).toarray()      # v's ratings
+        sum_yy = (rated[rows] @ squares.T).toarray()     # v's ratings squared
+
+        result['overlap'][rows] = n
+        result['both_loved'][rows] = (loved[rows] @ loved_t).toarray()
+
+        enough = n >= max(min_overlap, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cosine = sum_xy / np.sqrt(sum_xx * sum_yy)
+            pearson = (n * sum_xy - sum_x * sum_y) / np.sqrt((n * sum_xx - sum_x ** 2) * (n * sum_yy - sum_y ** 2))
+        result['cosine'][rows] = np.where(enough, cosine, np.nan)
+        result['pearson'][rows] = np.where(enough & np.isfinite(pearson), np.clip(pearson, -1, 1), np.nan)
+
+    return result
+
+def build(usernames, fetch=False, path=None):
+    """
+    Builds the compatibility matrix for a roster and saves it
+
+    Returns:
+        Dictionary with 'users' (how many made it in), 'missing' and 'path'
+    """
+    usernames = list(dict.fromkeys(username.strip().lower() for username in usernames if username.strip()))
+    found, profiles, missing = load_roster_profiles(usernames, fetch=fetch)
+    if missing:
+        print(f"Skipping {len(missing)} users without a cached profile: {', '.join(missing[:10])}")
+
+    ratings, _, _ = build_matrices(profiles, profiles)
+    result = compute_compatibility(ratings)
+
+    path = path or get_matrix_path()
+    cache_db.save_arrays(path, usernames=np.array(found), min_overlap=COMPATIBILITY_MIN_OVERLAP, **result)
+    print(f"Saved compatibility for {len(found)} users to {path}")
+    return {'users': len(found), 'missing': missing, 'path': path}
+
+_loaded = {'path': None, 'mtime': None, 'data': None}
+_load_lock = threading.Lock()
+
+def load(path=None):
+    """
+    Loads the saved matrix, or returns None if it hasn't been built
+
+    The file is re-read only when it changes on disk, so a rebuild is picked
+    up by a running server without a restart.
+    """
+    path = path or get_matrix_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _load_lock:
+        if _loaded['path'] != path or _loaded['mtime'] != mtime:
+            with np.load(path) as archive:
+                data = {name: archive[name] for name in archive.files}
+            data['index'] = {username: i for i, username in enumerate(data['usernames'].tolist())}
+            _loaded.update(path=path, mtime=mtime, data=data)
+        return _loaded['data']
+
+def top_matches(username, k=10, metric='pearson', path=None):
+    """
+    The k users in the roster most compatible with username
+
+    Args:
+        metric: One of METRICS - what to rank by (highest first)
+
+    Returns:
+        List of {'username', 'pearson', 'cosine', 'overlap', 'both_loved'}
+        dicts, or None if the matrix hasn't been built or doesn't include
+        the user
+
+    Raises:
+        ValueError: If metric isn't one of METRICS
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}' (use one of: {', '.join(METRICS)})")
+    data = load(path)
+    if data is None:
+        return None
+    row = data['index'].get(username.strip().lower())
+    if row is None:
+        return None
+
+    scores = data[metric][row].astype(np.float64)
+    scores[row] = np.nan  # never match someone with themselves
+    candidates = np.flatnonzero(np.isfinite(scores))
+    # Highest score first; ties go to the pair with more films in common
+    order = np.lexsort((-data['overlap'][row][candidates], -scores[candidates]))[:k]
+
+    matches = []
+    for other in candidates[order].tolist():
+        match = {'username': data['usernames'][other].item()}
+        for name in METRICS:
+            value = data[name][row, other].item()
+            if isinstance(value, float):
+                value = None if np.isnan(value) else round(value, 4)
+            match[name] = value
+        matches.append(match)
+    return matches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute user compatibility for a roster')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_command = commands.add_parser('build', help='Build the matrix from a roster file (one username per line)')
+    build_command.add_argument('roster')
+    build_command.add_argument('--fetch', action='store_true', help='Scrape users missing from the cache')
+
+    top_command = commands.add_parser('top', help='Show the most compatible users for someone')
+    top_command.add_argument('username')
+    top_command.add_argument('-k', type=int, default=10)
+    top_command.add_argument('--metric', choices=METRICS, default='pearson')
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        with open(args.roster) as f:
+            build(f.read().split(), fetch=args.fetch)
+    else:
+        matches = top_matches(args.username, k=args.k, metric=args.metric)
+        if matches is None:
+            print(f"No compatibility data for {args.username} - run the build command first")
+            return 1
+        for match in matches:
+            print(f"{match['username']:<24} pearson={match['pearson']} cosine={match['cosine']} "
+                  f"overlap={match['overlap']} both_loved={match['both_loved']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
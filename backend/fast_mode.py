@@ -0,0 +1,211 @@
+"""
+Fast Answer Mode
+Loads only as much of each user's rated list as the top 10s need
+
+A full analysis scrapes every page of every rating bucket before computing
+anything, but every section only shows 10 films:
+- userX_recommends is X's 5.0 films, then 4.5 films, in list order, minus
+  what the other user has watched - once 10 of them are found, the rest of
+  the list can't change the answer
+- both_enjoyed needs every film both rated 4.0 or more - but the watched
+  lists (which the "hasn't watched" check needs in full anyway) carry each
+  film's rating too, so those films are filled in from them instead of
+  from the 4.5 and 4.0 buckets
+- both_hated needs the 1.0 and 0.5 buckets (usually a page or two)
+
+So fast mode loads the 1.0 and 0.5 buckets first (alongside the watched
+lists), then 5.0 and 4.5 pages only until both recommend sections are
+settled - a user with hundreds of 5.0 films stops after the page that
+brings up the tenth one the other user hasn't seen. When a watched list
+failed, both_enjoyed can't be filled in from them, so the 5.0 buckets are
+loaded in full, and the 4.0 bucket (and the rest of 4.5) too unless 10
+films both rated 5.0 settle it. The sections are then computed exactly like
+a full analysis, from whatever was loaded.
+
+Each user may load at most FAST_MAX_PAGES rated pages. If that cuts a bucket
+short before a section was settled, the section is computed from the pages
+we have and reported as 'provisional' instead of 'exact' (see section_status).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import film_ids
+import metrics
+from letterboxd_scraper import RATED_BUCKETS, iter_rating_bucket_pages
+from recommender import ENJOYED_MIN, NEW_SUGGESTIONS_SOURCE, SECTION_LIMIT
+
+# Most rated pages (72 films each) fast mode loads per user
+FAST_MAX_PAGES = int(os.getenv('FAST_MAX_PAGES', '20'))
+
+# Buckets every fast analysis loads in full, before anything else. They're
+# usually a page or two, and going first means the 5.0 and 4.5 buckets can't
+# use up the page budget before both_hated is settled.
+FIRST_BUCKETS = (1.0, 0.5)
+ENJOYED_BUCKETS = (5.0, 4.5, 4.0)
+HATED_BUCKETS = (1.0, 0.5)
+
+class RatedStream:
+    """One user's rated buckets, loaded page by page on demand"""
+
+    def __init__(self, username, progress=None, max_pages=None):
+        self.username = username
+        self.progress = progress
+        self.max_pages = FAST_MAX_PAGES if max_pages is None else max_pages
+        self.buckets = {}        # {rating: {film_key: {...}}}, each in page order
+        self.complete = set()    # ratings whose every page is loaded
+        self.enjoyed = {}        # films rated 4+ taken from the watched list
+        self.pages = 0
+
+    def load(self, rating_value, enough=None):
+        """
+        Loads a bucket's pages in order until it ends, the page budget runs
+        out, or enough() says the caller doesn't need more
+        """
+        bucket = self.buckets.setdefault(rating_value, {})
+        if rating_value in self.complete or bucket:
+            return
+        pages = iter_rating_bucket_pages(
+            self.username, rating_value, max_pages=self.max_pages - self.pages, progress=self.progress
+        )
+        try:
+            for page_movies in pages:
+                if page_movies is None:
+                    # The page budget cut the bucket short
+                    print(f"  Fast mode page budget reached for {self.username} (rating {rating_value})")
+                    return
+                bucket.update(page_movies)
+                self.pages += 1
+                if enough is not None and enough():
+                    return
+            self.complete.add(rating_value)
+        finally:
+            pages.close()
+
+    def has_all(self, ratings):
+        return all(rating in self.complete for rating in ratings)
+
+    def movies(self):
+        """
+        Everything loaded so far, merged in the same bucket order as
+        get_user_movies, then the films filled in from the watched list
+        (last, so they don't change the list order of the bucket films)
+        """
+        movies = {}
+        for rating in RATED_BUCKETS:
+            movies.update(self.buckets.get(rating, {}))
+        for key, movie in self.enjoyed.items():
+            movies.setdefault(key, movie)
+        return movies
+
+def load_first(username, progress=None):
+    """Starts a user's RatedStream with the buckets every fast analysis needs"""
+    stream = RatedStream(username, progress)
+    for rating in FIRST_BUCKETS:
+        stream.load(rating)
+    return stream
+
+def _watched_ids(watched, stream):
+    """Interned ids of a watched list (or, if it failed, of the rated films we have)"""
+    if watched is not None:
+        return set(watched.ids.tolist())
+    return {movie['id'] for movie in stream.movies().values()}
+
+def _recommends_settled(stream, other_watched_ids):
+    """True once the top SECTION_LIMIT of stream's recommendations can't change"""
+    found = 0
+    # The ranking is 5.0 films then 4.5 films, each in list order, so only an
+    # unbroken prefix of that order counts
+    for rating in (5.0, 4.5):
+        found += sum(1 for movie in stream.buckets.get(rating, {}).values() if movie['id'] not in other_watched_ids)
+        if found >= SECTION_LIMIT:
+            return True
+        if rating not in stream.complete:
+            return False
+    return True
+
+def _fill_enjoyed_from_watched(stream1, stream2, watched1, watched2):
+    """Adds every film both rated 4+ on their watched lists to the streams"""
+    _, index1, index2 = watched1.intersect(watched2)
+    enjoyed = (watched1.ratings[index1] >= ENJOYED_MIN) & (watched2.ratings[index2] >= ENJOYED_MIN)
+    for stream, watched, index in ((stream1, watched1, index1[enjoyed]), (stream2, watched2, index2[enjoyed])):
+        for i in index.tolist():
+            film = watched.film(i)
+            stream.enjoyed[film_ids.key_for(film['id'])] = film
+
+def _enjoyed_settled(stream1, stream2):
+    """True once both_enjoyed's top SECTION_LIMIT can't change"""
+    if stream1.has_all(ENJOYED_BUCKETS) and stream2.has_all(ENJOYED_BUCKETS):
+        return True
+    if not (stream1.has_all([5.0]) and stream2.has_all([5.0])):
+        return False
+    # Films both rated 5.0 come first; with enough of them the rest never shows
+    return len(stream1.buckets[5.0].keys() & stream2.buckets[5.0].keys()) >= SECTION_LIMIT
+
+def finish(stream1, stream2, watched1, watched2):
+    """
+    Loads the rest of what the sections need, and no more
+
+    Args:
+        stream1, stream2: RatedStreams from load_first
+        watched1, watched2: Watched lists as UserProfiles (None if one failed)
+
+    Returns:
+        section_status: {section: 'exact' or 'provisional'}
+    """
+    # With both watched lists, every film both enjoyed is known already
+    from_watched = watched1 is not None and watched2 is not None
+
+    def enjoyed_settled():
+        return from_watched or _enjoyed_settled(stream1, stream2)
+
+    def load_recommended(stream, other_watched_ids):
+        def settled():
+            return enjoyed_settled() and _recommends_settled(stream, other_watched_ids)
+
+        # 5.0 before 4.5, the order the recommend sections rank them in
+        for rating in (5.0, 4.5):
+            if settled():
+                return
+            stream.load(rating, enough=settled)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        if from_watched:
+            _fill_enjoyed_from_watched(stream1, stream2, watched1, watched2)
+        else:
+            # both_enjoyed starts from the full 5.0 buckets, and a failed
+            # watched list is stood in for by the rated films we have
+            tasks = [executor.submit(metrics.in_context(stream.load), 5.0) for stream in (stream1, stream2)]
+            for task in tasks:
+                task.result()
+        watched_ids1 = _watched_ids(watched1, stream1)
+        watched_ids2 = _watched_ids(watched2, stream2)
+
+        tasks = []
+        for stream, other_watched_ids in ((stream1, watched_ids2), (stream2, watched_ids1)):
+            if not (enjoyed_settled() and _recommends_settled(stream, other_watched_ids)):
+                tasks.append(executor.submit(metrics.in_context(load_recommended), stream, other_watched_ids))
+        for task in tasks:
+            task.result()
+
+        if not enjoyed_settled():
+            tasks = [executor.submit(metrics.in_context(stream.load), 4.0) for stream in (stream1, stream2)]
+            for task in tasks:
+                task.result()
+
+    def status(exact):
+        return 'exact' if exact else 'provisional'
+
+    enjoyed = enjoyed_settled()
+    return {
+        'both_enjoyed': status(enjoyed),
+        'both_hated': status(stream1.has_all(HATED_BUCKETS) and stream2.has_all(HATED_BUCKETS)),
+        'user1_recommends': status(watched2 is not None and _recommends_settled(stream1, watched_ids2)),
+        'user2_recommends': status(watched1 is not None and _recommends_settled(stream2, watched_ids1)),
+        # The AI only sees the films in both_enjoyed; the local index is
+        # seeded with every film both enjoyed, so it needs the full buckets
+        'new_suggestions': status(
+            enjoyed if NEW_SUGGESTIONS_SOURCE == 'ai' or from_watched
+            else stream1.has_all(ENJOYED_BUCKETS) and stream2.has_all(ENJOYED_BUCKETS)
+        ),
+        'stats': status(watched1 is not None and watched2 is not None)
+    }
@@ -0,0 +1,180 @@
+"""
+Film Catalog Module
+Local table of film facts, keyed by Letterboxd slug
+
+The slug is the stable part of a film's URL: https://letterboxd.com/film/parasite-2019/
+has the slug "parasite-2019". Most films show up in lots of users' lists, so
+once we know something about a film we keep it here instead of downloading
+its page again.
+
+The catalog fills itself in lazily:
+- every poster grid the scraper reads registers the films' titles and years
+- every film page the scraper reads saves the full details (average rating,
+  genres, directors, cast, how many people rated it)
+"""
+import json
+import re
+import sqlite3
+import time
+
+import cache_db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS films (
+    id INTEGER PRIMARY KEY,
+    slug TEXT NOT NULL UNIQUE,
+    title TEXT,
+    year INTEGER,
+    average_rating REAL,
+    rating_count INTEGER,
+    genres TEXT,
+    directors TEXT,
+    cast TEXT,
+    details_fetched_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS films_title ON films (title COLLATE NOCASE);
+"""
+
+# Columns that hold JSON lists
+LIST_FIELDS = ('genres', 'directors', 'cast')
+
+def _connection():
+    cache_db.ensure_schema('film_catalog', SCHEMA)
+    return cache_db.get_connection()
+
+def slug_from_url(url):
+    """
+    Pulls the film slug out of a Letterboxd URL
+    Works for /film/{slug}/ as well as user-scoped links like /{user}/film/{slug}/
+    """
+    if not url:
+        return None
+    match = re.search(r'/film/([^/?#]+)', url)
+    return match.group(1) if match else None
+
+def film_url(slug):
+    """Builds the canonical film page URL for a slug"""
+    return f"https://letterboxd.com/film/{slug}/"
+
+def _row_to_film(row):
+    film = dict(row)
+    for field in LIST_FIELDS:
+        film[field] = json.loads(film[field]) if film[field] else []
+    film['url'] = film_url(film['slug'])
+    return film
+
+def register_films(films):
+    """
+    Records the basic facts we get for free from poster grids
+
+    Args:
+        films: Iterable of dicts with 'slug', 'title' and 'year'
+            (entries without a slug are skipped)
+    """
+    rows = [(film['slug'], film.get('title'), film.get('year'), time.time()) for film in films if film.get('slug')]
+    if not cache_db.CACHE_ENABLED or not rows:
+        return
+    try:
+        conn = _connection()
+        conn.executemany(
+            'INSERT INTO films (slug, title, year, updated_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(slug) DO UPDATE SET '
+            'title = COALESCE(films.title, excluded.title), '
+            'year = COALESCE(films.year, excluded.year)',
+            rows
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Film catalog write failed: {e}")
+
+def save_details(slug, details):
+    """
+    Stores everything we parsed from a film's page
+
+    Args:
+        slug: Film slug
+        details: Dict from letterboxd_scraper.get_movie_details
+    """
+    if not cache_db.CACHE_ENABLED or not slug:
+        return
+    now = time.time()
+    try:
+        conn = _connection()
+        conn.execute(
+            'INSERT INTO films (slug, title, year, average_rating, rating_count, genres, directors, cast, details_fetched_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(slug) DO UPDATE SET '
+            'title = COALESCE(excluded.title, films.title), '
+            'year = COALESCE(excluded.year, films.year), '
+            'average_rating = excluded.average_rating, '
+            'rating_count = excluded.rating_count, '
+            'genres = excluded.genres, '
+            'directors = excluded.directors, '
+            'cast = excluded.cast, '
+            'details_fetched_at = excluded.details_fetched_at, '
+            'updated_at = excluded.updated_at',
+            (
+                slug, details.get('title'), details.get('year'),
+                details.get('average_rating'), details.get('rating_count'),
+                json.dumps(details.get('genres', [])),
+                json.dumps(details.get('directors', [])),
+                json.dumps(details.get('cast', [])),
+                now, now
+            )
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Film catalog write failed for {slug}: {e}")
+
+def get_films(slugs):
+    """
+    Looks up many films at once
+
+    Returns:
+        Dictionary of {slug: film dict} for the slugs we know about. Each film
+        dict has the table's columns plus 'url'; 'details_fetched_at' is None
+        if we've only seen the film on a poster grid.
+    """
+    slugs = list(dict.fromkeys(slug for slug in slugs if slug))
+    if not cache_db.CACHE_ENABLED or not slugs:
+        return {}
+
+    films = {}
+    try:
+        conn = _connection()
+        # SQLite limits how many ? placeholders one query can have
+        for start in range(0, len(slugs), 500):
+            chunk = slugs[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f'SELECT * FROM films WHERE slug IN ({placeholders})', chunk):
+                films[row['slug']] = _row_to_film(row)
+    except sqlite3.Error as e:
+        print(f"  Film catalog read failed: {e}")
+    return films
+
+def get_film(slug):
+    """Looks up a single film, or returns None"""
+    return get_films([slug]).get(slug)
+
+def find_slug(title, year=None):
+    """
+    Finds the slug of a film we've seen before by its title (and year, if given)
+    Returns None if the catalog doesn't know the film.
+    """
+    if not cache_db.CACHE_ENABLED or not title:
+        return None
+    try:
+        conn = _connection()
+        if year:
+            row = conn.execute(
+                'SELECT slug FROM films WHERE title = ? COLLATE NOCASE AND year = ? LIMIT 1', (title, year)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                'SELECT slug FROM films WHERE title = ? COLLATE NOCASE ORDER BY rating_count DESC LIMIT 1', (title,)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"  Film catalog read failed: {e}")
+        return None
+    return row['slug'] if row else None
@@ -0,0 +1,78 @@
+"""
+Film Ids Module
+Gives every film a small integer id for the lifetime of the process
+
+Films are identified by their Letterboxd slug (see film_catalog.slug_from_url),
+which is stable - unlike the display title, which remakes and same-named
+films share. Slugs are strings though, and comparing thousands of strings is
+slow and memory-hungry, so each slug is "interned": the first time we see it,
+it gets the next free integer (0, 1, 2, ...) and keeps it from then on.
+
+Because the ids are dense (no gaps), they can be used directly as positions
+in arrays and matrices.
+
+The module also remembers each film's display facts (slug, title, year and
+Letterboxd's own numeric id) once per process, so user profiles only need to
+store ids and ratings instead of a copy of every title.
+
+Known limit: the table only grows. A film keeps its id (and its display
+facts) until the process exits, because profiles, caches and loaded indexes
+hold ids as array positions and can't be told when one is dropped. Each
+film costs roughly 400 bytes, so a server that has seen 100,000 distinct
+films holds about 40 MB here; all of Letterboxd (about a million films)
+would be about 400 MB. Long-running servers with a large, changing user
+base should be restarted now and then (count() says how big the table is).
+
+LEARNING NOTE: The ids only mean something inside this process. Anything
+saved to disk should store slugs and intern them again when it's loaded.
+"""
+import threading
+
+_ids = {}
+_keys = []
+_films = []  # parallel to _keys: (slug, title, year, letterboxd_id)
+_lock = threading.Lock()
+
+def intern(key, title=None, year=None, letterboxd_id=None, slug=None):
+    """
+    Returns the integer id for a film key (slug), assigning a new one if needed
+
+    Args:
+        key: Film key - the slug, or the title for films without one
+        title, year, letterboxd_id, slug: Display facts to remember for the
+            film (only stored when a title is given; slug is None for films
+            keyed by title)
+    """
+    film_id = _ids.get(key)
+    if film_id is None:
+        with _lock:
+            # Another thread may have assigned it while we waited for the lock
+            film_id = _ids.get(key)
+            if film_id is None:
+                film_id = len(_keys)
+                _keys.append(key)
+                _films.append((None, key, None, None))
+                _ids[key] = film_id
+    if title is not None and _films[film_id] != (slug, title, year, letterboxd_id):
+        _films[film_id] = (slug, title, year, letterboxd_id)
+    return film_id
+
+def intern_many(keys):
+    """Returns a list of ids, one per key, in the same order"""
+    return [intern(key) for key in keys]
+
+def lookup(key):
+    """Returns the id of a film key, or None if it was never interned (doesn't assign one)"""
+    return _ids.get(key)
+
+def key_for(film_id):
+    """Returns the film key (slug) an id was assigned to"""
+    return _keys[film_id]
+
+def describe(film_id):
+    """Returns (slug, title, year, letterboxd_id) for an id - the title is the key if we never saw one"""
+    return _films[film_id]
+
+def count():
+    """How many ids have been handed out so far (ids are 0 .. count() - 1)"""
+    return len(_keys)
@@ -0,0 +1,129 @@
+"""
+Film Metadata Module
+Looks up film-level facts (average rating, genres, directors, ...) in batches
+
+Looking a film up means downloading its whole film page, so this module:
+- collects every film we need and fetches the missing ones concurrently
+- remembers answers in memory (a small LRU cache with a time limit)
+- reads and fills the local film catalog on disk (see film_catalog.py), so
+  answers survive restarts and are shared by every worker
+
+LEARNING NOTE: An LRU ("least recently used") cache has a fixed size. When
+it's full, the entry nobody has asked for in the longest time is dropped.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+import film_catalog
+import http_client
+import metrics
+from letterboxd_scraper import get_movie_details
+
+# Film details drift slowly, so they can be trusted for a while
+FILM_METADATA_TTL = int(os.getenv('FILM_METADATA_TTL', str(7 * 24 * 3600)))
+MEMORY_CACHE_SIZE = int(os.getenv('FILM_METADATA_CACHE_SIZE', '5000'))
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None if it's missing or expired"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if time.time() - stored_at >= self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value, stored_at=None):
+        with self._lock:
+            self._items[key] = (value, stored_at or time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+_films = TTLCache(MEMORY_CACHE_SIZE, FILM_METADATA_TTL)
+
+def _fetch_film(url):
+    """Downloads one film page; get_movie_details also saves it to the catalog"""
+    details = get_movie_details(url)
+    if not details:
+        return None
+    return dict(details, slug=film_catalog.slug_from_url(url), url=url, details_fetched_at=time.time())
+
+def get_films(urls):
+    """
+    Looks up film details for many films at once
+
+    Args:
+        urls: Film page URLs (None entries are ignored)
+
+    Returns:
+        Dictionary of {url: film dict} with 'average_rating', 'rating_count',
+        'genres', 'directors', 'cast', 'title' and 'year'. Films whose page
+        couldn't be read are left out.
+    """
+    wanted = list(dict.fromkeys(url for url in urls if url))
+    films = {}
+
+    # 1. Memory
+    missing = []
+    for url in wanted:
+        film = _films.get(url)
+        if film is None:
+            missing.append(url)
+        else:
+            films[url] = film
+
+    # 2. Film catalog - only films whose page we've read recently
+    slugs = {url: film_catalog.slug_from_url(url) for url in missing}
+    stored = film_catalog.get_films(slugs.values())
+    cutoff = time.time() - FILM_METADATA_TTL
+    for url, slug in slugs.items():
+        film = stored.get(slug)
+        if film and film['details_fetched_at'] and film['details_fetched_at'] > cutoff:
+            films[url] = film
+            _films.put(url, film, stored_at=film['details_fetched_at'])
+    memory_hits = len(wanted) - len(missing)
+    missing = [url for url in missing if url not in films]
+    metrics.count('letterboxd_cache_requests_total', memory_hits, cache='film_metadata', result='memory')
+    metrics.count('letterboxd_cache_requests_total', len(films) - memory_hits, cache='film_metadata', result='catalog')
+    metrics.count('letterboxd_cache_requests_total', len(missing), cache='film_metadata', result='miss')
+
+    # 3. Network - everything that's left, all at once (within the politeness budget)
+    if missing:
+        with ThreadPoolExecutor(max_workers=http_client.MAX_CONCURRENT_REQUESTS) as executor:
+            fetched = dict(zip(missing, executor.map(metrics.in_context(_fetch_film), missing)))
+        for url, film in fetched.items():
+            if film is not None:
+                films[url] = film
+                _films.put(url, film)
+
+    return films
+
+def get_average_ratings(urls):
+    """
+    Looks up Letterboxd average ratings for many films at once
+
+    Returns:
+        Dictionary of {url: average_rating}. Films whose average couldn't be
+        found are left out, so callers can apply their own default.
+    """
+    return {
+        url: film['average_rating']
+        for url, film in get_films(urls).items()
+        if film.get('average_rating') is not None
+    }
@@ -0,0 +1,193 @@
+"""
+Group Analysis Module
+Compares a whole group of users at once (e.g. for a watch party)
+
+The two-user recommender compares one pair of lists. For a group we'd need
+every pair - 45 comparisons for 10 people. Instead, every member's ratings
+go into one table with a row per member and a column per film:
+
+             film A  film B  film C  ...
+    alice      10      0       8
+    bob         9      2       0
+    carol       0      2      10
+
+(ratings in half stars, 0 = not rated). Questions about the group become
+column sums: "how many members loved film A" is the number of cells >= 8 in
+column A. Each sum touches every rating once, so the work grows with the
+number of members, not with the number of pairs.
+
+LEARNING NOTE: Almost every cell in this table is empty (nobody has seen
+most films), so it's stored as a scipy sparse matrix, which only keeps the
+non-empty cells.
+"""
+import os
+
+import numpy as np
+from scipy import sparse
+
+import film_catalog
+import film_ids
+from recommender import top_k, ENJOYED_MIN, RECOMMEND_MIN, HATED_MAX, SECTION_LIMIT
+from user_profile import from_half_stars
+
+# How many users one group analysis may include
+GROUP_MAX_USERS = int(os.getenv('GROUP_MAX_USERS', '10'))
+
+def build_matrices(rated_profiles, watched_profiles):
+    """
+    Stacks the members' profiles into users x films sparse matrices
+
+    Args:
+        rated_profiles: One UserProfile of rated films per member
+        watched_profiles: One UserProfile of watched films per member
+
+    Returns:
+        (ratings, seen, films):
+        - ratings: CSR matrix of half-star ratings (only rated films are stored)
+        - seen: CSR matrix with a 1 for every film a member has watched or rated
+        - films: interned film id of each column, sorted
+    """
+    profiles = list(rated_profiles) + list(watched_profiles)
+    films = np.unique(np.concatenate([profile.ids for profile in profiles])) if profiles else np.array([], dtype=np.int32)
+    shape = (len(rated_profiles), len(films))
+
+    def stack(profile_list, values):
+        rows, columns, data = [], [], []
+        for member, profile in enumerate(profile_list):
+            profile_values = values(profile)
+            keep = profile_values > 0
+            rows.append(np.full(np.count_nonzero(keep), member, dtype=np.int32))
+            columns.append(np.searchsorted(films, profile.ids[keep]))
+            data.append(profile_values[keep])
+        if not rows:
+            return sparse.csr_matrix(shape, dtype=np.uint8)
+        return sparse.coo_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(columns))), shape=shape
+        ).tocsr()
+
+    ratings = stack(rated_profiles, lambda profile: profile.ratings)
+    # A rated film counts as watched even if it's missing from the watched list
+    seen = stack(watched_profiles, lambda profile: np.ones(len(profile), dtype=np.uint8))
+    seen = ((seen + (ratings > 0)) > 0).astype(np.uint8)
+    return ratings, seen, films
+
+def _where(ratings, condition):
+    """Boolean sparse matrix with True where condition(rating) holds for a stored rating"""
+    matrix = ratings.copy()
+    matrix.data = condition(matrix.data).astype(np.uint8)
+    matrix.eliminate_zeros()
+    return matrix
+
+def _column_sums(matrix):
+    return np.asarray(matrix.sum(axis=0)).ravel().astype(np.int64)
+
+def _film_row(film_id):
+    """Display fields for a film column"""
+    slug, title, year, _ = film_ids.describe(int(film_id))
+    return {'title': title, 'year': year, 'url': film_catalog.film_url(slug) if slug else None}
+
+def _members_with(matrix_csc, column, usernames):
+    """{username: value} for the stored cells of one film column"""
+    start, end = matrix_csc.indptr[column], matrix_csc.indptr[column + 1]
+    return {usernames[row]: value for row, value in zip(matrix_csc.indices[start:end].tolist(), matrix_csc.data[start:end].tolist())}
+
+def _shared_films(ratings, ratings_csc, films, usernames, condition, label, best_first):
+    """
+    Films that at least two members rated in a matching way (top 10)
+
+    Sorted by how many members it applies to, then by their combined rating
+    (highest first for favourites, lowest first for dislikes), then film id.
+    """
+    matches = _where(ratings, condition)
+    matches_csc = matches.tocsc()
+    counts = _column_sums(matches)
+    totals = _column_sums(matches.multiply(ratings))
+    columns = np.flatnonzero(counts >= 2)
+
+    # Composite key: more members first, then combined rating, then column
+    rating_key = -totals[columns] if best_first else totals[columns]
+    sort_keys = (-counts[columns] * 1000 + rating_key) * len(films) + columns
+    rows = []
+    for column in columns[top_k(sort_keys, SECTION_LIMIT)].tolist():
+        member_ratings = _members_with(ratings_csc, column, usernames)
+        rows.append(dict(
+            _film_row(films[column]),
+            **{label: list(_members_with(matches_csc, column, usernames))},
+            ratings={user: from_half_stars(rating) for user, rating in member_ratings.items()}
+        ))
+    return rows
+
+def _member_recommendations(ratings, seen_csc, seen_counts, films, usernames):
+    """
+    For each member, films they rated 4.5+ that other members haven't seen
+
+    Films most of the group hasn't seen come first, then higher ratings.
+    """
+    recommendations = {}
+    for member, username in enumerate(usernames):
+        start, end = ratings.indptr[member], ratings.indptr[member + 1]
+        columns = ratings.indices[start:end]
+        member_ratings = ratings.data[start:end].astype(np.int64)
+        keep = member_ratings >= RECOMMEND_MIN
+        columns, member_ratings = columns[keep], member_ratings[keep]
+        # The member has seen all of these, so everyone else who hasn't is group size - seen count
+        unseen = len(usernames) - seen_counts[columns]
+        keep = unseen > 0
+        columns, member_ratings, unseen = columns[keep], member_ratings[keep], unseen[keep]
+
+        sort_keys = (-unseen * 100 - member_ratings) * len(films) + columns
+        top = top_k(sort_keys, SECTION_LIMIT)
+        rows = []
+        for column, rating in zip(columns[top].tolist(), member_ratings[top].tolist()):
+            seen_by = _members_with(seen_csc, column, usernames)
+            rows.append(dict(
+                _film_row(films[column]),
+                rating=from_half_stars(rating),
+                unseen_by=[user for user in usernames if user not in seen_by]
+            ))
+        recommendations[username] = rows
+    return recommendations
+
+def compare_group(usernames, rated_profiles, watched_profiles):
+    """
+    Computes the group sections for any number of members
+
+    Args:
+        usernames: Member usernames, in display order
+        rated_profiles: Each member's rated films (UserProfile), same order
+        watched_profiles: Each member's watched films (UserProfile), same order
+
+    Returns:
+        Dictionary with:
+        - 'members': the usernames
+        - 'shared_favourites': films 2+ members rated 4+ stars, with 'loved_by'
+          and every member's 'ratings'
+        - 'shared_dislikes': films 2+ members rated 1 star or less, with 'hated_by'
+        - 'recommendations': {username: films they rated 4.5+ that others
+          haven't seen, with 'unseen_by'}
+        - 'stats': film counts per member and for the whole group
+    """
+    ratings, seen, films = build_matrices(rated_profiles, watched_profiles)
+    ratings_csc = ratings.tocsc()
+    seen_counts = _column_sums(seen)
+
+    return {
+        'members': list(usernames),
+        'shared_favourites': _shared_films(
+            ratings, ratings_csc, films, usernames,
+            lambda data: data >= ENJOYED_MIN, 'loved_by', best_first=True
+        ),
+        'shared_dislikes': _shared_films(
+            ratings, ratings_csc, films, usernames,
+            lambda data: (data > 0) & (data <= HATED_MAX), 'hated_by', best_first=False
+        ),
+        'recommendations': _member_recommendations(ratings, seen.tocsc(), seen_counts, films, usernames),
+        'stats': {
+            'members': {
+                username: {'watched': len(watched), 'rated': rated.rated_count()}
+                for username, rated, watched in zip(usernames, rated_profiles, watched_profiles)
+            },
+            'films_total': len(films),
+            'films_seen_by_all': int(np.count_nonzero(seen_counts == len(usernames)))
+        }
+    }
@@ -0,0 +1,172 @@
+"""
+HTTP Client Module
+One shared connection pool for every request the backend makes to Letterboxd
+
+LEARNING NOTE: Opening an HTTPS connection costs a TCP handshake plus a TLS
+handshake - often more than downloading the page itself. A requests.Session
+keeps connections open (keep-alive) and reuses them, so only the first request
+to a host pays that cost.
+
+Requests also get retried when Letterboxd is briefly unhappy (429 Too Many
+Requests, 5xx errors, timeouts), waiting a little longer each time. A 429
+also slows down every other worker's requests to that host.
+"""
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from rate_limiter import AdaptiveLimiter
+
+# Politeness settings shared by every worker that talks to Letterboxd
+# MAX_CONCURRENT_REQUESTS: how many requests this process may have in flight to one host at once
+# REQUEST_INTERVAL: smallest average gap (seconds) between requests to one host - the
+# adaptive limiter's top speed (0 = no rate limit). It slows down on its own when
+# Letterboxd answers 429, and that budget is shared by every thread and process
+# using the same cache database (see rate_limiter.py).
+# The default 0.5s (2 requests/second) is the pace the original serial scraper
+# kept; concurrency overlaps round trips but doesn't go faster than that.
+# Operators who know Letterboxd tolerates more can lower it.
+MAX_CONCURRENT_REQUESTS = int(os.getenv('LETTERBOXD_MAX_CONCURRENCY', '5'))
+REQUEST_INTERVAL = float(os.getenv('LETTERBOXD_REQUEST_INTERVAL', '0.5'))
+
+# Retry settings: how many extra attempts a request gets, and the backoff curve
+MAX_RETRIES = int(os.getenv('LETTERBOXD_MAX_RETRIES', '3'))
+BACKOFF_BASE = float(os.getenv('LETTERBOXD_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = 30.0
+
+# Send requests for letterboxd.com to another server instead, e.g. the
+# benchmark stub (benchmarks/stub_letterboxd.py). Only the request is
+# redirected - film URLs everywhere else stay the real letterboxd.com ones.
+LETTERBOXD_BASE_URL = os.getenv('LETTERBOXD_BASE_URL', '').rstrip('/')
+CANONICAL_BASE_URL = 'https://letterboxd.com'
+
+# Responses worth retrying - everything else (200, 304, 404, ...) is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+class FetchError(Exception):
+    """A request still failed after all of its retries"""
+
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+def get_host_limiter(host):
+    """Returns the shared AdaptiveLimiter for a host, creating it on first use"""
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            max_rate = 1 / REQUEST_INTERVAL if REQUEST_INTERVAL > 0 else 0
+            limiter = AdaptiveLimiter(host, MAX_CONCURRENT_REQUESTS, max_rate)
+            _host_limiters[host] = limiter
+        return limiter
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the process-wide requests.Session
+
+    The connection pool is sized to the concurrency limit so every worker
+    that's allowed to make a request has a kept-alive connection ready.
+    (requests speaks HTTP/1.1 only; keep-alive gives us most of the benefit
+    HTTP/2 would for this many connections.)
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, MAX_CONCURRENT_REQUESTS))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+def _retry_after_seconds(response):
+    """
+    Reads a Retry-After header, which is either a number of seconds or an HTTP date
+    Returns None if the header is missing or unreadable.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff_delay(attempt):
+    """Exponential backoff with full jitter: a random wait in [0, base * 2^attempt]"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def request_url(url):
+    """The URL to actually request for url (see LETTERBOXD_BASE_URL)"""
+    if LETTERBOXD_BASE_URL and url.startswith(CANONICAL_BASE_URL + '/'):
+        return LETTERBOXD_BASE_URL + url[len(CANONICAL_BASE_URL):]
+    return url
+
+def get(url, timeout=10, headers=None):
+    """
+    GETs a URL through the shared session, inside the host's politeness budget
+
+    Retries 429/5xx responses, timeouts and connection errors with jittered
+    exponential backoff, honoring Retry-After when the server sends it. A 429
+    also lowers the host's shared request rate.
+
+    Args:
+        url: URL to fetch
+        timeout: Seconds to wait for the server on each attempt
+        headers: Extra headers to send on top of the shared browser headers
+
+    Returns:
+        The requests.Response (any non-retryable status, e.g. 200, 304 or 404)
+
+    Raises:
+        FetchError: If every attempt failed
+    """
+    session = get_session()
+    target = request_url(url)
+    limiter = get_host_limiter(urlparse(target).netloc)
+    last_error = None
+
+    for attempt in range(MAX_RETRIES + 1):
+        wait = None
+        try:
+            with limiter, metrics.span('http.fetch'):
+                response = session.get(target, headers=headers, timeout=timeout)
+            metrics.count('letterboxd_http_requests_total', status=response.status_code)
+            metrics.count('letterboxd_http_bytes_total', len(response.content))
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            last_error = f"HTTP {response.status_code}"
+            wait = _retry_after_seconds(response)
+            if response.status_code == 429:
+                rate = limiter.slow_down(wait)
+                print(f"  Letterboxd is rate limiting us; slowing down to {rate:.2f} requests/s")
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            metrics.count('letterboxd_http_requests_total', status='error')
+            last_error = e
+
+        if attempt < MAX_RETRIES:
+            metrics.count('letterboxd_http_retries_total')
+            # Back off outside the limiter so other workers keep their slots
+            wait = min(BACKOFF_MAX, wait) if wait is not None else _backoff_delay(attempt)
+            print(f"  Retrying {url} in {wait:.1f}s ({last_error})")
+            time.sleep(wait)
+
+    raise FetchError(f"Giving up on {url} after {MAX_RETRIES + 1} attempts: {last_error}")
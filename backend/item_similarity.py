@@ -0,0 +1,263 @@
+"""
+Item Similarity Module
+Suggests films neither user has seen, using only the ratings we've cached
+
+This is classic item-item collaborative filtering: two films are similar if
+the people who rated one tend to rate the other the same way. From every
+cached profile we build a users x films rating matrix, compare each film's
+column of ratings with every other film's, and keep each film's top
+neighbours. Suggesting films for a pair is then just "add up the neighbours
+of the films they both loved" - a few array lookups, no network and no AI.
+
+Each user's ratings are centered on their own average before comparing, so
+"4 stars from a harsh critic" and "4 stars from someone who rates
+everything 4" don't look the same (this is called adjusted cosine). Scores
+from films that only a few people rated together are shrunk towards 0.
+
+The index is built offline and saved next to the cache database:
+    python backend/item_similarity.py build
+
+How new_suggestions is produced is chosen with NEW_SUGGESTIONS_SOURCE:
+    ai     - the AI recommender only (default)
+    local  - this index only
+    hybrid - this index picks candidates, the AI chooses among them and
+             explains; falls back to the local picks if the AI fails
+
+LEARNING NOTE: Only each film's top ITEM_NEIGHBOURS neighbours are kept, so
+the index grows linearly with the number of films instead of films².
+"""
+import argparse
+import os
+import sys
+import threading
+
+import numpy as np
+
+import cache_db
+import film_catalog
+import film_ids
+import profile_cache
+from compatibility import load_roster_profiles
+from group import build_matrices
+
+# Neighbours kept per film, and films per block while building
+ITEM_NEIGHBOURS = int(os.getenv('ITEM_NEIGHBOURS', '50'))
+ITEM_BLOCK_SIZE = int(os.getenv('ITEM_BLOCK_SIZE', '128'))
+# Films need at least this many raters (and film pairs this many co-raters)
+ITEM_MIN_SUPPORT = int(os.getenv('ITEM_MIN_SUPPORT', '3'))
+# Shrinkage: similarity * co_raters / (co_raters + ITEM_SHRINKAGE)
+ITEM_SHRINKAGE = float(os.getenv('ITEM_SHRINKAGE', '10'))
+
+def get_index_path():
+    """Where the index is stored (ITEM_INDEX_PATH overrides it)"""
+    return os.getenv('ITEM_INDEX_PATH') or cache_db.get_data_path('item-similarity.npz')
+
+def compute_neighbours(ratings, neighbours=None, block_size=None, min_support=None, shrinkage=None):
+    """
+    Finds each film's most similar films
+
+    Args:
+        ratings: users x films scipy sparse matrix of ratings (0 = not rated)
+
+    Returns:
+        (neighbour_columns, scores) - films x neighbours arrays, best first.
+        Missing neighbours have column -1 and score 0.
+    """
+    neighbours = neighbours or ITEM_NEIGHBOURS
+    block_size = block_size or ITEM_BLOCK_SIZE
+    min_support = ITEM_MIN_SUPPORT if min_support is None else min_support
+    shrinkage = ITEM_SHRINKAGE if shrinkage is None else shrinkage
+
+    ratings = ratings.astype(np.float64).tocsr()
+    rated = (ratings > 0).astype(np.float64)
+
+    # Center each user's ratings on their own average (adjusted cosine).
+    # Explicit zeros are fine here: "rated" still knows which cells are ratings.
+    counts = np.diff(ratings.indptr)
+    means = np.asarray(ratings.sum(axis=1)).ravel() / np.maximum(counts, 1)
+    centered = ratings.copy()
+    centered.data = centered.data - np.repeat(means, counts)
+    squares = centered.multiply(centered).tocsr()
+
+    # Films are rows from here on
+    centered_t, rated_t, squares_t = centered.T.tocsr(), rated.T.tocsr(), squares.T.tocsr()
+    film_count = ratings.shape[1]
+    neighbour_columns = np.full((film_count, neighbours), -1, dtype=np.int32)
+    scores = np.zeros((film_count, neighbours), dtype=np.float32)
+
+    for start in range(0, film_count, block_size):
+        rows = slice(start, min(start + block_size, film_count))
+        # [i, j] for film i in this block and every film j, over users who rated both
+        n = (rated_t[rows] @ rated).toarray()
+        sum_xy = (centered_t[rows] @ centered).toarray()
+        sum_xx = (squares_t[rows] @ rated).toarray()
+        sum_yy = (rated_t[rows] @ squares).toarray()
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = sum_xy / np.sqrt(sum_xx * sum_yy) * (n / (n + shrinkage))
+        similarity[~np.isfinite(similarity) | (n < min_support)] = 0
+        similarity[np.arange(similarity.shape[0]), np.arange(start, rows.stop)] = 0  # not its own neighbour
+
+        # Top neighbours per film without sorting whole rows
+        k = min(neighbours, film_count)
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top[top_scores <= 0] = -1
+        neighbour_columns[rows, :k] = top
+        scores[rows, :k] = np.maximum(top_scores, 0)
+
+    return neighbour_columns, scores
+
+def build(usernames=None, path=None):
+    """
+    Builds the index from cached watched-list snapshots and saves it
+
+    Args:
+        usernames: Whose profiles to use (defaults to every cached user)
+
+    Returns:
+        Dictionary with 'users', 'films' and 'path'
+    """
+    usernames = usernames or profile_cache.list_snapshot_users('watched')
+    found, profiles, _ = load_roster_profiles(usernames)
+    ratings, _, films = build_matrices(profiles, profiles)
+
+    # Films too few people rated can't have trustworthy neighbours
+    raters = np.diff(ratings.tocsc().indptr)
+    keep = np.flatnonzero(raters >= ITEM_MIN_SUPPORT)
+    ratings, films = ratings.tocsc()[:, keep], films[keep]
+
+    neighbour_columns, scores = compute_neighbours(ratings)
+
+    # Interned ids don't survive the process, so store each film's slug and title
+    slugs, titles, years, letterboxd_ids = [], [], [], []
+    for film_id in films.tolist():
+        slug, title, year, letterboxd_id = film_ids.describe(film_id)
+        slugs.append(slug or '')
+        titles.append(title)
+        years.append(year or 0)
+        letterboxd_ids.append(letterboxd_id or 0)
+
+    path = path or get_index_path()
+    cache_db.save_arrays(
+        path,
+        slugs=np.array(slugs, dtype=str), titles=np.array(titles, dtype=str), years=np.array(years, dtype=np.int32),
+        letterboxd_ids=np.array(letterboxd_ids, dtype=np.int64), neighbours=neighbour_columns, scores=scores
+    )
+    print(f"Saved neighbours for {len(films)} films from {len(found)} users to {path}")
+    return {'users': len(found), 'films': len(films), 'path': path}
+
+class ItemIndex:
+    """A loaded neighbour index, with its films mapped to this process's film ids"""
+
+    def __init__(self, archive):
+        self.neighbours = archive['neighbours']
+        self.scores = archive['scores']
+        films = zip(archive['slugs'].tolist(), archive['titles'].tolist(), archive['years'].tolist(), archive['letterboxd_ids'].tolist())
+        self.film_ids = np.array([
+            film_ids.intern(slug or title, title, year or None, letterboxd_id or None, slug or None)
+            for slug, title, year, letterboxd_id in films
+        ], dtype=np.int32)
+        # For looking rows up by film id
+        self._sorted = np.argsort(self.film_ids)
+        self._sorted_ids = self.film_ids[self._sorted]
+
+    def rows_for(self, ids):
+        """Index row of each film id (-1 for films the index doesn't have)"""
+        ids = np.asarray(ids, dtype=np.int32)
+        if len(self._sorted_ids) == 0:
+            return np.full(len(ids), -1)
+        position = np.minimum(np.searchsorted(self._sorted_ids, ids), len(self._sorted_ids) - 1)
+        return np.where(self._sorted_ids[position] == ids, self._sorted[position], -1)
+
+_loaded = {'path': None, 'mtime': None, 'index': None}
+_load_lock = threading.Lock()
+
+def load(path=None):
+    """Loads the index (re-reading it when the file changes), or returns None if it hasn't been built"""
+    path = path or get_index_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _load_lock:
+        if _loaded['path'] != path or _loaded['mtime'] != mtime:
+            with np.load(path) as archive:
+                index = ItemIndex(archive)
+            _loaded.update(path=path, mtime=mtime, index=index)
+        return _loaded['index']
+
+def suggest(seed_ids, seed_weights, exclude=(), k=10):
+    """
+    Films similar to the seed films that nobody in exclude has watched
+
+    Args:
+        seed_ids: Film ids the users loved
+        seed_weights: How much each seed counts (e.g. higher for 5 stars)
+        exclude: UserProfiles whose films must not be suggested
+        k: How many films to return
+
+    Returns:
+        List of {'title', 'year', 'url', 'reason', 'score'} dicts, best
+        first (empty if the index hasn't been built)
+    """
+    index = load()
+    if index is None or len(seed_ids) == 0:
+        return []
+
+    rows = index.rows_for(seed_ids)
+    known = rows >= 0
+    rows, weights = rows[known], np.asarray(seed_weights, dtype=np.float64)[known]
+    if len(rows) == 0:
+        return []
+
+    # Every seed votes for its neighbours, weighted by similarity and seed weight
+    neighbours = index.neighbours[rows]
+    contributions = index.scores[rows] * weights[:, None]
+    valid = neighbours >= 0
+    scores = np.bincount(neighbours[valid], weights=contributions[valid], minlength=len(index.film_ids))
+
+    # Drop the seeds themselves and anything either user has seen
+    scores[rows] = 0
+    for profile in exclude:
+        scores[profile.contains_ids(index.film_ids)] = 0
+
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    suggestions = []
+    for row in candidates.tolist():
+        # Name the seeds that pushed this film up the most
+        votes = np.where(neighbours == row, contributions, 0).sum(axis=1)
+        because = [film_ids.describe(int(index.film_ids[rows[i]]))[1] for i in np.argsort(-votes)[:2] if votes[i] > 0]
+        slug, title, year, _ = film_ids.describe(int(index.film_ids[row]))
+        suggestions.append({
+            'title': title,
+            'year': year,
+            'reason': f"People who loved {' and '.join(because)} rated this highly too",
+            'url': film_catalog.film_url(slug) if slug else None,
+            'score': round(float(scores[row]), 4)
+        })
+    return suggestions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the item-item similarity index for new suggestions')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_command = commands.add_parser('build', help='Build the index from every cached profile')
+    build_command.add_argument('--roster', help='Only use the users in this file (one username per line)')
+    args = parser.parse_args(argv)
+
+    usernames = None
+    if args.roster:
+        with open(args.roster) as f:
+            usernames = f.read().split()
+    build(usernames)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Analysis Jobs Module
+Runs analyses in the background so a request doesn't have to wait for them
+
+POST /api/analyze with "async": true starts a job and answers right away with
+a job id. The browser then polls GET /api/jobs/<id> for progress, partial
+sections and finally the full result.
+
+Two requests for the same pair of users share one job: if an identical job
+is already running (or finished recently) we hand back that job instead of
+scraping everything a second time.
+
+Jobs live in this process's memory, so this mode is meant for a long-running
+server (e.g. backend/app.py), not for short-lived serverless functions.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import uuid
+
+from analysis import analyze
+import metrics
+
+# How many analyses may run at once, and how long (seconds) finished jobs are kept
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '900'))
+
+def job_key(user1, user2=None, fast=False):
+    """Normalizes a pair of usernames so identical requests map to the same job"""
+    return ((user1 or '').strip().lower(), (user2 or '').strip().lower(), bool(fast))
+
+class Job:
+    """One analysis, plus everything we know about how it's going"""
+
+    def __init__(self, user1, user2, fast=False):
+        self.id = uuid.uuid4().hex
+        self.key = job_key(user1, user2, fast)
+        self.user1 = user1
+        self.user2 = user2
+        self.fast = fast
+        self.status = 'queued'  # queued -> running -> done / error
+        self.progress = {}
+        self.sections = {}
+        self.section_status = None
+        self.result = None
+        self.error = None
+        self.timings = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        """Folds an analysis event into the job's progress and partial sections"""
+        with self._lock:
+            if event['type'] == 'progress':
+                # One entry per list, e.g. progress['alice']['rated 4.5'] = {'page': 2, 'pages': 7}
+                list_name = event['list'] if event.get('rating') is None else f"{event['list']} {event['rating']}"
+                user_progress = self.progress.setdefault(event['user'], {})
+                list_progress = user_progress.setdefault(list_name, {'pages_loaded': 0, 'pages': 0, 'films': 0})
+                list_progress['pages_loaded'] += 1
+                list_progress['pages'] = max(list_progress['pages'], event['pages'])
+                list_progress['films'] += event['films']
+            elif event['type'] == 'section':
+                self.sections[event['name']] = event['data']
+            elif event['type'] == 'section_status':
+                self.section_status = event['data']
+
+    def is_expired(self, now=None):
+        now = now or time.time()
+        return self.finished_at is not None and now - self.finished_at > JOB_RESULT_TTL
+
+    def to_dict(self):
+        """JSON-friendly view of the job for GET /api/jobs/<id>"""
+        with self._lock:
+            job = {
+                'id': self.id,
+                'status': self.status,
+                'user1': self.user1,
+                'user2': self.user2,
+                'progress': self.progress,
+                'sections': dict(self.sections),
+                'section_status': self.section_status,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at
+            }
+            if self.status == 'done':
+                job['result'] = self.result
+                job['timings'] = self.timings
+            if self.status == 'error':
+                job['error'] = self.error
+            return job
+
+class JobManager:
+    """Starts jobs on a background thread pool and keeps track of them"""
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._jobs = {}
+        self._jobs_by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user1, user2=None, fast=False):
+        """
+        Starts an analysis, or joins an identical one that's running or recently finished
+
+        Args:
+            fast: Run it in fast mode (see fast_mode.py); fast and full
+                analyses of the same pair are separate jobs
+
+        Returns:
+            (job, created) - created is False when an existing job was reused
+        """
+        key = job_key(user1, user2, fast)
+        with self._lock:
+            self._purge_expired()
+            existing = self._jobs_by_key.get(key)
+            # Failed jobs aren't reused, so a retry really retries
+            if existing is not None and existing.status != 'error':
+                return existing, False
+
+            job = Job(user1, user2, fast)
+            self._jobs[job.id] = job
+            self._jobs_by_key[key] = job
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def get(self, job_id):
+        """Looks up a job by id (None if it never existed or has expired)"""
+        with self._lock:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = 'running'
+        try:
+            with metrics.trace() as job_trace:
+                job.result = analyze(job.user1, job.user2, emit=job.record, fast=job.fast)
+            job.timings = job_trace.breakdown()
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'error'
+        finally:
+            job.finished_at = time.time()
+
+    def _purge_expired(self):
+        # Caller holds self._lock
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.is_expired(now):
+                del self._jobs[job_id]
+                if self._jobs_by_key.get(job.key) is job:
+                    del self._jobs_by_key[job.key]
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """Returns the process-wide JobManager, creating it on first use"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -3,170 +3,347 @@ Letterboxd Scraper Module
 This module handles fetching and parsing data from Letterboxd profiles
 
 LEARNING NOTE: Web scraping extracts data from HTML pages.
-We're using BeautifulSoup to parse the HTML structure.
+Film grids (the big lists of posters) are parsed by poster_parser.py, which
+uses lxml directly for speed. Individual film pages are parsed with BeautifulSoup.
 """
 import requests
 from bs4 import BeautifulSoup
-import time
+from concurrent.futures import ThreadPoolExecutor
 import re
 import json
 
-def get_user_movies(username):
+import film_catalog
+import film_ids
+import http_client
+import metrics
+import poster_parser
+import profile_cache
+
+# Rating buckets we scrape from /films/rated/{rating}/:
+# - 0.5, 1.0 for "both hated" section
+# - 4.0, 4.5, 5.0 for "both loved" section and recommendations
+# This reduces scraping time by 50% (5 ratings instead of 10)
+RATED_BUCKETS = [0.5, 1.0, 4.0, 4.5, 5.0]
+
+def _fetch(url, timeout=10, headers=None):
+    """
+    GETs a Letterboxd URL through the shared HTTP client
+    Every scraper request should go through here instead of calling requests.get directly:
+    it reuses pooled connections, stays inside the politeness budget and retries
+    transient failures (see http_client.get).
+    
+    Args:
+        headers: Extra headers to send on top of the shared browser headers
+    """
+    return http_client.get(url, timeout=timeout, headers=headers)
+
+def _rated_page_url(username, rating_value, page):
+    """Builds the /films/rated/{rating}/page/{n}/ URL for a rating bucket"""
+    # Format: whole numbers use integer (5), half-stars use decimal (4.5)
+    if rating_value == int(rating_value):
+        return f"https://letterboxd.com/{username}/films/rated/{int(rating_value)}/page/{page}/"
+    return f"https://letterboxd.com/{username}/films/rated/{rating_value}/page/{page}/"
+
+def _film_key(film):
+    """
+    The key a film is stored under in every movies dictionary
+    
+    Films are identified by their Letterboxd slug, not their title: remakes
+    and same-named films share a title but never a slug. If a poster somehow
+    has no slug we fall back to the title.
+    """
+    return film.get('slug') or film['title']
+
+def _film_entry(film, rating):
+    """Builds the per-film dictionary the scraper returns for one parsed poster"""
+    return {
+        'title': film['title'],
+        'rating': rating,
+        'year': film['year'],
+        'url': film['url'],
+        'slug': film['slug'],
+        'film_id': film['film_id']  # Letterboxd's own numeric id, if the poster has it
+    }
+
+def _with_ids(movies):
+    """
+    Adds each film's interned integer id (see film_ids.py) as movies[key]['id']
+    and records the film's title and year with it
+    
+    The ids are only valid inside this process, so they're assigned every
+    time movies come out of the parser or the cache, never trusted from disk.
+    """
+    for key, data in movies.items():
+        data['id'] = film_ids.intern(key, data.get('title'), data.get('year'), data.get('film_id'), data.get('slug'))
+    return movies
+
+def _catalog_entries(page_movies):
+    """Turns a parsed page into the basic film records the film catalog keeps"""
+    return [
+        {'slug': data.get('slug'), 'title': data.get('title'), 'year': data.get('year')}
+        for data in page_movies.values()
+    ]
+
+def _load_page(username, url, parse_page, label, revalidate=False):
+    """
+    Loads one film grid page, going through the profile cache
+    
+    A fresh cached page is used as-is (no request, no parsing), and a stale
+    one is revalidated with a conditional request so an unchanged page comes
+    back as a cheap 304.
+    
+    Args:
+        revalidate: Set to True to send the conditional request even when the
+            cached page is fresh, so the page is as of now
+    
+    Returns:
+        (page_movies, last_page) - page_movies is None if the page doesn't
+        exist or couldn't be parsed
+    
+    Raises:
+        http_client.FetchError: If the page couldn't be downloaded even after retries
+    """
+    cached = profile_cache.get_page(url)
+    if not revalidate and profile_cache.is_fresh(cached):
+        metrics.count('letterboxd_cache_requests_total', cache='profile_pages', result='hit')
+        return _with_ids(cached['movies']), cached['last_page']
+    
+    try:
+        response = _fetch(url, timeout=10, headers=profile_cache.conditional_headers(cached))
+        
+        if response.status_code == 304 and cached:
+            # Not modified since we cached it - reuse the parsed page
+            metrics.count('letterboxd_cache_requests_total', cache='profile_pages', result='revalidated')
+            profile_cache.touch_page(url)
+            return _with_ids(cached['movies']), cached['last_page']
+        
+        if response.status_code != 200:
+            # If page doesn't exist, we've reached the end
+            return None, 1
+        
+        metrics.count('letterboxd_cache_requests_total', cache='profile_pages', result='miss')
+        with metrics.span('parse.grid'):
+            page_movies, last_page = parse_page(response.content)
+        metrics.count('letterboxd_pages_total')
+        if page_movies:
+            film_catalog.register_films(_catalog_entries(page_movies))
+            profile_cache.put_page(
+                url, username, page_movies, last_page,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )
+            _with_ids(page_movies)
+        return page_movies, last_page
+        
+    except (http_client.FetchError, requests.exceptions.RequestException) as e:
+        # Retries are used up. Don't treat this as the end of the list -
+        # that would silently drop every film after this page.
+        raise http_client.FetchError(f"Couldn't fetch {label}: {e}") from e
+    except Exception as e:
+        print(f"  Error fetching {label}: {e}")
+    return None, 1
+
+def _crawl_lists(username, lists, max_pages=100, max_workers=None):
+    """
+    Fetches every page of several paginated Letterboxd film grids on one thread pool
+    
+    Each list's page 1 is fetched first so we can read its page count from
+    the pagination links. The remaining pages of every list are then fetched
+    concurrently and merged back in page order. All of it shares one pool of
+    MAX_CONCURRENT_REQUESTS workers - the same number of requests the host
+    limiter lets through at once - so crawling five lists doesn't start five
+    pools of idle threads. Every page goes through the profile cache (see
+    _load_page).
+    
+    Args:
+        username: Letterboxd username the pages belong to (for the cache)
+        lists: List of (page_url, parse_page, label, on_page) tuples:
+            page_url: Function that takes a page number and returns its URL
+            parse_page: Function that takes a page's HTML and returns ({film_key: {...}}, last_page)
+            label: Short description of the list, used in log messages
+            on_page: Optional callback, called as on_page(page, last_page, movie_count)
+                whenever a page arrives (from whichever worker thread loaded it)
+        max_pages: Safety limit on how many pages we'll fetch per list
+        max_workers: Pool size (defaults to MAX_CONCURRENT_REQUESTS)
+    
+    Returns:
+        One list of per-page movie dictionaries per crawled list, in page
+        order. Like the old page-by-page loop, each stops at the first page
+        that failed or had no movies.
+    """
+    def fetch_page(crawled_list, page):
+        page_url, parse_page, label, on_page = crawled_list
+        page_movies, page_count = _load_page(username, page_url(page), parse_page, f"{label} page {page}")
+        if on_page and page_movies:
+            on_page(page, min(page_count, max_pages), len(page_movies))
+        return page_movies, page_count
+    
+    with ThreadPoolExecutor(max_workers=max_workers or http_client.MAX_CONCURRENT_REQUESTS) as executor:
+        fetch = metrics.in_context(fetch_page)
+        first_pages = [executor.submit(fetch, crawled_list, 1) for crawled_list in lists]
+        
+        # Queue every list's remaining pages as soon as its page count is known
+        crawls = []
+        for crawled_list, first in zip(lists, first_pages):
+            first_page, last_page = first.result()
+            if not first_page:
+                crawls.append(([], []))
+                continue
+            remaining = [executor.submit(fetch, crawled_list, page) for page in range(2, min(last_page, max_pages) + 1)]
+            crawls.append(([first_page], remaining))
+        
+        results = []
+        for pages, remaining in crawls:
+            for future in remaining:
+                page_movies = future.result()[0]
+                # If no movies found on this page, we've reached the end
+                if not page_movies:
+                    break
+                pages.append(page_movies)
+            results.append(pages)
+    
+    return results
+
+def _crawl_pages(username, page_url, parse_page, label, max_pages=100, on_page=None):
+    """
+    Fetches every page of one paginated Letterboxd film grid (see _crawl_lists)
+    
+    Returns:
+        List of per-page movie dictionaries in page order, stopping at the
+        first page that failed or had no movies
+    """
+    return _crawl_lists(username, [(page_url, parse_page, label, on_page)], max_pages=max_pages)[0]
+
+def _parse_rated_page(content, rating_value):
+    """
+    Parses one /films/rated/{rating}/ page
+    
+    Returns:
+        ({film_key: {title, rating, year, url, slug, film_id}}, last_page) for the movies on this page
+    """
+    films, last_page = poster_parser.parse_poster_grid(content)
+    movies = {}
+    for film in films:
+        # Store movie with the rating from the URL
+        # We know the rating because we're on the /films/rated/{rating}/ page
+        movies[_film_key(film)] = _film_entry(film, rating_value)
+    return movies, last_page
+
+def _progress_reporter(progress, **event):
+    """
+    Adapts a scraper progress callback to _crawl_pages' on_page hook
+    
+    The callback receives a dict with the given event fields plus
+    'page', 'pages' (page count) and 'films' (movies on that page).
+    """
+    if progress is None:
+        return None
+    return lambda page, last_page, count: progress(dict(event, page=page, pages=last_page, films=count))
+
+def _rating_bucket_list(username, rating_value, progress=None):
+    """The _crawl_lists entry for one /films/rated/{rating}/ bucket"""
+    return (
+        lambda page: _rated_page_url(username, rating_value, page),
+        lambda content: _parse_rated_page(content, rating_value),
+        f"rating {rating_value}",
+        _progress_reporter(progress, list='rated', rating=rating_value)
+    )
+
+def iter_rating_bucket_pages(username, rating_value, max_pages=100, progress=None):
+    """
+    Yields one /films/rated/{rating}/ bucket a page at a time, in page order
+    
+    Unlike get_user_movies this is lazy: page 1 comes first, then the
+    rest are fetched a few at a time (one batch of MAX_CONCURRENT_REQUESTS
+    pages at once), so a caller that has seen enough can stop iterating and
+    the remaining pages are never requested.
+    
+    Args:
+        max_pages: Stop after this many pages, even if the bucket has more
+    
+    Yields:
+        {film_key: {...}} for each page (same entries as get_user_movies),
+        then one final None if max_pages cut the bucket short - so callers
+        can tell a finished bucket from a truncated one
+    """
+    on_page = _progress_reporter(progress, list='rated', rating=rating_value)
+    
+    def fetch_page(page):
+        page_movies, page_count = _load_page(
+            username, _rated_page_url(username, rating_value, page),
+            lambda content: _parse_rated_page(content, rating_value),
+            f"rating {rating_value} page {page}"
+        )
+        if on_page and page_movies:
+            on_page(page, min(page_count, max_pages), len(page_movies))
+        return page_movies, page_count
+    
+    if max_pages < 1:
+        # We can't know whether the bucket is empty without looking
+        yield None
+        return
+    first_page, page_count = fetch_page(1)
+    if not first_page:
+        return
+    yield first_page
+    
+    last_page = min(page_count, max_pages)
+    batch_size = http_client.MAX_CONCURRENT_REQUESTS
+    with ThreadPoolExecutor(max_workers=batch_size) as executor:
+        for start in range(2, last_page + 1, batch_size):
+            batch = range(start, min(start + batch_size, last_page + 1))
+            for page_movies in executor.map(metrics.in_context(lambda page: fetch_page(page)[0]), batch):
+                # An empty page is the end of the list, like in _crawl_pages
+                if not page_movies:
+                    return
+                yield page_movies
+    
+    if page_count > max_pages:
+        yield None
+
+def get_user_movies(username, max_workers=None, progress=None):
     """
     Fetches all movies a user has rated from their Letterboxd profile
     
     Uses the /films/rated/{rating}/ pages which show movies by rating.
-    Loops through all ratings from 0.5 to 5.0 in 0.5 increments.
+    All buckets download in parallel on one pool of workers (within the
+    shared politeness budget, see _crawl_lists). Results are merged in
+    bucket order, so the output is identical to crawling them one by one.
     
     Args:
         username: Letterboxd username
+        max_workers: Most pages fetched at once (defaults to MAX_CONCURRENT_REQUESTS)
+        progress: Optional callback, called with a dict like
+            {'list': 'rated', 'rating': 4.5, 'page': 2, 'pages': 7, 'films': 72}
+            each time a page arrives (possibly from a worker thread)
     
     Returns:
-        Dictionary with movie data: {
-            'movie_title': {
+        Dictionary with movie data, keyed by film slug (see _film_key): {
+            'parasite-2019': {
+                'title': 'Parasite',
                 'rating': 4.5,  # 0.5-5.0 based on page URL
-                'year': 2023,
-                'url': 'https://...'
+                'year': 2019,
+                'url': 'https://...',
+                'slug': 'parasite-2019',
+                'film_id': 426406,  # Letterboxd's id (None if not on the poster)
+                'id': 17  # interned id, see film_ids.py
             }
         }
     """
     movies = {}
     
-    # Only fetch ratings we actually need:
-    # - 0.5, 1.0 for "both hated" section
-    # - 4.0, 4.5, 5.0 for "both loved" section and recommendations
-    # This reduces scraping time by 50% (5 ratings instead of 10)
-    ratings = [0.5, 1.0, 4.0, 4.5, 5.0]
+    # Crawl every rating bucket concurrently, then merge in bucket order
+    # (a later bucket overwrites an earlier one, exactly like the serial loop did)
+    print(f"  Fetching movies rated {', '.join(str(rating_value) for rating_value in RATED_BUCKETS)}...")
+    buckets = _crawl_lists(
+        username,
+        [_rating_bucket_list(username, rating_value, progress) for rating_value in RATED_BUCKETS],
+        max_workers=max_workers
+    )
     
-    for rating_value in ratings:
-        page = 1
-        max_pages = 100  # Safety limit to prevent infinite loops
-        
-        print(f"  Fetching movies rated {rating_value}...")
-        
-        # Loop through all pages for this rating
-        while page <= max_pages:
-            # Construct URL - Letterboxd uses /films/rated/{rating}/ for movies by rating
-            # Format: whole numbers use integer (5), half-stars use decimal (4.5)
-            if rating_value == int(rating_value):
-                url = f"https://letterboxd.com/{username}/films/rated/{int(rating_value)}/page/{page}/"
-            else:
-                url = f"https://letterboxd.com/{username}/films/rated/{rating_value}/page/{page}/"
-            
-            try:
-                # Add headers to look like a real browser
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                }
-                response = requests.get(url, headers=headers, timeout=10)
-                
-                if response.status_code != 200:
-                    # If page doesn't exist, we've reached the end
-                    break
-                
-                soup = BeautifulSoup(response.content, 'lxml')
-                
-                # Find all movie entries on the page
-                # Letterboxd uses <div class="poster film-poster"> for movies
-                movie_elements = soup.find_all('div', class_='poster')
-                
-                # Alternative: try finding by film-poster class
-                if not movie_elements:
-                    movie_elements = soup.find_all('div', class_='film-poster')
-                
-                # Fallback: try old selectors for compatibility
-                if not movie_elements:
-                    movie_elements = soup.find_all('li', class_='posteritem')
-                if not movie_elements:
-                    movie_elements = soup.find_all('div', {'data-film-id': True})
-                if not movie_elements:
-                    movie_elements = soup.find_all('li', class_='poster-container')
-                
-                if not movie_elements:
-                    # No more movies on this page for this rating
-                    break
-                
-                movies_found_on_page = 0
-                for element in movie_elements:
-                    # Extract movie title from the img alt text or data attribute
-                    img = element.find('img')
-                    if not img:
-                        continue
-                    
-                    # Get movie title - try multiple methods
-                    title = None
-                    # Try link's data-original-title first (cleanest)
-                    link = element.find('a')
-                    if link:
-                        title = link.get('data-original-title', '').strip()
-                    
-                    # Try img alt text (may have "Poster for" prefix)
-                    if not title:
-                        title = img.get('alt', '').strip()
-                        # Remove "Poster for" prefix if present
-                        if title.startswith('Poster for '):
-                            title = title.replace('Poster for ', '', 1).strip()
-                    
-                    # Try img title attribute
-                    if not title:
-                        title = img.get('title', '').strip()
-                    
-                    # Try data attribute
-                    if not title:
-                        title = element.get('data-film-name', '').strip()
-                    
-                    if not title:
-                        continue
-                    
-                    # Get movie URL (link was already found above)
-                    if not link:
-                        link = element.find('a')
-                    if link and link.get('href'):
-                        movie_url = f"https://letterboxd.com{link.get('href')}"
-                    else:
-                        movie_url = None
-                    
-                    # Extract year if available
-                    year = None
-                    year_match = re.search(r'\((\d{4})\)', title)
-                    if year_match:
-                        year = int(year_match.group(1))
-                        title = title.replace(f'({year})', '').strip()
-                    
-                    # Also try to get year from data attribute
-                    if not year:
-                        year_attr = element.get('data-film-year', '')
-                        if year_attr:
-                            try:
-                                year = int(year_attr)
-                            except:
-                                pass
-                    
-                    # Store movie with the rating from the URL
-                    # We know the rating because we're on the /films/rated/{rating}/ page
-                    movies[title] = {
-                        'rating': rating_value,  # Rating from URL
-                        'year': year,
-                        'url': movie_url
-                    }
-                    movies_found_on_page += 1
-                
-                # If no movies found on this page, we've reached the end
-                if movies_found_on_page == 0:
-                    break
-                
-                page += 1
-                time.sleep(0.5)  # Be polite - wait 0.5 seconds between requests (optimized for speed)
-                
-            except requests.exceptions.Timeout:
-                print(f"  Timeout fetching page {page} for rating {rating_value}")
-                break
-            except requests.exceptions.RequestException as e:
-                print(f"  Network error fetching page {page} for rating {rating_value}: {e}")
-                break
-            except Exception as e:
-                print(f"  Error fetching page {page} for rating {rating_value}: {e}")
-                break
+    for pages in buckets:
+        for page_movies in pages:
+            movies.update(page_movies)
     
     # Check if we found any movies at all
     if len(movies) == 0:
@@ -175,290 +352,334 @@ def get_user_movies(username):
     print(f"Found {len(movies)} movies for {username} ({sum(1 for m in movies.values() if m.get('rating') is not None)} with ratings)")
     return movies
 
-def get_user_watched_movies(username):
+def _parse_watched_page(content):
+    """
+    Parses one /films/ page of a user's watched movies
+    
+    Returns:
+        ({film_key: {title, rating, year, url, slug, film_id}}, last_page) for the movies on this page
+    """
+    films, last_page = poster_parser.parse_poster_grid(content)
+    movies = {}
+    for film in films:
+        # Store movie with rating (can be None if unrated)
+        # Exclude 0.0 ratings (Letterboxd doesn't recognize 0 stars as valid)
+        if film['rating'] is not None and film['rating'] <= 0.0:
+            continue
+        movies[_film_key(film)] = _film_entry(film, film['rating'])  # 0.5-5.0, or None if unrated
+    return movies, last_page
+
+def _watched_page_url(username, page):
+    """Builds the /films/page/{n}/ URL for a user's watched list"""
+    return f"https://letterboxd.com/{username}/films/page/{page}/"
+
+def _refresh_watched_incrementally(username, snapshot_movies, max_pages=100, progress=None):
+    """
+    Brings a stored watched-list snapshot up to date
+    
+    The /films/ list shows the most recent activity first, so we read pages
+    from the front only until the list we've read joins up with the snapshot:
+    two films that were next to each other in the snapshot are next to each
+    other again. Everything before that point is new and gets merged in front
+    of the snapshot. For someone who logs a film or two a day that's usually
+    just page 1.
+    
+    A single snapshot film isn't enough - an old film that was just re-logged
+    jumps to the front, with new films still behind it. And every page is
+    revalidated rather than taken from the page cache, so pages cached at
+    different times (which the list may have shifted between) never get
+    joined together.
+    
+    Returns:
+        Updated {film_key: {...}} dictionary, or None if a
+        page is missing and we should fall back to a full crawl
+    """
+    snapshot_keys = list(snapshot_movies)
+    next_in_snapshot = dict(zip(snapshot_keys, snapshot_keys[1:]))
+    delta = {}
+    read_keys = []
+    for page in range(1, max_pages + 1):
+        page_movies, last_page = _load_page(
+            username, _watched_page_url(username, page), _parse_watched_page, f"watched movies page {page}",
+            revalidate=True
+        )
+        if page_movies is None:
+            # Missing page or the user is gone - let the full crawl decide
+            return None
+        
+        if progress:
+            progress({'list': 'watched', 'page': page, 'pages': last_page, 'films': len(page_movies)})
+        delta.update(page_movies)
+        # Include the previous page's last film, in case the pair spans pages
+        start = max(len(read_keys) - 1, 0)
+        read_keys.extend(page_movies)
+        if len(snapshot_keys) > 1:
+            reached_snapshot = any(
+                next_in_snapshot.get(key) == following
+                for key, following in zip(read_keys[start:], read_keys[start + 1:])
+            )
+        else:
+            reached_snapshot = any(key in snapshot_movies for key in page_movies)
+        if reached_snapshot or page >= last_page:
+            break
+    
+    print(f"  Incremental refresh read {page} page(s), {sum(1 for key in delta if key not in snapshot_movies)} new movies")
+    
+    # New films go first (most recent activity), then the snapshot with any updated ratings
+    merged = {key: data for key, data in delta.items() if key not in snapshot_movies}
+    for key, data in snapshot_movies.items():
+        merged[key] = delta.get(key, data)
+    return _with_ids(merged)
+
+def _save_watched_snapshot(username, movies, full_refresh_at=None):
+    """Caches a freshly scraped watched list"""
+    profile_cache.put_snapshot(username, 'watched', movies, full_refresh_at=full_refresh_at)
+
+def get_user_watched_movies(username, incremental=True, progress=None):
     """
     Fetches all movies a user has watched from their Letterboxd profile
     
     Uses the /films/ page which shows all watched movies (rated and unrated).
     Extracts ratings by counting star characters (★) in the HTML if available.
+    The page count is read from page 1's pagination, so the rest of the pages
+    are fetched concurrently instead of one at a time.
+    
+    The result is stored as a snapshot. While the snapshot is fresh it's
+    returned directly; once it's stale we only fetch the pages newer than it
+    (see _refresh_watched_incrementally). Every PROFILE_FULL_REFRESH_TTL the
+    whole list is re-crawled to pick up deleted films and old rating changes.
     
     Args:
         username: Letterboxd username
+        incremental: Set to False to ignore the snapshot and crawl every page
+        progress: Optional callback, called with a dict like
+            {'list': 'watched', 'page': 2, 'pages': 28, 'films': 72}
+            each time a page arrives (possibly from a worker thread)
     
     Returns:
-        Dictionary with movie data: {
-            'movie_title': {
+        Dictionary with movie data, keyed by film slug (same fields as get_user_movies): {
+            'parasite-2019': {
+                'title': 'Parasite',
                 'rating': 4.5,  # 0.5-5.0 if rated, or None if unrated
-                'year': 2023,
-                'url': 'https://...'
+                'year': 2019,
+                'url': 'https://...',
+                'slug': 'parasite-2019',
+                'film_id': 426406,
+                'id': 17
             }
         }
     """
-    movies = {}
-    page = 1
-    max_pages = 100  # Safety limit to prevent infinite loops
+    snapshot = profile_cache.get_snapshot(username, 'watched') if incremental else None
+    movies = None
     
-    print(f"  Fetching watched movies...")
+    if snapshot and profile_cache.is_fresh(snapshot):
+        movies = _with_ids(snapshot['movies'])
+    elif snapshot and not profile_cache.needs_full_refresh(snapshot):
+        print(f"  Refreshing watched movies...")
+        movies = _refresh_watched_incrementally(username, snapshot['movies'], progress=progress)
+        if movies is not None:
+            _save_watched_snapshot(username, movies, full_refresh_at=snapshot['full_refresh_at'])
     
-    # Loop through all pages of watched films
-    while page <= max_pages:
-        # Construct URL - Letterboxd uses /films/ for all watched movies
-        url = f"https://letterboxd.com/{username}/films/page/{page}/"
+    if movies is None:
+        movies = {}
+        print(f"  Fetching watched movies...")
         
-        try:
-            # Add headers to look like a real browser
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code != 200:
-                # If page doesn't exist, we've reached the end
-                if page == 1:
-                    raise Exception(f"User '{username}' not found or has no watched movies")
-                break
-            
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            # Find all movie entries on the page
-            # Letterboxd uses <div class="poster film-poster"> for movies
-            movie_elements = soup.find_all('div', class_='poster')
-            
-            # Alternative: try finding by film-poster class
-            if not movie_elements:
-                movie_elements = soup.find_all('div', class_='film-poster')
-            
-            # Fallback: try old selectors for compatibility
-            if not movie_elements:
-                movie_elements = soup.find_all('li', class_='posteritem')
-            if not movie_elements:
-                movie_elements = soup.find_all('div', {'data-film-id': True})
-            if not movie_elements:
-                movie_elements = soup.find_all('li', class_='poster-container')
-            
-            if not movie_elements:
-                # No more movies on this page
-                if page == 1:
-                    raise Exception(f"User '{username}' not found or has no watched movies")
-                break  # Reached last page
-            
-            movies_found_on_page = 0
-            
-            for element in movie_elements:
-                # Extract movie title from the img alt text or data attribute
-                img = element.find('img')
-                if not img:
-                    continue
-                
-                # Get movie title - try multiple methods
-                title = None
-                # Try link's data-original-title first (cleanest)
-                link = element.find('a')
-                if link:
-                    title = link.get('data-original-title', '').strip()
-                
-                # Try img alt text (may have "Poster for" prefix)
-                if not title:
-                    title = img.get('alt', '').strip()
-                    # Remove "Poster for" prefix if present
-                    if title.startswith('Poster for '):
-                        title = title.replace('Poster for ', '', 1).strip()
-                
-                # Try img title attribute
-                if not title:
-                    title = img.get('title', '').strip()
-                
-                # Try data attribute
-                if not title:
-                    title = element.get('data-film-name', '').strip()
-                
-                if not title:
-                    continue
-                
-                # Get movie URL (link was already found above)
-                if not link:
-                    link = element.find('a')
-                if link and link.get('href'):
-                    movie_url = f"https://letterboxd.com{link.get('href')}"
-                else:
-                    movie_url = None
-                
-                # Try to find rating by counting star characters (★) in the HTML
-                # Letterboxd displays ratings as star symbols: ★★★★★ = 5.0, ★★★★ = 4.0, etc.
-                rating = None
-                
-                # First, look for poster-viewingdata paragraph
-                viewing_data = element.find('p', class_='poster-viewingdata')
-                if viewing_data:
-                    # Find span with 'rating' in class list
-                    rating_span = viewing_data.find('span', class_=lambda x: x and 'rating' in x)
-                    if rating_span:
-                        # Get text content and count star characters
-                        rating_text = rating_span.get_text()
-                        star_count = rating_text.count('★')
-                        if star_count > 0:
-                            rating = float(star_count)
-                            # Check for half-star (½ or similar)
-                            if '½' in rating_text or '1/2' in rating_text.lower():
-                                rating += 0.5
-                
-                # Fallback: search for stars anywhere in the element
-                if not rating:
-                    element_text = element.get_text()
-                    star_count = element_text.count('★')
-                    if star_count > 0 and star_count <= 5:
-                        rating = float(star_count)
-                        # Check for half-star
-                        if '½' in element_text or '1/2' in element_text.lower():
-                            rating += 0.5
-                
-                # Also try finding rating span directly in element (another fallback)
-                if not rating:
-                    rating_span = element.find('span', class_=lambda x: x and 'rating' in x)
-                    if rating_span:
-                        rating_text = rating_span.get_text()
-                        star_count = rating_text.count('★')
-                        if star_count > 0:
-                            rating = float(star_count)
-                            if '½' in rating_text or '1/2' in rating_text.lower():
-                                rating += 0.5
-                
-                # Extract year if available
-                year = None
-                year_match = re.search(r'\((\d{4})\)', title)
-                if year_match:
-                    year = int(year_match.group(1))
-                    title = title.replace(f'({year})', '').strip()
-                
-                # Also try to get year from data attribute
-                if not year:
-                    year_attr = element.get('data-film-year', '')
-                    if year_attr:
-                        try:
-                            year = int(year_attr)
-                        except:
-                            pass
-                
-                # Store movie with rating (can be None if unrated)
-                # Exclude 0.0 ratings (Letterboxd doesn't recognize 0 stars as valid)
-                if rating is not None and rating > 0.0:
-                    movies[title] = {
-                        'rating': rating,  # 0.5-5.0
-                        'year': year,
-                        'url': movie_url
-                    }
-                    movies_found_on_page += 1
-                elif rating is None:
-                    # Store unrated movies as None
-                    movies[title] = {
-                        'rating': None,
-                        'year': year,
-                        'url': movie_url
-                    }
-                    movies_found_on_page += 1
-                # If rating is 0.0, don't store it (skip this movie)
-            
-            # If no movies found on this page, we've reached the end
-            if movies_found_on_page == 0:
-                break
-            
-            page += 1
-            time.sleep(0.5)  # Be polite - wait 0.5 seconds between requests (optimized for speed)
-            
-        except requests.exceptions.Timeout:
-            print(f"  Timeout fetching watched movies page {page}")
-            break
-        except requests.exceptions.RequestException as e:
-            print(f"  Network error fetching watched movies page {page}: {e}")
-            break
-        except Exception as e:
-            print(f"  Error fetching watched movies page {page}: {e}")
-            break
+        pages = _crawl_pages(
+            username,
+            lambda page: _watched_page_url(username, page),
+            _parse_watched_page,
+            "watched movies",
+            on_page=_progress_reporter(progress, list='watched')
+        )
+        
+        if not pages:
+            # Page 1 is missing or empty - let the caller fall back to the rated list
+            raise Exception(f"User '{username}' not found or has no watched movies")
+        
+        for page_movies in pages:
+            movies.update(page_movies)
+        
+        _save_watched_snapshot(username, movies)
     
     print(f"Found {len(movies)} watched movies for {username} ({sum(1 for m in movies.values() if m.get('rating') is not None)} with ratings)")
     return movies
 
-def get_movie_average_rating(movie_url):
+def _load_json_ld(soup):
     """
-    Fetches the Letterboxd average rating for a movie
-    Returns the average rating as a float, or None if not found
+    Reads the JSON-LD block on a film page
+    
+    Letterboxd wraps it in a /* <![CDATA[ */ ... /* ]]> */ comment, which
+    json.loads can't handle, so we strip that first.
     """
-    if not movie_url:
-        return None
+    for script in soup.find_all('script', type='application/ld+json'):
+        text = re.sub(r'/\*\s*<!\[CDATA\[\s*\*/|/\*\s*\]\]>\s*\*/', '', script.string or '').strip()
+        try:
+            data = json.loads(text)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return {}
+
+def _parse_average_rating(soup, json_ld):
+    """Finds the Letterboxd average rating on a film page, or returns None"""
+    # Letterboxd displays average rating in various places
+    # Try to find it in multiple locations
+    average_rating = None
     
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        response = requests.get(movie_url, headers=headers, timeout=5)
-        soup = BeautifulSoup(response.content, 'lxml')
-        
-        # Letterboxd displays average rating in various places
-        # Try to find it in multiple locations
-        average_rating = None
-        
-        # Method 1: Look for meta tag with property="letterboxd:filmRating"
-        meta_rating = soup.find('meta', {'property': 'letterboxd:filmRating'})
-        if meta_rating and meta_rating.get('content'):
-            try:
-                average_rating = float(meta_rating.get('content'))
-            except:
-                pass
-        
-        # Method 2: Look for rating in the film-rating section
-        if not average_rating:
-            rating_section = soup.find('div', class_='film-rating')
-            if rating_section:
-                rating_text = rating_section.get_text()
-                # Extract number from text like "3.8" or "3.8/5"
-                rating_match = re.search(r'(\d+\.?\d*)', rating_text)
-                if rating_match:
-                    try:
-                        average_rating = float(rating_match.group(1))
-                    except:
-                        pass
-        
-        # Method 3: Look for data attribute
-        if not average_rating:
-            rating_elem = soup.find(attrs={'data-average-rating': True})
-            if rating_elem:
+    # Method 1: Look for meta tag with property="letterboxd:filmRating"
+    meta_rating = soup.find('meta', {'property': 'letterboxd:filmRating'})
+    if meta_rating and meta_rating.get('content'):
+        try:
+            average_rating = float(meta_rating.get('content'))
+        except:
+            pass
+    
+    # Method 2: Look for rating in the film-rating section
+    if not average_rating:
+        rating_section = soup.find('div', class_='film-rating')
+        if rating_section:
+            rating_text = rating_section.get_text()
+            # Extract number from text like "3.8" or "3.8/5"
+            rating_match = re.search(r'(\d+\.?\d*)', rating_text)
+            if rating_match:
                 try:
-                    average_rating = float(rating_elem.get('data-average-rating'))
+                    average_rating = float(rating_match.group(1))
                 except:
                     pass
-        
-        # Method 4: Look for average rating in script tags (JSON-LD)
-        if not average_rating:
-            scripts = soup.find_all('script', type='application/ld+json')
-            for script in scripts:
-                try:
-                    data = json.loads(script.string)
-                    if isinstance(data, dict) and 'aggregateRating' in data:
-                        rating_value = data['aggregateRating'].get('ratingValue')
-                        if rating_value:
-                            average_rating = float(rating_value)
-                            break
-                except:
-                    continue
-        
-        return average_rating
-    except Exception as e:
-        # Silently fail - we'll use default value
+    
+    # Method 3: Look for data attribute
+    if not average_rating:
+        rating_elem = soup.find(attrs={'data-average-rating': True})
+        if rating_elem:
+            try:
+                average_rating = float(rating_elem.get('data-average-rating'))
+            except:
+                pass
+    
+    # Method 4: Look for average rating in the JSON-LD data
+    if not average_rating:
+        rating_value = (json_ld.get('aggregateRating') or {}).get('ratingValue')
+        if rating_value:
+            try:
+                average_rating = float(rating_value)
+            except (TypeError, ValueError):
+                pass
+    
+    # Method 5: Twitter card, e.g. <meta name="twitter:data2" content="3.85 out of 5">
+    if not average_rating:
+        twitter_rating = soup.find('meta', {'name': 'twitter:data2'})
+        if twitter_rating:
+            rating_match = re.match(r'\s*(\d+\.?\d*) out of 5', twitter_rating.get('content', ''))
+            if rating_match:
+                average_rating = float(rating_match.group(1))
+    
+    return average_rating
+
+def _json_ld_names(value):
+    """Turns a JSON-LD person/genre field (string, dict or list of either) into a list of names"""
+    if not value:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    names = []
+    for item in value:
+        name = item.get('name') if isinstance(item, dict) else item
+        if isinstance(name, str) and name.strip():
+            names.append(name.strip())
+    return names
+
+def _parse_film_page(soup):
+    """
+    Pulls the film-level facts out of a film page
+    
+    Returns:
+        Dictionary: {
+            'title': 'Parasite', 'year': 2019, 'average_rating': 4.56,
+            'rating_count': 123456, 'genres': [...], 'directors': [...], 'cast': [...]
+        }
+    """
+    json_ld = _load_json_ld(soup)
+    
+    # Title and year - JSON-LD first, then the og:title meta tag ("Parasite (2019)")
+    title = json_ld.get('name')
+    year = None
+    released = json_ld.get('releasedEvent')
+    if isinstance(released, list) and released:
+        released = released[0]
+    if isinstance(released, dict):
+        year_match = re.match(r'(\d{4})', str(released.get('startDate', '')))
+        if year_match:
+            year = int(year_match.group(1))
+    og_title = soup.find('meta', {'property': 'og:title'})
+    if og_title and og_title.get('content'):
+        og_match = re.match(r'(.*?)\s*\((\d{4})\)\s*$', og_title['content'])
+        if og_match:
+            title = title or og_match.group(1)
+            year = year or int(og_match.group(2))
+        else:
+            title = title or og_title['content'].strip()
+    
+    # How many people rated it - a decent popularity signal
+    rating_count = (json_ld.get('aggregateRating') or {}).get('ratingCount')
+    try:
+        rating_count = int(rating_count) if rating_count is not None else None
+    except (TypeError, ValueError):
+        rating_count = None
+    
+    # People and genres - JSON-LD first, then the links on the page
+    directors = _json_ld_names(json_ld.get('director'))
+    if not directors:
+        directors = [link.get_text().strip() for link in soup.select('a[href*="/director/"]')]
+    cast = _json_ld_names(json_ld.get('actors'))
+    if not cast:
+        cast = [link.get_text().strip() for link in soup.select('#tab-cast a[href*="/actor/"]')]
+    genres = _json_ld_names(json_ld.get('genre'))
+    if not genres:
+        genres = [link.get_text().strip() for link in soup.select('#tab-genres a[href*="/films/genre/"]')]
+    
+    return {
+        'title': title,
+        'year': year,
+        'average_rating': _parse_average_rating(soup, json_ld),
+        'rating_count': rating_count,
+        'genres': list(dict.fromkeys(genres)),
+        'directors': list(dict.fromkeys(directors)),
+        'cast': list(dict.fromkeys(cast))[:20]
+    }
+
+def get_movie_average_rating(movie_url):
+    """
+    Fetches the Letterboxd average rating for a movie
+    Returns the average rating as a float, or None if not found
+    """
+    if not movie_url:
         return None
+    return get_movie_details(movie_url, timeout=5).get('average_rating')
 
-def get_movie_details(movie_url):
+def get_movie_details(movie_url, timeout=10):
     """
-    Fetches additional details about a movie (genres, director, etc.)
-    Useful for better recommendations later
+    Fetches details about a movie from its film page (genres, director, etc.)
+    
+    Whatever we find is saved to the film catalog, so the next lookup for
+    this film can skip the network (see film_metadata.get_films).
+    
+    Returns:
+        Dictionary from _parse_film_page, or {} if the page couldn't be read
     """
+    if not movie_url:
+        return {}
+    
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        response = requests.get(movie_url, headers=headers, timeout=10)
-        soup = BeautifulSoup(response.content, 'lxml')
-        
-        # Extract genres, director, etc. (you can expand this)
-        details = {}
-        # Add more parsing logic here as needed
-        
-        return details
-    except:
+        response = _fetch(movie_url, timeout=timeout)
+        if response.status_code != 200:
+            return {}
+        with metrics.span('parse.film_page'):
+            soup = BeautifulSoup(response.content, 'lxml')
+            details = _parse_film_page(soup)
+    except Exception:
+        # Silently fail - callers fall back to defaults
         return {}
-
+    
+    film_catalog.save_details(film_catalog.slug_from_url(movie_url), details)
+    return details
@@ -0,0 +1,175 @@
+"""
+Metrics Module
+Timings and counters for the analysis pipeline
+
+Two things are recorded:
+- spans: how long a named step took (fetching a page, parsing it, the
+  average-ratings lookup, the Claude call, ...)
+- counters: how many of something happened (pages fetched, bytes
+  downloaded, cache hits and misses, retries, ...)
+
+Everything is added to process-wide totals, which GET /metrics serves in
+the Prometheus text format. While a request is being traced (see trace()),
+the same numbers are also added to that request's own breakdown, which
+/api/analyze can return alongside the result.
+
+Usage:
+    with metrics.span('parse.grid'):
+        films = parse(content)
+    metrics.count('letterboxd_pages_total', source='network')
+
+LEARNING NOTE: The current trace lives in a contextvars.ContextVar, which is
+like a thread-local that also follows async code. Worker threads don't
+inherit it automatically, so work handed to a thread pool is wrapped with
+in_context() to carry the caller's trace along.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the span duration histogram buckets
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters = {}     # {(name, labels): value}
+_spans = {}        # {name: [bucket counts..., count, sum]}
+_current = contextvars.ContextVar('metrics_trace', default=None)
+
+class Trace:
+    """One request's spans and counters (shared by every thread working on it)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            entry = self.spans.setdefault(name, {'seconds': 0.0, 'count': 0})
+            entry['seconds'] += seconds
+            entry['count'] += 1
+
+    def add_count(self, key, value):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def breakdown(self):
+        """
+        The request's numbers, ready for a JSON response
+
+        Spans that ran on several threads at once (e.g. page fetches) add up
+        their time, so they can exceed total_seconds.
+        """
+        with self._lock:
+            return {
+                'total_seconds': round(time.perf_counter() - self.started, 4),
+                'spans': {
+                    name: {'seconds': round(entry['seconds'], 4), 'count': entry['count']}
+                    for name, entry in sorted(self.spans.items())
+                },
+                'counters': {_format_key(key): value for key, value in sorted(self.counters.items())}
+            }
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_key(key):
+    name, labels = key
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{value}"' for label, value in labels) + '}'
+
+def count(name, value=1, **labels):
+    """Adds value to a counter (and to the current trace, if any)"""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    current = _current.get()
+    if current is not None:
+        current.add_count(key, value)
+
+def total(name):
+    """A counter's process-wide value, summed over all of its labels"""
+    with _lock:
+        return sum(value for (counter, _), value in _counters.items() if counter == name)
+
+def record_span(name, seconds):
+    """Records a finished span's duration"""
+    with _lock:
+        entry = _spans.get(name)
+        if entry is None:
+            entry = _spans[name] = [0] * len(SPAN_BUCKETS) + [0, 0.0]
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if seconds <= bound:
+                entry[i] += 1
+        entry[-2] += 1
+        entry[-1] += seconds
+    current = _current.get()
+    if current is not None:
+        current.add_span(name, seconds)
+
+@contextmanager
+def span(name):
+    """Times the code inside the with block as one span called name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+@contextmanager
+def trace():
+    """
+    Collects everything recorded inside the with block into a Trace
+
+    Yields:
+        The Trace - call breakdown() on it for the per-request numbers
+    """
+    current = Trace()
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+def in_context(function):
+    """
+    Wraps function so it runs with the caller's trace, even on another thread
+
+    Use it when handing work to a thread pool:
+        executor.submit(metrics.in_context(fetch), url)
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A Context can only be entered by one thread at a time, so each call gets a copy
+        return context.copy().run(function, *args, **kwargs)
+
+    return run
+
+def render_prometheus():
+    """All totals in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        spans = {name: list(entry) for name, entry in _spans.items()}
+
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f'# TYPE {name} counter')
+            seen.add(name)
+        lines.append(f'{_format_key((name, labels))} {value}')
+
+    if spans:
+        lines.append('# HELP letterboxd_span_seconds Time spent in each step of the analysis pipeline')
+        lines.append('# TYPE letterboxd_span_seconds histogram')
+    for name, entry in sorted(spans.items()):
+        for bound, bucket_count in zip(SPAN_BUCKETS, entry):
+            lines.append(f'letterboxd_span_seconds_bucket{{span="{name}",le="{bound}"}} {bucket_count}')
+        lines.append(f'letterboxd_span_seconds_bucket{{span="{name}",le="+Inf"}} {entry[-2]}')
+        lines.append(f'letterboxd_span_seconds_count{{span="{name}"}} {entry[-2]}')
+        lines.append(f'letterboxd_span_seconds_sum{{span="{name}"}} {entry[-1]:.6f}')
+    return '\n'.join(lines) + '\n'
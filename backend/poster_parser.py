@@ -0,0 +1,181 @@
+"""
+Poster Grid Parser
+Fast, single-pass parser for Letterboxd film grid pages
+
+Every list we scrape (/films/, /films/rated/{rating}/) is a grid of posters,
+so one parser handles them all. It uses lxml directly with pre-compiled XPath
+queries instead of BeautifulSoup: the page is parsed once, and each poster is
+read in one pass - title, slug, year, Letterboxd film id and the user's star
+rating.
+
+LEARNING NOTE: XPath is a small query language for finding elements in an
+HTML/XML tree. etree.XPath(...) compiles a query once so running it on
+thousands of posters doesn't re-parse the query every time.
+"""
+import re
+
+from lxml import etree, html
+
+def _has_class(name):
+    """XPath test for "element has this CSS class" (class is a space-separated list)"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Ways Letterboxd has marked up a poster over the years, newest first.
+# Like the old scraper, we use the first one that finds anything.
+_POSTER_QUERIES = [
+    etree.XPath(f"//div[{_has_class('poster')}]"),
+    etree.XPath(f"//div[{_has_class('film-poster')}]"),
+    etree.XPath(f"//li[{_has_class('posteritem')}]"),
+    etree.XPath("//div[@data-film-id]"),
+    etree.XPath(f"//li[{_has_class('poster-container')}]"),
+]
+
+_FIRST_IMG = etree.XPath("descendant::img[1]")
+_FIRST_LINK = etree.XPath("descendant::a[1]")
+_RATING_SPAN = etree.XPath("descendant::span[contains(@class, 'rating')][1]")
+_CONTAINER = etree.XPath("ancestor-or-self::li[1]")
+_PAGE_LINKS = etree.XPath(f"//div[{_has_class('paginate-pages')}]//a/text()")
+
+# Letterboxd always serves UTF-8. Without this, bytes from a page (or a
+# fragment) with no <meta charset> are read as Latin-1, which garbles the
+# ★ ratings and every non-ASCII title.
+_PARSER = html.HTMLParser(encoding='utf-8')
+
+_YEAR_IN_TITLE = re.compile(r'\((\d{4})\)')
+_RATED_CLASS = re.compile(r'\brated-(\d+)\b')
+_FILM_SLUG = re.compile(r'/film/([^/?#]+)')
+
+def _attr(element, *names):
+    """Returns the first non-empty attribute out of names, checking the element and then its parent"""
+    for node in (element, element.getparent()):
+        if node is None:
+            continue
+        for name in names:
+            value = node.get(name)
+            if value:
+                return value.strip()
+    return None
+
+def _parse_rating(element):
+    """
+    Reads the user's star rating for one poster, or None if they didn't rate it
+
+    The rating lives in <p class="poster-viewingdata"><span class="rating rated-9">★★★★½</span>,
+    which sits next to the poster inside its <li>, so we look in the poster
+    first and then in its container.
+    """
+    for node in (element, *_CONTAINER(element)):
+        spans = _RATING_SPAN(node)
+        if not spans:
+            continue
+        span = spans[0]
+        # rated-N class: N is the rating in half stars (rated-9 = 4.5)
+        class_match = _RATED_CLASS.search(span.get('class', ''))
+        if class_match:
+            return int(class_match.group(1)) / 2
+        # Otherwise count the stars: ★★★★½ = 4.5
+        text = span.text_content()
+        stars = text.count('★')
+        if '½' in text or '1/2' in text:
+            return stars + 0.5
+        if stars:
+            return float(stars)
+    return None
+
+def _parse_poster(element):
+    """Reads one poster element; returns a film dict or None if it has no title"""
+    imgs = _FIRST_IMG(element)
+    if not imgs:
+        return None
+    img = imgs[0]
+    links = _FIRST_LINK(element)
+    link = links[0] if links else None
+
+    # Title - link tooltip first (cleanest), then img alt / title, then data attributes
+    title = (link.get('data-original-title') or '').strip() if link is not None else ''
+    if not title:
+        title = (img.get('alt') or '').strip()
+        if title.startswith('Poster for '):
+            title = title[len('Poster for '):].strip()
+    if not title:
+        title = (img.get('title') or '').strip()
+    if not title:
+        title = _attr(element, 'data-film-name', 'data-item-name') or ''
+    if not title:
+        return None
+
+    # Year - "(2019)" at the end of the title, or a data attribute
+    year = None
+    year_match = _YEAR_IN_TITLE.search(title)
+    if year_match:
+        year = int(year_match.group(1))
+        title = title.replace(f'({year})', '').strip()
+    if not year:
+        year_attr = _attr(element, 'data-film-year', 'data-film-release-year')
+        if year_attr and year_attr.isdigit():
+            year = int(year_attr)
+
+    # Link and slug - the <a> if present, otherwise the data attributes Letterboxd uses for lazy posters
+    href = link.get('href') if link is not None else None
+    if not href:
+        href = _attr(element, 'data-target-link', 'data-item-link', 'data-film-link')
+    slug = _attr(element, 'data-film-slug', 'data-item-slug')
+    if not slug and href:
+        slug_match = _FILM_SLUG.search(href)
+        slug = slug_match.group(1) if slug_match else None
+    if href:
+        url = f"https://letterboxd.com{href}"
+    elif slug:
+        url = f"https://letterboxd.com/film/{slug}/"
+    else:
+        url = None
+
+    film_id = _attr(element, 'data-film-id')
+
+    return {
+        'title': title,
+        'year': year,
+        'slug': slug,
+        'film_id': int(film_id) if film_id and film_id.isdigit() else None,
+        'url': url,
+        'rating': _parse_rating(element)
+    }
+
+def parse_last_page(document):
+    """
+    Reads the last page number from a parsed page's pagination links
+
+    Letterboxd renders links to the first few pages and the last page
+    (e.g. 1 2 3 … 28), so the largest number is the page count.
+    Returns 1 when there's no pagination - everything fits on one page.
+    """
+    numbers = [int(text) for text in (t.strip() for t in _PAGE_LINKS(document)) if text.isdigit()]
+    return max(numbers, default=1)
+
+def parse_poster_grid(content):
+    """
+    Parses a Letterboxd film grid page
+
+    Args:
+        content: Raw HTML (bytes or str)
+
+    Returns:
+        (films, last_page) - films is a list of dicts in page order:
+        {'title', 'year', 'slug', 'film_id', 'url', 'rating'}
+        where rating is the user's rating shown on the poster (None if unrated)
+    """
+    if not content or not content.strip():
+        return [], 1
+    document = html.fromstring(content, parser=_PARSER)
+
+    films = []
+    for query in _POSTER_QUERIES:
+        elements = query(document)
+        if elements:
+            for element in elements:
+                film = _parse_poster(element)
+                if film is not None:
+                    films.append(film)
+            break
+
+    return films, parse_last_page(document)
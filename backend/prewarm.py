@@ -0,0 +1,265 @@
+"""
+Pre-warming Crawler
+Keeps popular users' cached profiles fresh so analyses don't start cold
+
+Every analysis records the usernames it was asked about (record_requests).
+Each user gets a popularity score: +1 per request, halving every
+PREWARM_HALF_LIFE seconds, so users people keep asking about stay on top
+and one-off lookups fade away.
+
+The crawler runs as its own process next to the web app and shares its
+cache database (set the same LETTERBOXD_CACHE_DB for both):
+    python backend/prewarm.py run            # loop forever
+    python backend/prewarm.py run --once     # one cycle, e.g. from cron
+    python backend/prewarm.py status         # who's tracked and how stale they are
+
+Every PREWARM_CYCLE seconds it picks the users whose data is older than
+PREWARM_REFRESH_AGE, most popular and stalest first, and re-scrapes them:
+rated lists, the watched list (incrementally, see letterboxd_scraper.py),
+their taste vector (see taste_vectors.py) and the average ratings of the
+films they loved most. Unchanged pages cost a
+304, so a refresh is usually cheap. It stops for the cycle once it has made
+PREWARM_BUDGET requests.
+
+Refreshing at half of PROFILE_CACHE_TTL means a foreground request for a
+popular user almost always finds fresh pages. The crawler's requests draw
+from the same shared rate limit as the web app's (see rate_limiter.py), so
+the two together never crawl Letterboxd faster than the configured budget.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import cache_db
+import metrics
+import profile_cache
+from film_metadata import get_films
+from letterboxd_scraper import get_user_movies, get_user_watched_movies
+
+# Seconds between crawl cycles
+PREWARM_CYCLE = int(os.getenv('PREWARM_CYCLE', '600'))
+# Most Letterboxd requests one cycle may make
+PREWARM_BUDGET = int(os.getenv('PREWARM_BUDGET', '2000'))
+# Refresh a user once their data is this old (default: half the profile cache TTL)
+PREWARM_REFRESH_AGE = int(os.getenv('PREWARM_REFRESH_AGE', str(profile_cache.PROFILE_CACHE_TTL // 2)))
+# A request's weight in the popularity score halves after this many seconds (default 7 days)
+PREWARM_HALF_LIFE = float(os.getenv('PREWARM_HALF_LIFE', str(7 * 24 * 3600)))
+# Users whose score has decayed below this are forgotten
+PREWARM_MIN_SCORE = float(os.getenv('PREWARM_MIN_SCORE', '0.1'))
+# Loved films per user whose average rating is kept warm
+PREWARM_FILMS_PER_USER = int(os.getenv('PREWARM_FILMS_PER_USER', '200'))
+
+# A never-warmed user counts as this many refresh ages stale
+MAX_STALENESS = 4.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prewarm_users (
+    username TEXT PRIMARY KEY,
+    score REAL NOT NULL,           -- popularity as of scored_at
+    scored_at REAL NOT NULL,
+    requested_at REAL NOT NULL,
+    warmed_at REAL,                -- last crawl, successful or not
+    last_error TEXT
+);
+"""
+
+def _connection():
+    cache_db.ensure_schema('prewarm', SCHEMA)
+    return cache_db.get_connection()
+
+def _decayed(score, scored_at, now):
+    return score * 0.5 ** (max(0.0, now - scored_at) / PREWARM_HALF_LIFE)
+
+def record_requests(usernames):
+    """Counts one analysis request for each user (called by the web app)"""
+    if not cache_db.CACHE_ENABLED:
+        return
+    now = time.time()
+    try:
+        conn = _connection()
+        for username in dict.fromkeys(name.lower() for name in usernames):
+            row = conn.execute('SELECT score, scored_at FROM prewarm_users WHERE username = ?', (username,)).fetchone()
+            score = 1.0 + (_decayed(row['score'], row['scored_at'], now) if row is not None else 0.0)
+            conn.execute(
+                'INSERT INTO prewarm_users (username, score, scored_at, requested_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (username) DO UPDATE SET score = excluded.score, scored_at = excluded.scored_at, '
+                'requested_at = excluded.requested_at',
+                (username, score, now, now)
+            )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Couldn't record request for pre-warming: {e}")
+
+def tracked_users(now=None):
+    """
+    Every tracked user with their score and data age, most urgent first
+
+    Returns:
+        List of dicts with 'username', 'score', 'age' (seconds since their
+        data was last refreshed, None if never), 'due', 'priority' and
+        'last_error'. Users whose score has faded out are deleted.
+    """
+    if not cache_db.CACHE_ENABLED:
+        return []
+    now = now or time.time()
+    try:
+        conn = _connection()
+        rows = conn.execute('SELECT * FROM prewarm_users').fetchall()
+    except sqlite3.Error as e:
+        print(f"  Couldn't read pre-warming users: {e}")
+        return []
+
+    refreshed = profile_cache.snapshot_times('watched')
+    users = []
+    forgotten = []
+    for row in rows:
+        score = _decayed(row['score'], row['scored_at'], now)
+        if score < PREWARM_MIN_SCORE:
+            forgotten.append(row['username'])
+            continue
+        # A foreground analysis refreshes the snapshot too, so use whichever is newer
+        last_refresh = max(row['warmed_at'] or 0.0, refreshed.get(row['username'], 0.0))
+        age = now - last_refresh if last_refresh else None
+        staleness = MAX_STALENESS if age is None else min(MAX_STALENESS, age / max(PREWARM_REFRESH_AGE, 1))
+        users.append({
+            'username': row['username'],
+            'score': score,
+            'age': age,
+            'due': age is None or age >= PREWARM_REFRESH_AGE,
+            'priority': score * staleness,
+            'last_error': row['last_error']
+        })
+
+    if forgotten:
+        try:
+            conn.executemany('DELETE FROM prewarm_users WHERE username = ?', [(username,) for username in forgotten])
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"  Couldn't forget faded pre-warming users: {e}")
+
+    users.sort(key=lambda user: -user['priority'])
+    return users
+
+def _mark_warmed(username, error=None):
+    try:
+        conn = _connection()
+        conn.execute(
+            'UPDATE prewarm_users SET warmed_at = ?, last_error = ? WHERE username = ?',
+            (time.time(), error, username)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Couldn't update pre-warming state for {username}: {e}")
+
+def warm_user(username, max_films=None):
+    """
+    Refreshes one user's cached rated list, watched list, taste vector and loved films' averages
+
+    Args:
+        max_films: Most loved films to look up (defaults to PREWARM_FILMS_PER_USER)
+
+    Returns:
+        True if the user's lists were refreshed
+    """
+    max_films = PREWARM_FILMS_PER_USER if max_films is None else max_films
+    try:
+        # Anything older than the refresh age is revalidated now rather than
+        # left to expire in front of a user
+        with profile_cache.max_age(PREWARM_REFRESH_AGE):
+            movies = get_user_movies(username)
+            watched = get_user_watched_movies(username)
+    except Exception as e:
+        print(f"  Couldn't warm {username}: {e}")
+        _mark_warmed(username, error=str(e))
+        return False
+
+    # Folding in a vector means loading the index, so it's done here rather
+    # than on every foreground scrape
+    try:
+        # Imported here: it pulls in NumPy/SciPy, and only matters once an index is built
+        import taste_vectors
+        taste_vectors.update_user(username, watched)
+    except Exception as e:
+        print(f"  Couldn't update taste vector for {username}: {e}")
+
+    # "Both enjoyed" looks up the average rating of films rated 4+; the
+    # best-rated ones are the likeliest to be shared with someone
+    loved = sorted(
+        (movie for movie in movies.values() if (movie.get('rating') or 0) >= 4.0 and movie.get('url')),
+        key=lambda movie: -movie['rating']
+    )
+    if max_films > 0:
+        get_films([movie['url'] for movie in loved[:max_films]])
+
+    _mark_warmed(username)
+    return True
+
+def run_cycle(budget=None):
+    """
+    Warms the due users in priority order until the request budget is spent
+
+    Returns:
+        Dictionary with 'warmed', 'failed', 'skipped' (due users left for the
+        next cycle) and 'requests'
+    """
+    budget = PREWARM_BUDGET if budget is None else budget
+    start = metrics.total('letterboxd_http_requests_total')
+    due = [user for user in tracked_users() if user['due']]
+    summary = {'warmed': 0, 'failed': 0, 'skipped': 0, 'requests': 0}
+
+    for i, user in enumerate(due):
+        remaining = budget - (metrics.total('letterboxd_http_requests_total') - start)
+        if remaining <= 0:
+            summary['skipped'] = len(due) - i
+            break
+        print(f"Warming {user['username']} (score {user['score']:.1f})...")
+        if warm_user(user['username'], max_films=min(PREWARM_FILMS_PER_USER, remaining)):
+            summary['warmed'] += 1
+        else:
+            summary['failed'] += 1
+
+    summary['requests'] = metrics.total('letterboxd_http_requests_total') - start
+    return summary
+
+def run(once=False, budget=None):
+    """Runs crawl cycles every PREWARM_CYCLE seconds (or just one)"""
+    while True:
+        started = time.time()
+        summary = run_cycle(budget)
+        print(f"Pre-warm cycle: {summary['warmed']} warmed, {summary['failed']} failed, "
+              f"{summary['skipped']} left for later, {summary['requests']} requests")
+        if once:
+            return summary
+        time.sleep(max(0.0, PREWARM_CYCLE - (time.time() - started)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keep popular users\' cached profiles fresh')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_command = commands.add_parser('run', help='Crawl due users every PREWARM_CYCLE seconds')
+    run_command.add_argument('--once', action='store_true', help='Run a single cycle and exit')
+    run_command.add_argument('--budget', type=int, help='Most requests per cycle (default PREWARM_BUDGET)')
+
+    status_command = commands.add_parser('status', help='List tracked users, most urgent first')
+    status_command.add_argument('-n', type=int, default=20)
+
+    add_command = commands.add_parser('add', help='Start tracking users (counts as one request each)')
+    add_command.add_argument('usernames', nargs='+')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(once=args.once, budget=args.budget)
+    elif args.command == 'add':
+        record_requests(args.usernames)
+    else:
+        for user in tracked_users()[:args.n]:
+            age = 'never' if user['age'] is None else f"{user['age'] / 60:.0f} min ago"
+            error = f"  last error: {user['last_error']}" if user['last_error'] else ''
+            print(f"{user['username']:<24} score={user['score']:.2f} refreshed {age}"
+                  f"{' (due)' if user['due'] else ''}{error}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
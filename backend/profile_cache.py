@@ -0,0 +1,270 @@
+"""
+Profile Cache Module
+Remembers scraped Letterboxd pages so repeat analyses don't re-scrape users
+
+Each film grid page (e.g. /username/films/page/3/) is stored already parsed,
+keyed by its URL and tagged with the username it belongs to. A fresh entry
+skips both the network request and the HTML parsing. A stale entry is
+revalidated with the ETag / Last-Modified headers Letterboxd sent last time,
+so an unchanged page costs one cheap 304 response.
+
+We also keep a snapshot of each user's whole film list, which lets the
+scraper refresh it incrementally instead of re-reading every page. Snapshots
+are the big entries (thousands of films), so they're stored in the compact
+binary form from user_profile.py rather than as JSON.
+"""
+from contextlib import contextmanager
+import contextvars
+import json
+import os
+import sqlite3
+import time
+
+import cache_db
+from user_profile import UserProfile
+
+# How long (seconds) a cached page is trusted without asking Letterboxd again
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '3600'))
+
+# How long (seconds) incremental refreshes may build on a snapshot before we
+# re-crawl the whole list (catches deleted films and re-rated old films)
+PROFILE_FULL_REFRESH_TTL = int(os.getenv('PROFILE_FULL_REFRESH_TTL', str(7 * 24 * 3600)))
+
+# Bump this when the shape of the stored movies changes; entries written in
+# another format are treated as missing and re-scraped.
+# 2: movies keyed by film slug instead of title
+CACHE_FORMAT = 2
+
+# Overrides PROFILE_CACHE_TTL inside a max_age() block
+_max_age = contextvars.ContextVar('profile_cache_max_age', default=None)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile_pages (
+    url TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    movies TEXT NOT NULL,
+    last_page INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS profile_pages_username ON profile_pages (username);
+CREATE TABLE IF NOT EXISTS profile_snapshots (
+    username TEXT NOT NULL,
+    list_name TEXT NOT NULL,
+    movies TEXT NOT NULL, -- UserProfile.to_bytes() blob (JSON in older caches)
+    fetched_at REAL NOT NULL,
+    full_refresh_at REAL NOT NULL,
+    PRIMARY KEY (username, list_name)
+);
+"""
+
+def _connection():
+    cache_db.ensure_schema('profile_cache', SCHEMA)
+    return cache_db.get_connection()
+
+def _dump_movies(movies):
+    return json.dumps({'format': CACHE_FORMAT, 'movies': movies})
+
+def _load_movies(text):
+    """Decodes stored movies, or returns None if they were written in an older format"""
+    stored = json.loads(text)
+    if not isinstance(stored, dict) or stored.get('format') != CACHE_FORMAT:
+        return None
+    return stored['movies']
+
+def _load_snapshot_movies(stored):
+    """Decodes a stored snapshot (binary profile, or JSON from an older version)"""
+    if isinstance(stored, bytes):
+        try:
+            return UserProfile.from_bytes(stored).to_movies()
+        except ValueError:
+            return None
+    return _load_movies(stored)
+
+def _page_key(url):
+    # Letterboxd usernames are case-insensitive, so /Steven/ and /steven/ are the same page
+    return url.lower()
+
+def get_page(url):
+    """
+    Looks up a cached page
+
+    Returns:
+        Dictionary with 'movies', 'last_page', 'etag', 'last_modified' and
+        'fetched_at', or None if the page isn't cached
+    """
+    if not cache_db.CACHE_ENABLED:
+        return None
+    try:
+        row = _connection().execute(
+            'SELECT movies, last_page, etag, last_modified, fetched_at FROM profile_pages WHERE url = ?',
+            (_page_key(url),)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"  Cache read failed for {url}: {e}")
+        return None
+
+    movies = _load_movies(row['movies']) if row is not None else None
+    if movies is None:
+        return None
+    return {
+        'movies': movies,
+        'last_page': row['last_page'],
+        'etag': row['etag'],
+        'last_modified': row['last_modified'],
+        'fetched_at': row['fetched_at']
+    }
+
+@contextmanager
+def max_age(seconds):
+    """
+    Treats cached pages and snapshots older than seconds as stale inside the with block
+
+    The pre-warming crawler uses this to revalidate users before their
+    entries expire for everyone else. Worker threads see the setting when
+    their work is wrapped with metrics.in_context().
+    """
+    token = _max_age.set(seconds)
+    try:
+        yield
+    finally:
+        _max_age.reset(token)
+
+def is_fresh(entry, ttl=None):
+    """Checks whether a cached page or snapshot is young enough to use without revalidating"""
+    if ttl is None:
+        ttl = _max_age.get()
+    if ttl is None:
+        ttl = PROFILE_CACHE_TTL
+    return entry is not None and time.time() - entry['fetched_at'] < ttl
+
+def conditional_headers(entry):
+    """Builds If-None-Match / If-Modified-Since headers from a cached page"""
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def put_page(url, username, movies, last_page, etag=None, last_modified=None):
+    """Stores a freshly parsed page"""
+    if not cache_db.CACHE_ENABLED:
+        return
+    try:
+        conn = _connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO profile_pages (url, username, movies, last_page, etag, last_modified, fetched_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (_page_key(url), username.lower(), _dump_movies(movies), last_page, etag, last_modified, time.time())
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Cache write failed for {url}: {e}")
+
+def touch_page(url):
+    """Marks a cached page as fresh again (Letterboxd answered 304 Not Modified)"""
+    if not cache_db.CACHE_ENABLED:
+        return
+    try:
+        conn = _connection()
+        conn.execute('UPDATE profile_pages SET fetched_at = ? WHERE url = ?', (time.time(), _page_key(url)))
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Cache write failed for {url}: {e}")
+
+def get_snapshot(username, list_name):
+    """
+    Looks up the stored snapshot of a user's film list
+
+    Args:
+        list_name: Which list, e.g. 'watched'
+
+    Returns:
+        Dictionary with 'movies', 'fetched_at' and 'full_refresh_at', or None
+    """
+    if not cache_db.CACHE_ENABLED:
+        return None
+    try:
+        row = _connection().execute(
+            'SELECT movies, fetched_at, full_refresh_at FROM profile_snapshots WHERE username = ? AND list_name = ?',
+            (username.lower(), list_name)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"  Cache read failed for {username}'s {list_name} snapshot: {e}")
+        return None
+
+    movies = _load_snapshot_movies(row['movies']) if row is not None else None
+    if movies is None:
+        return None
+    return {
+        'movies': movies,
+        'fetched_at': row['fetched_at'],
+        'full_refresh_at': row['full_refresh_at']
+    }
+
+def list_snapshot_users(list_name):
+    """Usernames that have a stored snapshot of the given list (e.g. 'watched')"""
+    if not cache_db.CACHE_ENABLED:
+        return []
+    try:
+        rows = _connection().execute(
+            'SELECT username FROM profile_snapshots WHERE list_name = ? ORDER BY username', (list_name,)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"  Cache read failed for {list_name} snapshots: {e}")
+        return []
+    return [row['username'] for row in rows]
+
+def snapshot_times(list_name):
+    """When each user's snapshot of a list was last refreshed: {username: fetched_at}"""
+    if not cache_db.CACHE_ENABLED:
+        return {}
+    try:
+        rows = _connection().execute(
+            'SELECT username, fetched_at FROM profile_snapshots WHERE list_name = ?', (list_name,)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"  Cache read failed for {list_name} snapshots: {e}")
+        return {}
+    return {row['username']: row['fetched_at'] for row in rows}
+
+def needs_full_refresh(snapshot):
+    """Checks whether a snapshot is too old to keep refreshing incrementally"""
+    return time.time() - snapshot['full_refresh_at'] >= PROFILE_FULL_REFRESH_TTL
+
+def put_snapshot(username, list_name, movies, full_refresh_at=None):
+    """
+    Stores a snapshot of a user's film list
+
+    Args:
+        full_refresh_at: When the list was last crawled in full. Leave as None
+            when this snapshot *is* a full crawl.
+    """
+    if not cache_db.CACHE_ENABLED:
+        return
+    now = time.time()
+    try:
+        conn = _connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO profile_snapshots (username, list_name, movies, fetched_at, full_refresh_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (username.lower(), list_name, UserProfile.from_movies(movies).to_bytes(), now, full_refresh_at or now)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Cache write failed for {username}'s {list_name} snapshot: {e}")
+
+def clear_user(username):
+    """Forgets every cached page and snapshot for a user"""
+    if not cache_db.CACHE_ENABLED:
+        return
+    try:
+        conn = _connection()
+        conn.execute('DELETE FROM profile_pages WHERE username = ?', (username.lower(),))
+        conn.execute('DELETE FROM profile_snapshots WHERE username = ?', (username.lower(),))
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Cache clear failed for {username}: {e}")
@@ -0,0 +1,206 @@
+"""
+Rate Limiter Module
+Adaptive per-host politeness budget, shared by every thread and process
+
+Each host gets a token bucket: it refills at `rate` tokens per second up to
+RATE_BURST tokens, and every request spends one. When the bucket is empty a
+request reserves the next token and sleeps until it's due, so workers queue
+up instead of all retrying at once.
+
+The rate adapts to how Letterboxd responds ("AIMD", like TCP):
+- a 429 Too Many Requests halves the rate (multiplicative decrease), and a
+  Retry-After header pauses the host for everyone until it has passed
+- every second without one adds RATE_RECOVERY requests/second back
+  (additive increase), up to the configured top speed
+
+So the crawl settles just under the rate Letterboxd will accept, instead of
+using one fixed delay that's either too slow or too fast.
+
+LEARNING NOTE: The bucket lives in a table in the cache database, so the
+Flask workers, the job threads and any command-line crawl all draw from the
+same budget. Each update runs in a BEGIN IMMEDIATE transaction, which makes
+SQLite hand the buckets to one process at a time. If the database can't be
+used (LETTERBOXD_CACHE=0, or it's locked for too long) the bucket falls back
+to this process's memory.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import cache_db
+import metrics
+
+# Largest burst of back-to-back requests once a host has been quiet
+RATE_BURST = float(os.getenv('LETTERBOXD_RATE_BURST', '5'))
+# Slowest the limiter will go after repeated 429s (requests/second)
+RATE_MIN = float(os.getenv('LETTERBOXD_RATE_MIN', '0.5'))
+# Requests/second added back for every second without a 429
+RATE_RECOVERY = float(os.getenv('LETTERBOXD_RATE_RECOVERY', '0.2'))
+# A 429 multiplies the rate by this
+RATE_DECREASE = 0.5
+# 429s that arrive within this many seconds of a slowdown are the same
+# burst being answered, so they don't slow the rate down again
+DECREASE_COOLDOWN = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    host TEXT PRIMARY KEY,
+    rate REAL NOT NULL,            -- current requests/second
+    tokens REAL NOT NULL,          -- negative when requests are queued for future tokens
+    updated_at REAL NOT NULL,
+    blocked_until REAL NOT NULL,   -- from Retry-After; nobody starts a request before this
+    decreased_at REAL NOT NULL     -- when the rate was last cut
+);
+"""
+
+_local = threading.local()
+
+def _connection():
+    """
+    This thread's own connection to the cache database
+
+    It's separate from cache_db.get_connection() and in autocommit mode, so
+    the bucket's BEGIN IMMEDIATE ... COMMIT never mixes with another
+    module's open transaction.
+    """
+    cache_db.ensure_schema('rate_limiter', SCHEMA)
+    path = cache_db.get_db_path()
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        connections[path] = conn
+    return conn
+
+def _new_bucket(max_rate, now):
+    return {'rate': max_rate, 'tokens': RATE_BURST, 'updated_at': now, 'blocked_until': 0.0, 'decreased_at': 0.0}
+
+def _advance(bucket, max_rate, now):
+    """Refills the bucket and recovers the rate for the time since it was last touched"""
+    # Nothing refills or recovers while the host is paused by a Retry-After
+    since = max(bucket['updated_at'], bucket['blocked_until'])
+    elapsed = max(0.0, now - since)
+    bucket['rate'] = min(max_rate, bucket['rate'] + RATE_RECOVERY * elapsed)
+    bucket['tokens'] = min(RATE_BURST, bucket['tokens'] + bucket['rate'] * elapsed)
+    bucket['updated_at'] = max(bucket['updated_at'], now)
+
+def _reserve(bucket, max_rate, now):
+    """Takes one token; returns how long to sleep before it's ours"""
+    _advance(bucket, max_rate, now)
+    bucket['tokens'] -= 1
+    wait = max(0.0, bucket['blocked_until'] - now)
+    if bucket['tokens'] < 0:
+        wait += -bucket['tokens'] / bucket['rate']
+    return wait
+
+def _slow_down(bucket, max_rate, now, retry_after):
+    """Applies a 429: cuts the rate, empties the bucket and honors Retry-After"""
+    _advance(bucket, max_rate, now)
+    if now - bucket['decreased_at'] >= DECREASE_COOLDOWN:
+        bucket['rate'] = max(min(RATE_MIN, max_rate), bucket['rate'] * RATE_DECREASE)
+        bucket['decreased_at'] = now
+    bucket['tokens'] = min(bucket['tokens'], 0.0)
+    if retry_after:
+        bucket['blocked_until'] = max(bucket['blocked_until'], now + retry_after)
+    return bucket['rate']
+
+class AdaptiveLimiter:
+    """
+    Politeness budget for a single host
+
+    Use it as a context manager around a request: it waits for one of this
+    process's max_concurrent slots, then for a token from the shared bucket.
+    Call slow_down() when the host answers 429.
+
+    Args:
+        host: Host name the bucket is stored under
+        max_concurrent: Requests this process may have in flight to the host
+        max_rate: Top speed in requests/second (0 means no rate limit - only
+            the concurrency cap and Retry-After pauses apply)
+    """
+
+    def __init__(self, host, max_concurrent, max_rate):
+        self.host = host
+        self.max_rate = max_rate
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._bucket = None   # used when the database isn't available
+
+    def _update(self, change):
+        """Runs change(bucket, max_rate, now) on the shared bucket and saves it"""
+        now = time.time()
+        max_rate = self.max_rate or float('inf')
+        if cache_db.CACHE_ENABLED:
+            try:
+                return self._update_stored(change, max_rate, now)
+            except sqlite3.Error as e:
+                print(f"  Shared rate limit unavailable, using this process's own: {e}")
+        with self._lock:
+            if self._bucket is None:
+                self._bucket = _new_bucket(max_rate, now)
+            return change(self._bucket, max_rate, now)
+
+    def _update_stored(self, change, max_rate, now):
+        conn = _connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT rate, tokens, updated_at, blocked_until, decreased_at FROM rate_limits WHERE host = ?',
+                (self.host,)
+            ).fetchone()
+            bucket = dict(row) if row is not None else _new_bucket(max_rate, now)
+            result = change(bucket, max_rate, now)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits (host, rate, tokens, updated_at, blocked_until, decreased_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.host, bucket['rate'], bucket['tokens'], bucket['updated_at'],
+                 bucket['blocked_until'], bucket['decreased_at'])
+            )
+            conn.execute('COMMIT')
+            return result
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def __enter__(self):
+        self._slots.acquire()
+        try:
+            if self.max_rate:
+                wait = self._update(_reserve)
+            else:
+                # No rate limit, but a Retry-After pause still applies
+                wait = self._update(lambda bucket, max_rate, now: max(0.0, bucket['blocked_until'] - now))
+            if wait > 0:
+                time.sleep(wait)
+        except BaseException:
+            self._slots.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._slots.release()
+        return False
+
+    def slow_down(self, retry_after=None):
+        """
+        Tells every worker to back off after a 429
+
+        Args:
+            retry_after: Seconds from the response's Retry-After header, if any
+
+        Returns:
+            The new rate in requests/second
+        """
+        metrics.count('letterboxd_rate_limited_total')
+        return self._update(lambda bucket, max_rate, now: _slow_down(bucket, max_rate, now, retry_after))
+
+    def current_rate(self):
+        """The shared bucket's rate right now, in requests/second"""
+        def read(bucket, max_rate, now):
+            _advance(bucket, max_rate, now)
+            return bucket['rate']
+        return self._update(read)
@@ -4,178 +4,199 @@ This module contains the logic for generating movie recommendations
 
 LEARNING NOTE: This uses collaborative filtering - comparing what users
 have in common to make predictions about what they'll like.
+
+The comparisons run on NumPy arrays (see compare_profiles): a condition like
+"both rated 4+" becomes a boolean mask over two aligned rating arrays,
+computed for every film at once instead of one film at a time in a loop.
 """
 from collections import Counter
-from letterboxd_scraper import get_movie_average_rating
+import os
 
-def generate_recommendations(user1_movies, user2_movies, user1_watched=None, user2_watched=None):
+import numpy as np
+
+from film_metadata import get_average_ratings
+import metrics
+from user_profile import as_profile
+
+# Ratings in half stars, the unit UserProfile stores them in (see user_profile.py)
+FIVE_STARS = 10
+ENJOYED_MIN = 8      # 4.0 stars
+RECOMMEND_MIN = 9    # 4.5 stars
+HATED_MAX = 2        # 1.0 stars
+SECTION_LIMIT = 10
+
+# Where new_suggestions come from: 'ai' (default), 'local' (the item
+# similarity index, see item_similarity.py) or 'hybrid' (the index picks
+# candidates and the AI chooses among them)
+NEW_SUGGESTIONS_SOURCE = os.getenv('NEW_SUGGESTIONS_SOURCE', 'ai').lower()
+# How many local candidates the AI chooses from in hybrid mode
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '30'))
+
+# Key order of the response returned by generate_recommendations
+SECTIONS = ['both_enjoyed', 'both_hated', 'user1_recommends', 'user2_recommends', 'new_suggestions', 'stats']
+
+def top_k(sort_keys, k):
     """
-    Generates three types of recommendations:
-    1. Movies both watched and enjoyed
-    2. Movies one watched that the other would enjoy
-    3. Movies neither has seen but would enjoy
+    Positions of the k smallest values in sort_keys, smallest first
+    
+    np.argpartition finds the k smallest in linear time without sorting the
+    rest; only those k are then sorted. sort_keys must be unique (callers
+    build them with a tie-breaker folded in) so the result is deterministic.
+    """
+    if len(sort_keys) > k:
+        candidates = np.argpartition(sort_keys, k - 1)[:k]
+    else:
+        candidates = np.arange(len(sort_keys))
+    return candidates[np.argsort(sort_keys[candidates])]
+
+def _enjoyed_priorities(ratings1, ratings2):
+    """
+    Priority group for each movie both users enjoyed (lower = shown first)
+    1: both rated 5.0
+    2: one rated 5.0, the other 4.5 or 4.0
+    3: both rated 4.5 or 4.0
+    """
+    five1 = ratings1 == FIVE_STARS
+    five2 = ratings2 == FIVE_STARS
+    return np.where(five1 & five2, 1, np.where(five1 | five2, 2, 3))
+
+def _rank_both_enjoyed(both_enjoyed, priorities, limit=None):
+    """
+    Sorts "both enjoyed" movies by priority group, then by Letterboxd average
+    
+    Average ratings cost a film page request each, so we walk the groups in
+    priority order and stop once `limit` movies are settled - groups that
+    can't reach the top never get looked up. Each group's averages are
+    fetched together in one concurrent batch.
     
     Args:
-        user1_movies: Dict of {movie_title: {rating, year, url}} - rated movies (for comparisons)
-        user2_movies: Dict of {movie_title: {rating, year, url}} - rated movies (for comparisons)
-        user1_watched: Dict of {movie_title: {rating, year, url}} - all watched movies (for recommendations)
-        user2_watched: Dict of {movie_title: {rating, year, url}} - all watched movies (for recommendations)
+        both_enjoyed: List of movie dicts with user1_rating / user2_rating / url
+        priorities: Priority group of each movie (see _enjoyed_priorities)
+        limit: Keep only this many movies (None keeps them all)
+    """
+    ranked = []
+    for priority in np.unique(priorities).tolist():
+        if limit is not None and len(ranked) >= limit:
+            break
+        group = [both_enjoyed[i] for i in np.flatnonzero(priorities == priority)]
+        with metrics.span('recommend.average_ratings'):
+            averages = get_average_ratings([movie.get('url') for movie in group])
+        # Lower average = less popular = higher priority
+        # Use 5.0 as default if we can't fetch (treat as popular)
+        group.sort(key=lambda movie: averages.get(movie.get('url'), 5.0))
+        ranked.extend(group)
+    
+    return ranked[:limit] if limit is not None else ranked
+
+def compare_profiles(profile1, profile2, watched1=None, watched2=None):
+    """
+    Does all the matching for a pair of users with array operations
+    
+    This is the network-free core of the recommender: every section is a
+    boolean mask over aligned rating vectors, and the top 10s are picked with
+    top_k instead of sorting whole lists. Running it for many pairs only
+    costs a handful of NumPy calls each.
+    
+    Args:
+        profile1, profile2: Rated movies as UserProfiles
+        watched1, watched2: Watched movies as UserProfiles (default to the rated ones)
     
     Returns:
-        Dictionary with recommendation categories
+        Dictionary of array positions, in display order:
+        - 'both_enjoyed': (positions in profile1, positions in profile2, priorities),
+          every match - the final order needs Letterboxd averages
+        - 'both_hated': (positions in profile1, positions in profile2), top 10
+        - 'user1_recommends' / 'user2_recommends': positions in profile1 / profile2, top 10
+        - 'common_watched': number of films both have watched
     """
-    # Use watched lists if provided, otherwise fall back to rated lists
-    if user1_watched is None:
-        user1_watched = user1_movies
-    if user2_watched is None:
-        user2_watched = user2_movies
+    watched1 = profile1 if watched1 is None else watched1
+    watched2 = profile2 if watched2 is None else watched2
     
-    # Convert to sets for easier comparison
-    # Use rated movies for "both loved" and "both hated" comparisons
-    user1_titles = set(user1_movies.keys())
-    user2_titles = set(user2_movies.keys())
+    # Align the two rated lists: ratings1[i] and ratings2[i] are the same film
+    _, index1, index2 = profile1.intersect(profile2)
+    ratings1 = profile1.ratings[index1]
+    ratings2 = profile2.ratings[index2]
     
-    # Use watched movies for checking "hasn't seen" in recommendations
-    user1_watched_titles = set(user1_watched.keys())
-    user2_watched_titles = set(user2_watched.keys())
-    
-    # 1. Movies both watched and enjoyed (4+ stars)
-    both_watched = user1_titles & user2_titles
-    both_enjoyed = []
-    for title in both_watched:
-        rating1 = user1_movies[title].get('rating')
-        rating2 = user2_movies[title].get('rating')
-        # Handle None values - convert to 0 for comparison
-        rating1 = rating1 if rating1 is not None else 0
-        rating2 = rating2 if rating2 is not None else 0
-        # Both rated 4+ stars
-        if rating1 >= 4.0 and rating2 >= 4.0:
-            both_enjoyed.append({
-                'title': title,
-                'user1_rating': rating1,
-                'user2_rating': rating2,
-                'year': user1_movies[title].get('year'),
-                'url': user1_movies[title].get('url')
-            })
-    
-    # Sort and limit based on count
-    if len(both_enjoyed) <= 10:
-        # If 10 or fewer, prioritize both 5.0, then sort by Letterboxd average (lower = less popular)
-        def get_sort_key(movie):
-            r1 = movie['user1_rating']
-            r2 = movie['user2_rating']
-            
-            # Group 1: Both 5.0 (highest priority)
-            if r1 == 5.0 and r2 == 5.0:
-                # Fetch Letterboxd average rating for sorting (lower = less popular = higher priority)
-                letterboxd_avg = get_movie_average_rating(movie.get('url'))
-                # Use 5.0 as default if we can't fetch (treat as popular)
-                letterboxd_avg = letterboxd_avg if letterboxd_avg is not None else 5.0
-                return (1, letterboxd_avg)  # Lower number = higher priority, lower avg = less popular
-            # Group 2: One is 5.0, other is 4.5 or 4.0
-            elif (r1 == 5.0 and r2 in [4.5, 4.0]) or (r2 == 5.0 and r1 in [4.5, 4.0]):
-                letterboxd_avg = get_movie_average_rating(movie.get('url'))
-                letterboxd_avg = letterboxd_avg if letterboxd_avg is not None else 5.0
-                return (2, letterboxd_avg)
-            # Group 3: Both are 4.5 or 4.0 (lowest priority within 4+ range)
-            else:
-                letterboxd_avg = get_movie_average_rating(movie.get('url'))
-                letterboxd_avg = letterboxd_avg if letterboxd_avg is not None else 5.0
-                return (3, letterboxd_avg)
-        
-        both_enjoyed.sort(key=get_sort_key)
-    else:
-        # If more than 10, prioritize and limit to 10
-        def get_priority(movie):
-            r1 = movie['user1_rating']
-            r2 = movie['user2_rating']
-            
-            # Group 1: Both 5.0 (highest priority)
-            if r1 == 5.0 and r2 == 5.0:
-                # Fetch Letterboxd average rating for sorting (lower = less popular = higher priority)
-                letterboxd_avg = get_movie_average_rating(movie.get('url'))
-                # Use 5.0 as default if we can't fetch (treat as popular)
-                letterboxd_avg = letterboxd_avg if letterboxd_avg is not None else 5.0
-                return (1, letterboxd_avg)  # Lower number = higher priority, lower avg = less popular
-            # Group 2: One is 5.0, other is 4.5 or 4.0
-            elif (r1 == 5.0 and r2 in [4.5, 4.0]) or (r2 == 5.0 and r1 in [4.5, 4.0]):
-                letterboxd_avg = get_movie_average_rating(movie.get('url'))
-                letterboxd_avg = letterboxd_avg if letterboxd_avg is not None else 5.0
-                return (2, letterboxd_avg)
-            # Group 3: Both are 4.5 or 4.0 (lowest priority within 4+ range)
-            else:
-                letterboxd_avg = get_movie_average_rating(movie.get('url'))
-                letterboxd_avg = letterboxd_avg if letterboxd_avg is not None else 5.0
-                return (3, letterboxd_avg)
-        
-        both_enjoyed.sort(key=get_priority)
-        both_enjoyed = both_enjoyed[:10]  # Limit to 10
+    # Both rated 4+ stars (unrated is 0, so it never qualifies)
+    enjoyed = (ratings1 >= ENJOYED_MIN) & (ratings2 >= ENJOYED_MIN)
     
-    # 1b. Movies both hated (1.0 or 0.5 stars only - exclude 0.0 and None)
+    # Both rated 1.0 or 0.5 - worst (lowest combined rating) first
     # Letterboxd doesn't recognize 0 stars as a valid rating
-    both_hated = []
-    for title in both_watched:
-        rating1 = user1_movies[title].get('rating')
-        rating2 = user2_movies[title].get('rating')
-        # Exclude if either rating is None (as per plan)
-        if rating1 is not None and rating2 is not None:
-            # Both rated 1.0 or below, but exclude 0.0 (only 0.5 and 1.0)
-            if rating1 > 0.0 and rating1 <= 1.0 and rating2 > 0.0 and rating2 <= 1.0:
-                both_hated.append({
-                    'title': title,
-                    'user1_rating': rating1,
-                    'user2_rating': rating2,
-                    'year': user1_movies[title].get('year'),
-                    'url': user1_movies[title].get('url')
-                })
-    
-    # Sort by average rating (lowest first - worst movies at top)
-    both_hated.sort(key=lambda x: ((x['user1_rating'] or 0) + (x['user2_rating'] or 0)) / 2)
-    both_hated = both_hated[:10]  # Limit to 10
-    
-    # 2. Movies user1 watched that user2 would enjoy
-    # Find movies user1 ranked 4.5 or 5 that user2 hasn't seen
-    user1_recommends = []
-    for title, data in user1_movies.items():
-        rating = data.get('rating')
-        # Handle None values
-        rating = rating if rating is not None else 0
-        # Filter for movies rated 4.5 or 5.0 (4.5+)
-        # Check if user2 hasn't watched it (using watched list)
-        if title not in user2_watched_titles and rating >= 4.5:
-            user1_recommends.append({
-                'title': title,
-                'rating': rating,
-                'year': data.get('year'),
-                'url': data.get('url')
-            })
-    
-    user1_recommends.sort(key=lambda x: x['rating'] or 0, reverse=True)
-    user1_recommends = user1_recommends[:10]  # Top 10
-    
-    # 3. Movies user2 watched that user1 would enjoy
-    # Find movies user2 ranked 4.5 or 5 that user1 hasn't seen
-    user2_recommends = []
-    for title, data in user2_movies.items():
-        rating = data.get('rating')
-        # Handle None values
-        rating = rating if rating is not None else 0
-        # Filter for movies rated 4.5 or 5.0 (4.5+)
-        # Check if user1 hasn't watched it (using watched list)
-        if title not in user1_watched_titles and rating >= 4.5:
-            user2_recommends.append({
-                'title': title,
-                'rating': rating,
-                'year': data.get('year'),
-                'url': data.get('url')
-            })
-    
-    user2_recommends.sort(key=lambda x: x['rating'] or 0, reverse=True)
-    user2_recommends = user2_recommends[:10]  # Top 10
-    
-    # 4. Movies neither has seen but would enjoy (AI-powered)
+    hated = np.flatnonzero((ratings1 > 0) & (ratings1 <= HATED_MAX) & (ratings2 > 0) & (ratings2 <= HATED_MAX))
+    combined = ratings1[hated].astype(np.int64) + ratings2[hated]
+    hated = hated[top_k(combined * len(hated) + np.arange(len(hated)), SECTION_LIMIT)]
+    
+    def recommends(profile, other_watched):
+        # Rated 4.5+ and not on the other user's watched list,
+        # highest rated first and list order within a rating
+        candidates = np.flatnonzero((profile.ratings >= RECOMMEND_MIN) & profile.difference(other_watched))
+        sort_keys = (FIVE_STARS - profile.ratings[candidates].astype(np.int64)) * len(profile) + profile.positions[candidates]
+        return candidates[top_k(sort_keys, SECTION_LIMIT)]
+    
+    return {
+        'both_enjoyed': (index1[enjoyed], index2[enjoyed], _enjoyed_priorities(ratings1[enjoyed], ratings2[enjoyed])),
+        'both_hated': (index1[hated], index2[hated]),
+        'user1_recommends': recommends(profile1, watched2),
+        'user2_recommends': recommends(profile2, watched1),
+        'common_watched': len(watched1.intersect(watched2)[0])
+    }
+
+def _pair_rows(profile1, profile2, positions1, positions2):
+    """Builds the both_enjoyed / both_hated result dicts for matched films"""
+    rows = []
+    for i, j in zip(positions1.tolist(), positions2.tolist()):
+        film = profile1.film(i)
+        rows.append({
+            'title': film['title'],
+            'user1_rating': film['rating'],
+            'user2_rating': profile2.film(j)['rating'],
+            'year': film['year'],
+            'url': film['url']
+        })
+    return rows
+
+def _recommend_rows(profile, positions):
+    """Builds the user1_recommends / user2_recommends result dicts"""
+    rows = []
+    for i in positions.tolist():
+        film = profile.film(i)
+        rows.append({
+            'title': film['title'],
+            'rating': film['rating'],
+            'year': film['year'],
+            'url': film['url']
+        })
+    return rows
+
+def _local_suggestions(seeds, user1_watched, user2_watched, limit):
+    """Films neither has seen from the item similarity index ([] if it isn't built)"""
+    if seeds is None:
+        return []
+    try:
+        from item_similarity import suggest
+        return suggest(seeds[0], seeds[1], exclude=(user1_watched, user2_watched), k=limit)
+    except Exception as e:
+        print(f"Error getting local suggestions: {e}")
+        return []
+
+def _find_new_suggestions(both_enjoyed, user1_watched, user2_watched, seeds=None):
+    """
+    Movies neither has seen but would enjoy
+    
+    Args:
+        seeds: (film ids, weights) of every film both enjoyed, for the local
+            item similarity index (see NEW_SUGGESTIONS_SOURCE)
+    """
     new_suggestions = []
     
+    if NEW_SUGGESTIONS_SOURCE == 'local':
+        return _local_suggestions(seeds, user1_watched, user2_watched, SECTION_LIMIT)
+    
+    # In hybrid mode the AI only chooses among (and explains) local candidates
+    candidates = None
+    if NEW_SUGGESTIONS_SOURCE == 'hybrid':
+        candidates = _local_suggestions(seeds, user1_watched, user2_watched, HYBRID_CANDIDATES)
+    
     # Filter for movies both rated exactly 5.0 stars
     both_5star = []
     for movie in both_enjoyed:
@@ -191,7 +212,8 @@ def generate_recommendations(user1_movies, user2_movies, user1_watched=None, use
             new_suggestions = get_ai_recommendations(
                 both_5star,
                 user1_watched,
-                user2_watched
+                user2_watched,
+                candidates=candidates or None
             )
             # Limit to 10
             new_suggestions = new_suggestions[:10]
@@ -199,19 +221,90 @@ def generate_recommendations(user1_movies, user2_movies, user1_watched=None, use
             print(f"Error getting AI recommendations: {e}")
             new_suggestions = []
     
-    # Calculate common movies from watched lists (not just rated)
-    both_watched_all = user1_watched_titles & user2_watched_titles
+    # Without the AI, hybrid mode still has the local picks
+    if not new_suggestions and candidates:
+        new_suggestions = candidates[:SECTION_LIMIT]
     
-    return {
-        'both_enjoyed': both_enjoyed,
-        'both_hated': both_hated,
-        'user1_recommends': user1_recommends,
-        'user2_recommends': user2_recommends,
-        'new_suggestions': new_suggestions,
-        'stats': {
-            'user1_total': len(user1_watched),
-            'user2_total': len(user2_watched),
-            'common_movies': len(both_watched_all)
-        }
+    return new_suggestions
+
+def iter_recommendation_sections(user1_movies, user2_movies, user1_watched=None, user2_watched=None):
+    """
+    Computes the recommendation sections one at a time
+    
+    Yields (section_name, value) pairs as soon as each section is ready.
+    The cheap sections (array operations, see compare_profiles) come first; both_enjoyed needs
+    Letterboxd averages and new_suggestions needs the AI call, so they come last.
+    This is what lets the streaming endpoint show results progressively.
+    
+    Args: same as generate_recommendations
+    """
+    # Compact array versions of the lists (see user_profile.py)
+    # Use rated movies for "both loved" and "both hated" comparisons
+    user1_profile = as_profile(user1_movies)
+    user2_profile = as_profile(user2_movies)
+    
+    # Use watched movies for checking "hasn't seen" in recommendations
+    # (if missing, fall back to rated lists)
+    user1_watched = as_profile(user1_watched) if user1_watched is not None else user1_profile
+    user2_watched = as_profile(user2_watched) if user2_watched is not None else user2_profile
+    
+    # All the matching happens here, in one pass over the arrays
+    with metrics.span('recommend.compare'):
+        matches = compare_profiles(user1_profile, user2_profile, user1_watched, user2_watched)
+    
+    # Movies both hated
+    yield 'both_hated', _pair_rows(user1_profile, user2_profile, *matches['both_hated'])
+    
+    # Movies user1 watched that user2 would enjoy, and vice versa
+    yield 'user1_recommends', _recommend_rows(user1_profile, matches['user1_recommends'])
+    yield 'user2_recommends', _recommend_rows(user2_profile, matches['user2_recommends'])
+    
+    # Calculate common movies from watched lists (not just rated)
+    yield 'stats', {
+        'user1_total': len(user1_watched),
+        'user2_total': len(user2_watched),
+        'common_movies': matches['common_watched']
     }
+    
+    # Movies both watched and enjoyed (needs Letterboxd averages for sorting)
+    # Sort: both 5.0 first, then one 5.0, then both 4.0/4.5. Within each group,
+    # lower Letterboxd average (less popular) comes first. More than 10 matches
+    # get cut to the top 10.
+    positions1, positions2, priorities = matches['both_enjoyed']
+    both_enjoyed = _rank_both_enjoyed(
+        _pair_rows(user1_profile, user2_profile, positions1, positions2),
+        priorities,
+        limit=SECTION_LIMIT if len(priorities) > SECTION_LIMIT else None
+    )
+    yield 'both_enjoyed', both_enjoyed
+    
+    # Movies neither has seen but would enjoy (needs the AI call). Every film
+    # both enjoyed seeds the local index, weighted by how much they liked it.
+    ratings1 = user1_profile.ratings[positions1].astype(np.float64)
+    ratings2 = user2_profile.ratings[positions2].astype(np.float64)
+    seeds = (user1_profile.ids[positions1], (ratings1 + ratings2) / (2 * FIVE_STARS))
+    with metrics.span('recommend.new_suggestions'):
+        new_suggestions = _find_new_suggestions(both_enjoyed, user1_watched, user2_watched, seeds)
+    yield 'new_suggestions', new_suggestions
 
+def generate_recommendations(user1_movies, user2_movies, user1_watched=None, user2_watched=None):
+    """
+    Generates three types of recommendations:
+    1. Movies both watched and enjoyed
+    2. Movies one watched that the other would enjoy
+    3. Movies neither has seen but would enjoy
+    
+    Args:
+        user1_movies: Dict of {film_key: {title, rating, year, url, ...}} - rated movies (for comparisons)
+        user2_movies: Dict of {film_key: {title, rating, year, url, ...}} - rated movies (for comparisons)
+        user1_watched: Dict of {film_key: {title, rating, year, url, ...}} - all watched movies (for recommendations)
+        user2_watched: Dict of {film_key: {title, rating, year, url, ...}} - all watched movies (for recommendations)
+        
+        film_key is the film's Letterboxd slug (see letterboxd_scraper._film_key).
+        Any of the four may also be passed as a user_profile.UserProfile.
+    
+    Returns:
+        Dictionary with recommendation categories
+    """
+    sections = dict(iter_recommendation_sections(user1_movies, user2_movies, user1_watched, user2_watched))
+    return {name: sections[name] for name in SECTIONS}
@@ -0,0 +1,459 @@
+"""
+Taste Vectors Module
+Finds users with similar taste, and films a user would like, at scale
+
+Comparing someone against every cached profile one by one gets slow past a
+few thousand users. Instead every user and every film is boiled down to a
+short list of numbers (a "taste vector", TASTE_FACTORS long):
+
+1. Build the users x films rating matrix from the cached watched lists and
+   center each user's ratings on their own average.
+2. Factorize it with a truncated SVD: ratings ≈ users_factors @ films_factors.T.
+   Each film gets a row of films_factors; each user's vector is their
+   centered ratings projected onto those rows.
+3. Similar users have vectors pointing the same way (cosine similarity), and
+   user_vector · film_vector predicts how much above or below their average
+   the user would rate the film.
+
+To avoid scanning every vector, each set is split into TASTE_LISTS groups
+of nearby vectors with k-means (an IVF index, "inverted file"). A query only
+scores the TASTE_PROBES groups whose centres are closest to it.
+
+The arrays are saved as .npy files and opened memory-mapped, so every worker
+process on the machine shares one copy through the OS page cache. Each build
+writes its arrays to a new build-<id> directory, then swaps metadata.npz
+(which names that directory) into place in one rename, so a reader never
+mixes arrays from two builds. When the pre-warming crawler refreshes a
+profile, update_user() projects the new ratings onto the saved film factors
+and stores the vector in SQLite until the next full build.
+
+Build the index from the command line:
+    python backend/taste_vectors.py build
+    python backend/taste_vectors.py users someuser
+    python backend/taste_vectors.py films someuser
+
+LEARNING NOTE: Projecting new ratings onto existing film factors is called
+"folding in". It's exactly what the build does for every user, so a folded-in
+vector is comparable with the rest without recomputing the SVD.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+from scipy.sparse.linalg import svds
+
+import cache_db
+import film_catalog
+import film_ids
+import profile_cache
+from compatibility import load_roster_profiles
+from group import build_matrices
+from recommender import top_k
+from user_profile import as_profile
+
+# Length of every taste vector
+TASTE_FACTORS = int(os.getenv('TASTE_FACTORS', '32'))
+# IVF groups per index (0 = about the square root of the number of vectors)
+TASTE_LISTS = int(os.getenv('TASTE_LISTS', '0'))
+# How many of the closest groups a query scores
+TASTE_PROBES = int(os.getenv('TASTE_PROBES', '8'))
+# Films need this many raters to get a vector
+TASTE_MIN_RATERS = int(os.getenv('TASTE_MIN_RATERS', '2'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS taste_vectors (
+    username TEXT PRIMARY KEY,
+    build_id REAL NOT NULL,       -- which build's film factors the vector was folded into
+    vector BLOB NOT NULL,         -- float32 array, TASTE_FACTORS long
+    updated_at REAL NOT NULL
+);
+"""
+
+def get_index_dir():
+    """Directory holding the index files (TASTE_INDEX_DIR overrides it)"""
+    path = os.getenv('TASTE_INDEX_DIR') or cache_db.get_data_path('taste-vectors')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _connection():
+    cache_db.ensure_schema('taste_vectors', _SCHEMA)
+    return cache_db.get_connection()
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+def _kmeans(vectors, lists, iterations=10, seed=0):
+    """
+    Spherical k-means: groups unit vectors around `lists` unit-length centres
+
+    Trained on a sample of at most 100 vectors per group, which is plenty to
+    place the centres.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > lists * 100:
+        sample = vectors[rng.choice(len(vectors), lists * 100, replace=False)]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        # An empty group keeps its old centre
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _normalize(sums)
+    return centroids
+
+def _build_ivf(vectors, lists=None):
+    """
+    Groups vectors into an IVF index
+
+    Returns:
+        Dictionary of arrays: 'centroids', 'vectors' (reordered so each group
+        is contiguous), 'rows' (original row of each reordered vector) and
+        'offsets' (group g is vectors[offsets[g]:offsets[g + 1]])
+    """
+    lists = lists or TASTE_LISTS or int(np.sqrt(len(vectors)))
+    lists = max(1, min(lists, len(vectors)))
+    unit = _normalize(vectors)
+    centroids = _kmeans(unit, lists)
+
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), 65536):
+        assignment[start:start + 65536] = np.argmax(unit[start:start + 65536] @ centroids.T, axis=1)
+    rows = np.argsort(assignment, kind='stable')
+    offsets = np.searchsorted(assignment[rows], np.arange(lists + 1))
+    return {
+        'centroids': centroids.astype(np.float32),
+        'vectors': vectors[rows].astype(np.float32),
+        'rows': rows.astype(np.int32),
+        'offsets': offsets.astype(np.int64)
+    }
+
+def _search_ivf(ivf, query, probes=None):
+    """
+    Scores query against the vectors in the closest groups
+
+    Returns:
+        (rows, scores) - original row and inner product of every vector in
+        the probed groups (unsorted)
+    """
+    probes = min(probes or TASTE_PROBES, len(ivf['centroids']))
+    groups = top_k(-(ivf['centroids'] @ query), probes)
+    offsets = ivf['offsets']
+    positions = np.concatenate([np.arange(offsets[g], offsets[g + 1]) for g in groups.tolist()])
+    # Groups are contiguous on disk, so this reads a few runs of the mmap
+    return ivf['rows'][positions], np.asarray(ivf['vectors'][positions] @ query)
+
+def _current_version(directory):
+    """Name of the build directory the current metadata points at, or None"""
+    try:
+        with np.load(os.path.join(directory, 'metadata.npz')) as metadata:
+            return str(metadata['version']) if 'version' in metadata else None
+    except (OSError, ValueError):
+        return None
+
+def _remove_old_builds(directory, keep):
+    """
+    Deletes build directories other than the ones in keep
+
+    The previous build is kept too: a process that read the old metadata a
+    moment ago may still be about to open its arrays.
+    """
+    for name in os.listdir(directory):
+        if name.startswith('build-') and name not in keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def build(usernames=None, factors=None, directory=None):
+    """
+    Learns taste vectors from cached watched-list snapshots and saves the index
+
+    Args:
+        usernames: Whose profiles to use (defaults to every cached user)
+
+    Returns:
+        Dictionary with 'users', 'films' and 'path'
+    """
+    usernames = usernames or profile_cache.list_snapshot_users('watched')
+    found, profiles, _ = load_roster_profiles(usernames)
+    ratings, _, films = build_matrices(profiles, profiles)
+
+    raters = np.diff(ratings.tocsc().indptr)
+    keep = np.flatnonzero(raters >= TASTE_MIN_RATERS)
+    ratings, films = ratings.tocsc()[:, keep].tocsr().astype(np.float64), films[keep]
+    factors = min(factors or TASTE_FACTORS, min(ratings.shape) - 1)
+    if factors < 1:
+        raise ValueError(f"Not enough data for taste vectors ({ratings.shape[0]} users, {ratings.shape[1]} films)")
+
+    # Center each user's ratings on their own average
+    counts = np.diff(ratings.indptr)
+    means = np.asarray(ratings.sum(axis=1)).ravel() / np.maximum(counts, 1)
+    ratings.data -= np.repeat(means, counts)
+
+    # svds returns the largest singular values, smallest first
+    _, _, film_factors = svds(ratings, k=factors)
+    film_factors = film_factors[::-1].T.astype(np.float32)        # films x factors
+    user_vectors = np.asarray(ratings @ film_factors, dtype=np.float32)
+
+    # Every build gets a fresh directory, so the arrays the running index
+    # has open are never overwritten
+    directory = directory or get_index_dir()
+    build_id = time.time()
+    version = f'build-{build_id:.6f}'
+    build_dir = os.path.join(directory, version)
+    os.makedirs(build_dir, exist_ok=True)
+    user_index = _build_ivf(_normalize(user_vectors))
+    film_index = _build_ivf(film_factors)
+    for prefix, ivf in (('users', user_index), ('films', film_index)):
+        for name, array in ivf.items():
+            np.save(os.path.join(build_dir, f'{prefix}_{name}.npy'), array)
+    np.save(os.path.join(build_dir, 'film_factors.npy'), film_factors)
+    np.save(os.path.join(build_dir, 'user_vectors.npy'), user_vectors)
+
+    # Interned ids don't survive the process, so store slugs and titles.
+    # The metadata is written last: renaming it into place switches every
+    # reader to the new build directory in one step.
+    slugs, titles, years, letterboxd_ids = [], [], [], []
+    for film_id in films.tolist():
+        slug, title, year, letterboxd_id = film_ids.describe(film_id)
+        slugs.append(slug or '')
+        titles.append(title)
+        years.append(year or 0)
+        letterboxd_ids.append(letterboxd_id or 0)
+    metadata_path = os.path.join(directory, 'metadata.npz')
+    previous = _current_version(directory)
+    np.savez(
+        metadata_path + '.tmp.npz',
+        build_id=build_id, version=version, usernames=np.array(found, dtype=str),
+        slugs=np.array(slugs, dtype=str), titles=np.array(titles, dtype=str),
+        years=np.array(years, dtype=np.int32), letterboxd_ids=np.array(letterboxd_ids, dtype=np.int64)
+    )
+    os.replace(metadata_path + '.tmp.npz', metadata_path)
+    _remove_old_builds(directory, keep={version, previous})
+
+    print(f"Saved {factors}-factor taste vectors for {len(found)} users and {len(films)} films to {directory}")
+    return {'users': len(found), 'films': len(films), 'path': directory}
+
+class TasteIndex:
+    """A loaded index: memory-mapped arrays plus film ids for this process"""
+
+    def __init__(self, directory, metadata):
+        # Indexes built before versioning kept their arrays next to the metadata
+        if 'version' in metadata:
+            directory = os.path.join(directory, str(metadata['version']))
+
+        def open_array(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+
+        self.build_id = float(metadata['build_id'])
+        self.usernames = metadata['usernames'].tolist()
+        self.user_rows = {username: row for row, username in enumerate(self.usernames)}
+        self.users = {name: open_array(f'users_{name}') for name in ('centroids', 'vectors', 'rows', 'offsets')}
+        self.films = {name: open_array(f'films_{name}') for name in ('centroids', 'vectors', 'rows', 'offsets')}
+        self.film_factors = open_array('film_factors')
+        self.user_vectors = open_array('user_vectors')
+
+        films = zip(metadata['slugs'].tolist(), metadata['titles'].tolist(), metadata['years'].tolist(), metadata['letterboxd_ids'].tolist())
+        self.film_ids = np.array([
+            film_ids.intern(slug or title, title, year or None, letterboxd_id or None, slug or None)
+            for slug, title, year, letterboxd_id in films
+        ], dtype=np.int32)
+        self._sorted = np.argsort(self.film_ids)
+        self._sorted_ids = self.film_ids[self._sorted]
+
+    def film_rows(self, ids):
+        """Film factor row of each film id (-1 for films the index doesn't have)"""
+        ids = np.asarray(ids, dtype=np.int32)
+        if len(self._sorted_ids) == 0:
+            return np.full(len(ids), -1)
+        position = np.minimum(np.searchsorted(self._sorted_ids, ids), len(self._sorted_ids) - 1)
+        return np.where(self._sorted_ids[position] == ids, self._sorted[position], -1)
+
+    def fold_in(self, profile):
+        """A profile's taste vector: its centered ratings projected onto the film factors"""
+        rated = profile.ratings > 0
+        rows = self.film_rows(profile.ids[rated])
+        ratings = profile.ratings[rated].astype(np.float64)
+        known = rows >= 0
+        if not known.any():
+            return None
+        # Same centering as the build: the user's average over the films in the index
+        centered = ratings[known] - ratings[known].mean()
+        return (centered @ self.film_factors[rows[known]]).astype(np.float32)
+
+    def stored_vector(self, username):
+        """The vector the build computed for a user, or None"""
+        row = self.user_rows.get(username)
+        if row is None:
+            return None
+        return np.asarray(self.user_vectors[row])
+
+_loaded = {'directory': None, 'mtime': None, 'index': None}
+_load_lock = threading.Lock()
+
+def load(directory=None):
+    """Opens the index (again when a rebuild finishes), or returns None if it hasn't been built"""
+    directory = directory or get_index_dir()
+    metadata_path = os.path.join(directory, 'metadata.npz')
+    try:
+        mtime = os.path.getmtime(metadata_path)
+    except OSError:
+        return None
+    with _load_lock:
+        if _loaded['directory'] != directory or _loaded['mtime'] != mtime:
+            with np.load(metadata_path) as metadata:
+                index = TasteIndex(directory, metadata)
+            _loaded.update(directory=directory, mtime=mtime, index=index)
+        return _loaded['index']
+
+def update_user(username, movies):
+    """
+    Refreshes a user's taste vector after their profile changed
+
+    The vector is folded into the current build's film factors and kept in
+    SQLite, where queries pick it up straight away. Does nothing if the index
+    hasn't been built.
+
+    Args:
+        movies: The user's watched list (scraper dict or UserProfile)
+    """
+    index = load()
+    if index is None or not cache_db.CACHE_ENABLED:
+        return
+    vector = index.fold_in(as_profile(movies))
+    if vector is None:
+        return
+    try:
+        conn = _connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO taste_vectors (username, build_id, vector, updated_at) VALUES (?, ?, ?, ?)',
+            (username.lower(), index.build_id, vector.tobytes(), time.time())
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"  Cache write failed for {username}'s taste vector: {e}")
+
+def _updated_vectors(index):
+    """{username: vector} for users refreshed since the index was built"""
+    if not cache_db.CACHE_ENABLED:
+        return {}
+    try:
+        rows = _connection().execute(
+            'SELECT username, vector FROM taste_vectors WHERE build_id = ?', (index.build_id,)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"  Cache read failed for taste vectors: {e}")
+        return {}
+    return {row['username']: np.frombuffer(row['vector'], dtype=np.float32) for row in rows}
+
+def _user_vector(index, username, updated):
+    """The freshest vector we have for a user, or None"""
+    if username in updated:
+        return updated[username]
+    return index.stored_vector(username)
+
+def similar_users(username, k=10):
+    """
+    The k users whose taste vectors are closest to username's
+
+    Returns:
+        List of {'username', 'similarity'} dicts (cosine similarity, highest
+        first), or None if the index hasn't been built or doesn't know the user
+    """
+    index = load()
+    if index is None:
+        return None
+    username = username.strip().lower()
+    updated = _updated_vectors(index)
+    query = _user_vector(index, username, updated)
+    if query is None:
+        return None
+    query = _normalize(query)
+
+    rows, scores = _search_ivf(index.users, query)
+    candidates = {index.usernames[row]: score for row, score in zip(rows.tolist(), scores.tolist())}
+    # Refreshed users are scored with their new vectors
+    for other, vector in updated.items():
+        candidates[other] = float(_normalize(vector) @ query)
+    candidates.pop(username, None)
+
+    names = list(candidates)
+    scores = np.array([candidates[name] for name in names], dtype=np.float64)
+    return [
+        {'username': names[i], 'similarity': round(float(scores[i]), 4)}
+        for i in top_k(-scores, k).tolist()
+    ]
+
+def recommend_films(username, k=10):
+    """
+    The k films username hasn't watched with the highest predicted rating
+
+    Returns:
+        List of {'title', 'year', 'url', 'score'} dicts (score = predicted
+        stars above the user's average), or None if the index hasn't been
+        built or doesn't know the user
+    """
+    index = load()
+    if index is None:
+        return None
+    username = username.strip().lower()
+    query = _user_vector(index, username, _updated_vectors(index))
+    if query is None:
+        return None
+
+    rows, scores = _search_ivf(index.films, query)
+    snapshot = profile_cache.get_snapshot(username, 'watched')
+    if snapshot and snapshot['movies']:
+        seen = as_profile(snapshot['movies']).contains_ids(index.film_ids[rows])
+        rows, scores = rows[~seen], scores[~seen]
+
+    results = []
+    for i in top_k(-scores, k).tolist():
+        slug, title, year, _ = film_ids.describe(int(index.film_ids[rows[i]]))
+        results.append({
+            'title': title,
+            'year': year,
+            'url': film_catalog.film_url(slug) if slug else None,
+            # Vectors are in half stars
+            'score': round(float(scores[i]) / 2, 4)
+        })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query the taste vector index')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_command = commands.add_parser('build', help='Learn taste vectors from every cached profile')
+    build_command.add_argument('--roster', help='Only use the users in this file (one username per line)')
+    build_command.add_argument('--factors', type=int, default=None)
+
+    for name, help_text in (('users', 'Show users with similar taste'), ('films', "Show films a user hasn't seen but would like")):
+        query_command = commands.add_parser(name, help=help_text)
+        query_command.add_argument('username')
+        query_command.add_argument('-k', type=int, default=10)
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        usernames = None
+        if args.roster:
+            with open(args.roster) as f:
+                usernames = f.read().split()
+        build(usernames, factors=args.factors)
+        return 0
+
+    results = (similar_users if args.command == 'users' else recommend_films)(args.username, k=args.k)
+    if results is None:
+        print(f"No taste vector for {args.username} - run the build command first")
+        return 1
+    for result in results:
+        print(result)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
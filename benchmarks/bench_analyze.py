@@ -0,0 +1,272 @@
+"""
+End-to-End Analysis Benchmark
+Times POST /api/analyze against local stand-ins for Letterboxd and the Anthropic API
+
+Usage (from the project root):
+    python benchmarks/bench_analyze.py
+    python benchmarks/bench_analyze.py --size heavy --runs 5 --cache warm
+    python benchmarks/bench_analyze.py --size pathological --json results.json
+    python benchmarks/bench_analyze.py --size heavy --fast
+
+Nothing leaves the machine: the scraper's requests go to stub_letterboxd.py
+(serving the generated corpus, see corpus.py) through LETTERBOXD_BASE_URL,
+and the AI call goes to stub_anthropic.py through ANTHROPIC_BASE_URL. The
+cache database is a temporary file, so your real cache is never touched.
+
+Each run reports where the time went:
+    fetch            HTTP requests (summed across worker threads)
+    parse            poster grids and film pages (summed across worker threads)
+    average_ratings  the Letterboxd averages lookup for "both enjoyed"
+    ai               building the prompt and the (stub) AI call
+    recommend        the recommendation sections, minus the two above
+    serialize        turning the result into the JSON response
+    total            wall-clock time of the whole request
+
+fetch and parse run on many threads at once, so they can add up to more than
+total. --cache cold (the default) starts every run with an empty cache;
+--cache warm does one untimed run first and then reuses its cache. After
+the timed runs, one more run is traced with tracemalloc for peak memory
+(tracing slows Python down, so it isn't part of the timings).
+
+--fast sends "fast": true, so only as much of the rated lists is scraped as
+the top 10s need (see backend/fast_mode.py).
+
+--json writes every number to a file, so runs can be compared over time.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import corpus as corpus_module
+import stub_anthropic
+import stub_letterboxd
+
+STAGES = ['fetch', 'parse', 'average_ratings', 'ai', 'recommend', 'serialize', 'total']
+
+class StageTimer:
+    """Adds up the time spent inside wrapped functions, per stage (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seconds = defaultdict(float)
+            self.calls = defaultdict(int)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def wrap(self, owner, name, stage):
+        """Replaces owner.name with a version that times every call"""
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+
+        setattr(owner, name, timed)
+
+    def wrap_generator(self, owner, name, stage):
+        """Like wrap, for a generator function: times the work done for each item"""
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            iterator = original(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self.add(stage, time.perf_counter() - start)
+                    return
+                self.add(stage, time.perf_counter() - start)
+                yield item
+
+        setattr(owner, name, timed)
+
+def _set_up_environment(letterboxd_url, anthropic_url, cache_dir):
+    """Points the backend at the stubs; must run before the backend is imported"""
+    os.environ['LETTERBOXD_BASE_URL'] = letterboxd_url
+    os.environ['ANTHROPIC_BASE_URL'] = anthropic_url
+    os.environ['ANTHROPIC_API_KEY'] = 'sk-ant-stub'   # set first, so .env can't override it
+    os.environ['LETTERBOXD_CACHE_DB'] = os.path.join(cache_dir, 'warm.sqlite3')
+    # The stub doesn't need politeness delays; set these yourself to include them
+    os.environ.setdefault('LETTERBOXD_REQUEST_INTERVAL', '0')
+    os.environ.setdefault('LETTERBOXD_MAX_CONCURRENCY', '8')
+
+def _instrument(timer, app):
+    """Wraps the functions behind each stage"""
+    import ai_recommender
+    import analysis
+    import http_client
+    import letterboxd_scraper
+    import poster_parser
+    import recommender
+
+    timer.wrap(http_client, 'get', 'fetch')
+    timer.wrap(poster_parser, 'parse_poster_grid', 'parse')
+    timer.wrap(letterboxd_scraper, 'BeautifulSoup', 'parse')
+    timer.wrap(letterboxd_scraper, '_parse_film_page', 'parse')
+    timer.wrap(recommender, 'get_average_ratings', 'average_ratings')
+    timer.wrap(ai_recommender, 'get_ai_recommendations', 'ai')
+    timer.wrap_generator(analysis, 'iter_recommendation_sections', 'sections')
+    timer.wrap(app.json, 'dumps', 'serialize')
+
+def _reset_caches(cache_dir, run):
+    """Starts a cold run: a new empty cache database and empty in-memory caches"""
+    import film_metadata
+    os.environ['LETTERBOXD_CACHE_DB'] = os.path.join(cache_dir, f'cold-{run}.sqlite3')
+    film_metadata._films = film_metadata.TTLCache(film_metadata.MEMORY_CACHE_SIZE, film_metadata.FILM_METADATA_TTL)
+
+def _run_once(client, timer, counters, users, fast=False):
+    """One POST /api/analyze; returns its stage timings and counts"""
+    timer.reset()
+    requests_before = counters.get('requests', 0)
+    start = time.perf_counter()
+    response = client.post('/api/analyze', json={'user1': users[0], 'user2': users[1], 'fast': fast})
+    total = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"/api/analyze returned {response.status_code}: {response.get_data(as_text=True)[:300]}")
+    result = response.get_json()
+
+    seconds = dict(timer.seconds)
+    stages = {
+        'fetch': seconds.get('fetch', 0.0),
+        'parse': seconds.get('parse', 0.0),
+        'average_ratings': seconds.get('average_ratings', 0.0),
+        'ai': seconds.get('ai', 0.0),
+        'recommend': max(0.0, seconds.get('sections', 0.0) - seconds.get('average_ratings', 0.0) - seconds.get('ai', 0.0)),
+        'serialize': seconds.get('serialize', 0.0),
+        'total': total
+    }
+    return {
+        'stages': stages,
+        'http_requests': counters.get('requests', 0) - requests_before,
+        'response_bytes': len(response.get_data()),
+        'films_compared': result.get('stats', {}).get('user1_total', 0) + result.get('stats', {}).get('user2_total', 0),
+        'new_suggestions': len(result.get('new_suggestions', [])),
+        'section_status': result.get('section_status')
+    }
+
+def _summarize(runs):
+    summary = {}
+    for stage in STAGES:
+        values = [run['stages'][stage] for run in runs]
+        summary[stage] = {
+            'median': statistics.median(values),
+            'min': min(values),
+            'max': max(values)
+        }
+    total = summary['total']['median']
+    films = statistics.median(run['films_compared'] for run in runs)
+    summary['throughput'] = {
+        'requests_per_second': 1 / total if total else None,
+        'films_per_second': films / total if total else None,
+        'http_requests_per_second': statistics.median(run['http_requests'] for run in runs) / total if total else None
+    }
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark /api/analyze end to end against local stubs')
+    parser.add_argument('--size', choices=corpus_module.SIZES, default='small')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--cache', choices=('cold', 'warm'), default='cold')
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub Letterboxd delay per request (seconds)')
+    parser.add_argument('--ai-latency', type=float, default=0.2, help='Stub AI response delay (seconds)')
+    parser.add_argument('--fast', action='store_true', help='Use fast mode (early-terminating rated list scrape)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args(argv)
+
+    print(f"Generating the {args.size} corpus...")
+    corpus = corpus_module.Corpus(args.size)
+    counters = {}
+    letterboxd_server, letterboxd_url = stub_letterboxd.start(corpus, latency=args.latency, counters=counters)
+    anthropic_server = stub_anthropic.ThreadingHTTPServer(
+        ('127.0.0.1', 0), stub_anthropic.make_handler(set(), {}, args.ai_latency, quiet=True)
+    )
+    anthropic_server.daemon_threads = True
+    threading.Thread(target=anthropic_server.serve_forever, daemon=True).start()
+    anthropic_url = f'http://127.0.0.1:{anthropic_server.server_address[1]}'
+
+    with tempfile.TemporaryDirectory(prefix='bench-analyze-') as cache_dir:
+        _set_up_environment(letterboxd_url, anthropic_url, cache_dir)
+        sys.path.insert(0, PROJECT_ROOT)
+        from app import app
+
+        timer = StageTimer()
+        _instrument(timer, app)
+        client = app.test_client()
+        users = list(corpus.users)
+
+        if args.cache == 'warm':
+            print("Warming the cache...")
+            _run_once(client, timer, counters, users, args.fast)
+
+        runs = []
+        for run in range(args.runs):
+            if args.cache == 'cold':
+                _reset_caches(cache_dir, run)
+            runs.append(_run_once(client, timer, counters, users, args.fast))
+            print(f"  run {run + 1}: {runs[-1]['stages']['total']:.3f}s, {runs[-1]['http_requests']} requests")
+
+        peak_memory = None
+        if not args.no_memory:
+            if args.cache == 'cold':
+                _reset_caches(cache_dir, 'memory')
+            tracemalloc.start()
+            _run_once(client, timer, counters, users, args.fast)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    letterboxd_server.shutdown()
+    anthropic_server.shutdown()
+
+    summary = _summarize(runs)
+    mode = ', fast mode' if args.fast else ''
+    print(f"\n{args.size} corpus, {args.cache} cache{mode}, {args.runs} runs (median / min / max seconds)")
+    for stage in STAGES:
+        values = summary[stage]
+        print(f"  {stage:<16} {values['median']:8.3f} {values['min']:8.3f} {values['max']:8.3f}")
+    throughput = summary['throughput']
+    print(f"  {'throughput':<16} {throughput['requests_per_second']:.2f} requests/s, "
+          f"{throughput['films_per_second']:.0f} films/s, {throughput['http_requests_per_second']:.0f} HTTP requests/s")
+    if peak_memory is not None:
+        print(f"  {'peak memory':<16} {peak_memory / 1e6:.1f} MB (tracemalloc)")
+
+    if args.json:
+        report = {
+            'benchmark': 'analyze',
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'settings': vars(args),
+            'runs': runs,
+            'summary': summary,
+            'peak_memory_bytes': peak_memory
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
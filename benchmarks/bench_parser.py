@@ -0,0 +1,166 @@
+"""
+Poster Grid Parser Benchmark
+Times poster_parser.parse_poster_grid on saved Letterboxd pages
+
+Usage (from the project root):
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --runs 500
+
+The fixtures in benchmarks/fixtures/ are full 72-poster grid pages in the
+same markup Letterboxd serves, so no network is needed. For comparison the
+script also times beautifulsoup_films: the old scraper's BeautifulSoup
+extraction, with the same fallbacks poster_parser added (see its
+docstring). Before timing anything it checks both return the same films.
+
+LEARNING NOTE: time.perf_counter() is the right clock for benchmarks - it has
+the highest resolution available and never jumps backwards.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+# Make the backend modules importable (same trick as app.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import poster_parser
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURES = ['rated_page.html', 'watched_page.html']
+
+def _time_per_call(function, content, runs):
+    """Runs function(content) runs times and returns the average seconds per call"""
+    function(content)  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        function(content)
+    return (time.perf_counter() - start) / runs
+
+def _soup_attr(element, *names):
+    """First non-empty attribute out of names, on the element or its parent"""
+    for node in (element, element.parent):
+        if node is None:
+            continue
+        for name in names:
+            value = node.get(name)
+            if value:
+                return value.strip()
+    return None
+
+def _soup_rating(element):
+    """The old scraper's star counting, also looking in the poster's <li> (where the rating sits)"""
+    container = element if element.name == 'li' else element.find_parent('li')
+    for node in (element, container):
+        if node is None:
+            continue
+        rating_span = node.find('span', class_=lambda x: x and 'rating' in x)
+        if not rating_span:
+            continue
+        class_match = re.search(r'\brated-(\d+)\b', ' '.join(rating_span.get('class', [])))
+        if class_match:
+            return int(class_match.group(1)) / 2
+        rating_text = rating_span.get_text()
+        star_count = rating_text.count('★')
+        if '½' in rating_text or '1/2' in rating_text:
+            return star_count + 0.5
+        if star_count:
+            return float(star_count)
+    return None
+
+def beautifulsoup_films(content):
+    """
+    The old scraper's BeautifulSoup extraction, as the reference poster_parser must match
+
+    Title, year and URL follow the old code line by line. Where the old code
+    came up empty on Letterboxd's current markup it falls back the same way
+    poster_parser does: data-target-link for the URL, the surrounding <li>
+    for the rating, and the data-film-slug / data-film-id attributes the old
+    scraper didn't read.
+    """
+    soup = BeautifulSoup(content, 'lxml')
+    movie_elements = (
+        soup.find_all('div', class_='poster')
+        or soup.find_all('div', class_='film-poster')
+        or soup.find_all('li', class_='posteritem')
+        or soup.find_all('div', {'data-film-id': True})
+        or soup.find_all('li', class_='poster-container')
+    )
+
+    films = []
+    for element in movie_elements:
+        img = element.find('img')
+        if not img:
+            continue
+        link = element.find('a')
+        title = link.get('data-original-title', '').strip() if link else ''
+        if not title:
+            title = img.get('alt', '').strip()
+            if title.startswith('Poster for '):
+                title = title.replace('Poster for ', '', 1).strip()
+        if not title:
+            title = img.get('title', '').strip()
+        if not title:
+            title = _soup_attr(element, 'data-film-name', 'data-item-name') or ''
+        if not title:
+            continue
+
+        year = None
+        year_match = re.search(r'\((\d{4})\)', title)
+        if year_match:
+            year = int(year_match.group(1))
+            title = title.replace(f'({year})', '').strip()
+        if not year:
+            year_attr = _soup_attr(element, 'data-film-year', 'data-film-release-year')
+            if year_attr and year_attr.isdigit():
+                year = int(year_attr)
+
+        href = link.get('href') if link else None
+        if not href:
+            href = _soup_attr(element, 'data-target-link', 'data-item-link', 'data-film-link')
+        slug = _soup_attr(element, 'data-film-slug', 'data-item-slug')
+        if not slug and href:
+            slug_match = re.search(r'/film/([^/?#]+)', href)
+            slug = slug_match.group(1) if slug_match else None
+        if href:
+            url = f"https://letterboxd.com{href}"
+        elif slug:
+            url = f"https://letterboxd.com/film/{slug}/"
+        else:
+            url = None
+
+        film_id = _soup_attr(element, 'data-film-id')
+        films.append({
+            'title': title,
+            'year': year,
+            'slug': slug,
+            'film_id': int(film_id) if film_id and film_id.isdigit() else None,
+            'url': url,
+            'rating': _soup_rating(element)
+        })
+    return films
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the poster grid parser')
+    parser.add_argument('--runs', type=int, default=200, help='Parses per fixture (default: 200)')
+    args = parser.parse_args()
+
+    for name in FIXTURES:
+        with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+            content = f.read()
+        films, last_page = poster_parser.parse_poster_grid(content)
+        # A faster parser is only worth having if it reads the same films
+        assert films == beautifulsoup_films(content), f"poster_parser and BeautifulSoup disagree on {name}"
+
+        lxml_time = _time_per_call(poster_parser.parse_poster_grid, content, args.runs)
+        soup_time = _time_per_call(beautifulsoup_films, content, args.runs)
+
+        print(f"{name}: {len(films)} films, last page {last_page}, {len(content) / 1024:.0f} KB")
+        print(f"  poster_parser (full parse):      {lxml_time * 1000:7.2f} ms/page")
+        print(f"  BeautifulSoup (full parse):      {soup_time * 1000:7.2f} ms/page")
+        print(f"  speedup: {soup_time / lxml_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Benchmark Fixture Corpus
+Deterministic Letterboxd-like profiles and pages for benchmarks, no network needed
+
+A corpus is a set of films plus two users who have rated/watched some of
+them. From it we render exactly the pages the scraper asks for - rated
+buckets, watched lists and film pages - in the same markup as the recorded
+pages in benchmarks/fixtures/ (so poster_parser reads them like real ones).
+
+Sizes:
+    small         two users with a few hundred films each
+    heavy         two users with 5,000 watched films each
+    pathological  the awkward cases: 100-page lists (the crawl limit),
+                  hundreds of films both users rated 5 stars (a huge AI
+                  prompt), ½-star-only ratings, remakes sharing a title,
+                  non-ASCII and HTML-escaped titles, films with no year and
+                  film pages with no average rating
+
+Every corpus is generated from a fixed seed, so runs are comparable. To keep
+a copy on disk (e.g. to diff against pages saved from the real site):
+    python benchmarks/corpus.py write heavy /tmp/corpus-heavy
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import random
+import sys
+
+SIZES = ('small', 'heavy', 'pathological')
+PER_PAGE = 72
+
+# Users in every corpus
+USERS = ('bench_alice', 'bench_bob')
+
+_WORDS = ['night', 'river', 'glass', 'summer', 'ghost', 'city', 'fire', 'war', 'dark', 'time', 'lost',
+          'blue', 'house', 'winter', 'stranger', 'silent', 'golden', 'paper', 'moon', 'road']
+_ODD_TITLES = ['Amélie', 'Crouching Tiger, Hidden Dragon', '8½', 'Tom & Jerry', '"Quoted" <Title>',
+               'L\'Atalante', 'Ran', 'Zażółć', '東京物語', 'Æon Flux']
+_STARS = {1: '½', 2: '★', 3: '★½', 4: '★★', 5: '★★½', 6: '★★★', 7: '★★★½', 8: '★★★★', 9: '★★★★½', 10: '★★★★★'}
+
+class Corpus:
+    """
+    Films and users for one benchmark size
+
+    Attributes:
+        films: {slug: {'title', 'year', 'film_id', 'average_rating', 'rating_count',
+                'genres', 'directors'}}
+        users: {username: [(slug, half_star_rating or 0)]} in list order
+            (most recent first, like Letterboxd)
+    """
+
+    def __init__(self, size, seed=42):
+        if size not in SIZES:
+            raise ValueError(f"Unknown corpus size '{size}' (use one of: {', '.join(SIZES)})")
+        self.size = size
+        self.films = {}
+        self.users = {}
+        rnd = random.Random(f'{size}-{seed}')
+
+        if size == 'small':
+            self._make_films(rnd, 800)
+            self._make_users(rnd, watched=400, shared=0.4, rated_share=0.6)
+        elif size == 'heavy':
+            self._make_films(rnd, 9000)
+            self._make_users(rnd, watched=5000, shared=0.3, rated_share=0.7)
+        else:
+            self._make_films(rnd, 9000, odd=True)
+            self._make_users(rnd, watched=PER_PAGE * 100, shared=0.5, rated_share=0.9, pathological=True)
+
+    def _make_films(self, rnd, count, odd=False):
+        for i in range(count):
+            title = ' '.join(rnd.choice(_WORDS) for _ in range(rnd.randint(1, 3))).title()
+            year = rnd.randint(1920, 2024)
+            if odd and i % 50 == 0:
+                title = _ODD_TITLES[(i // 50) % len(_ODD_TITLES)]
+            if odd and i % 97 == 0:
+                year = None
+            slug = '-'.join(''.join(c for c in word if c.isalnum()) or 'x' for word in title.lower().split())
+            slug = f"{slug}-{year or 'tba'}-{i}"
+            self.films[slug] = {
+                'title': title,
+                'year': year,
+                'film_id': 10000 + i,
+                # Pathological film pages sometimes have no average rating at all
+                'average_rating': None if odd and i % 13 == 0 else round(rnd.uniform(2.0, 4.6), 2),
+                'rating_count': rnd.randint(50, 500000),
+                'genres': rnd.sample(['Drama', 'Comedy', 'Horror', 'Thriller', 'Romance', 'Animation', 'Documentary'], 2),
+                'directors': [f"Director {rnd.randint(1, 400)}"]
+            }
+
+    def _make_users(self, rnd, watched, shared, rated_share, pathological=False):
+        slugs = list(self.films)
+        common = rnd.sample(slugs, int(watched * shared))
+        common_set = set(common)
+        rest = [slug for slug in slugs if slug not in common_set]
+        # Users agree on shared films more often than not, like real friends do
+        shared_rating = {slug: rnd.choice([1, 2, 4, 6, 7, 8, 8, 9, 9, 10]) for slug in common}
+        for u, username in enumerate(USERS):
+            own = rnd.sample(rest, watched - len(common))
+            films = common + own
+            rnd.shuffle(films)
+            entries = []
+            for slug in films:
+                rating = 0
+                if rnd.random() < rated_share:
+                    if pathological and slug in common_set and rnd.random() < 0.3:
+                        rating = 10  # lots of films both rated 5 stars
+                    elif pathological and u == 1 and rnd.random() < 0.05:
+                        rating = 1   # ½-star-only ratings
+                    elif slug in common_set and rnd.random() < 0.6:
+                        rating = shared_rating[slug]
+                    else:
+                        rating = rnd.choice([1, 2, 4, 6, 7, 8, 8, 9, 9, 10])
+                entries.append((slug, rating))
+            self.users[username] = entries
+
+    # -- rendering -----------------------------------------------------------
+
+    def _poster(self, slug, rating):
+        film = self.films[slug]
+        title = html.escape(film['title'])
+        viewing = ''
+        if rating:
+            viewing = f'<p class="poster-viewingdata"><span class="rating -micro -darker rated-{rating}"> {_STARS[rating]} </span></p>'
+        return f"""    <li class="poster-container">
+      <div class="really-lazy-load poster film-poster film-poster-{film['film_id']} linked-film-poster" data-film-id="{film['film_id']}" data-film-slug="{slug}" data-poster-url="/film/{slug}/image-150/" data-linked="linked" data-target-link="/film/{slug}/" data-target-link-target="" data-cache-busting-key="a1b2c3" data-show-menu="true">
+        <img src="https://s.ltrbxd.com/static/img/empty-poster-70.png" class="image" width="70" height="105" alt="{title}" />
+        <span class="frame"><span class="frame-title"></span></span>
+      </div>
+      {viewing}
+    </li>"""
+
+    def _grid_page(self, username, base_path, entries, page):
+        last_page = max(1, -(-len(entries) // PER_PAGE))
+        if page > last_page or not entries:
+            return None
+        posters = '\n'.join(self._poster(slug, rating) for slug, rating in entries[(page - 1) * PER_PAGE:page * PER_PAGE])
+        links = ''.join(
+            f'<li class="paginate-page"><a href="{base_path}page/{n}/">{n}</a></li>'
+            for n in sorted({1, 2, 3, last_page}) if n <= last_page
+        )
+        return f"""<!DOCTYPE html>
+<html lang="en" class="no-js">
+<head>
+  <meta charset="UTF-8">
+  <title>{username}'s films &bull; Letterboxd</title>
+</head>
+<body class="films-watched">
+  <div id="content" class="site-body">
+  <section class="section col-main">
+  <ul class="poster-list -p70 -grid film-list clear">
+{posters}
+  </ul>
+  <div class="pagination">
+    <div class="paginate-pages"><ul>{links}</ul></div>
+  </div>
+  </section>
+  </div>
+</body>
+</html>"""
+
+    def _film_page(self, slug):
+        film = self.films[slug]
+        json_ld = {
+            '@type': 'Movie',
+            'name': film['title'],
+            'genre': film['genres'],
+            'director': [{'@type': 'Person', 'name': name} for name in film['directors']]
+        }
+        if film['year']:
+            json_ld['releasedEvent'] = [{'@type': 'PublicationEvent', 'startDate': str(film['year'])}]
+        meta = ''
+        if film['average_rating'] is not None:
+            json_ld['aggregateRating'] = {'ratingValue': film['average_rating'], 'ratingCount': film['rating_count']}
+            meta = f'<meta name="twitter:data2" content="{film["average_rating"]:.2f} out of 5" />'
+        title = html.escape(f"{film['title']} ({film['year']})" if film['year'] else film['title'])
+        return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta property="og:title" content="{title}" />
+  {meta}
+  <script type="application/ld+json">
+/* <![CDATA[ */
+{json.dumps(json_ld)}
+/* ]]> */
+  </script>
+</head>
+<body class="film"><h1 class="headline-1">{html.escape(film['title'])}</h1></body>
+</html>"""
+
+    def render(self, path):
+        """
+        The page for a URL path, like the real site would serve it
+
+        Returns:
+            The HTML as bytes, or None for a 404
+        """
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if len(parts) == 2 and parts[0] == 'film' and parts[1] in self.films:
+            return self._film_page(parts[1]).encode('utf-8')
+        if not parts or parts[0] not in self.users or parts[1:2] != ['films']:
+            return None
+
+        username, rest = parts[0], parts[2:]
+        page = 1
+        if len(rest) >= 2 and rest[-2] == 'page' and rest[-1].isdigit():
+            page, rest = int(rest[-1]), rest[:-2]
+        entries = self.users[username]
+        base_path = f'/{username}/films/'
+        if rest[:1] == ['rated'] and len(rest) == 2:
+            try:
+                half_stars = int(round(float(rest[1]) * 2))
+            except ValueError:
+                return None
+            entries = [entry for entry in entries if entry[1] == half_stars]
+            base_path += f'rated/{rest[1]}/'
+        elif rest:
+            return None
+        content = self._grid_page(username, base_path, entries, page)
+        return content.encode('utf-8') if content is not None else None
+
+    def paths(self):
+        """Every path the scraper could request for this corpus"""
+        for username, entries in self.users.items():
+            for page in range(1, max(1, -(-len(entries) // PER_PAGE)) + 1):
+                yield f'/{username}/films/page/{page}/'
+            for bucket in ('0.5', '1', '4', '4.5', '5'):
+                count = sum(1 for _, rating in entries if rating == int(float(bucket) * 2))
+                for page in range(1, max(1, -(-count // PER_PAGE)) + 1):
+                    yield f'/{username}/films/rated/{bucket}/page/{page}/'
+        for slug in self.films:
+            yield f'/film/{slug}/'
+
+def etag(content):
+    """A stable ETag for a page, so revalidation (304) works like on the real site"""
+    return '"' + hashlib.sha1(content).hexdigest()[:16] + '"'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the benchmark fixture corpus')
+    commands = parser.add_subparsers(dest='command', required=True)
+    write_command = commands.add_parser('write', help='Write every page of a corpus to a directory')
+    write_command.add_argument('size', choices=SIZES)
+    write_command.add_argument('directory')
+    args = parser.parse_args(argv)
+
+    corpus = Corpus(args.size)
+    count = 0
+    for path in corpus.paths():
+        content = corpus.render(path)
+        if content is None:
+            continue
+        target = os.path.join(args.directory, path.strip('/'), 'index.html')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        count += 1
+    print(f"Wrote {count} pages for the {args.size} corpus to {args.directory}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Stub Anthropic API
+A tiny local server that answers like the Messages API, for testing and timing
+the AI recommender without a real API key
+
+Usage (from the project root):
+    python benchmarks/stub_anthropic.py --port 8765 \\
+        --missing claude-3-7-sonnet-20250219 --delay claude-3-5-haiku-latest=3
+
+Then point the backend at it:
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=sk-ant-stub python app.py
+
+Every model answers with the same 10 made-up suggestions, after its --delay
+(default --default-delay). Models given with --missing return a 404
+not_found_error, like a retired model does, and --error MODEL=STATUS makes
+a model fail with that status (e.g. 500 or 529 overloaded). Each request is
+logged with the model it asked for, so fallback and hedging behaviour is
+easy to see (the handler class also keeps the list in its `calls`, and
+each answered call's (model, start, end) times in `intervals`).
+
+LEARNING NOTE: ThreadingHTTPServer handles each request on its own thread, so
+a slow "model" doesn't hold up the others - which is what hedged requests
+need to be tested against.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUGGESTIONS = [
+    {'title': f'Stub Film {i}', 'year': 1990 + i, 'reason': 'Shares the themes of the films you both loved'}
+    for i in range(1, 11)
+]
+
+def make_handler(missing, delays, default_delay, quiet=False, errors=None):
+    errors = errors or {}
+    calls_lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        # Every model asked for, in arrival order
+        calls = []
+        # (model, start, end) of every successful call, in finishing order
+        intervals = []
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                request = {}
+            model = request.get('model', '')
+            with calls_lock:
+                StubHandler.calls.append(model)
+            if not quiet:
+                print(f"{time.strftime('%H:%M:%S')} {self.path} model={model}", flush=True)
+
+            if not self.path.rstrip('/').endswith('/v1/messages'):
+                self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'Not found'}})
+                return
+            if model in missing:
+                self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': f'model: {model}'}})
+                return
+            if model in errors:
+                error_type = 'overloaded_error' if errors[model] == 529 else 'api_error'
+                self._send_json(errors[model], {'type': 'error', 'error': {'type': error_type, 'message': 'Internal server error'}})
+                return
+
+            started = time.perf_counter()
+            time.sleep(delays.get(model, default_delay))
+            with calls_lock:
+                StubHandler.intervals.append((model, started, time.perf_counter()))
+            self._send_json(200, {
+                'id': 'msg_stub',
+                'type': 'message',
+                'role': 'assistant',
+                'model': model,
+                'content': [{'type': 'text', 'text': json.dumps(SUGGESTIONS)}],
+                'stop_reason': 'end_turn',
+                'stop_sequence': None,
+                'usage': {'input_tokens': 0, 'output_tokens': 0}
+            })
+
+        def log_message(self, format, *args):
+            pass  # do_POST prints its own one-line log
+
+    return StubHandler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stub Anthropic Messages API for local testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--missing', action='append', default=[], help='Model that returns 404 (repeatable)')
+    parser.add_argument('--delay', action='append', default=[], metavar='MODEL=SECONDS',
+                        help='Response delay for one model (repeatable)')
+    parser.add_argument('--error', action='append', default=[], metavar='MODEL=STATUS',
+                        help='HTTP status one model fails with (repeatable)')
+    parser.add_argument('--default-delay', type=float, default=0.2, help='Response delay for other models')
+    args = parser.parse_args(argv)
+
+    delays = {}
+    for item in args.delay:
+        model, _, seconds = item.partition('=')
+        delays[model] = float(seconds)
+    errors = {}
+    for item in args.error:
+        model, _, status = item.partition('=')
+        errors[model] = int(status)
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(set(args.missing), delays, args.default_delay, errors=errors)
+    )
+    print(f"Stub Anthropic API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
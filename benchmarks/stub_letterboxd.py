@@ -0,0 +1,118 @@
+"""
+Stub Letterboxd Server
+Serves the benchmark corpus (see corpus.py) over HTTP, standing in for letterboxd.com
+
+Usage (from the project root):
+    python benchmarks/stub_letterboxd.py --size heavy --port 8766 --latency 0.05
+
+Then point the backend at it:
+    LETTERBOXD_BASE_URL=http://127.0.0.1:8766 python app.py
+
+--directory serves pages written by `corpus.py write` (or saved from the
+real site in the same layout) instead of generating them. Pages carry an
+ETag and answer If-None-Match with 304, like the real site, so cache
+revalidation can be measured too. --latency adds a fixed delay per request
+to mimic the round trip to the real site.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import Corpus, SIZES, etag
+
+class DirectorySource:
+    """Pages from a directory tree: /some/path/ is read from some/path/index.html"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def render(self, path):
+        target = os.path.join(self.directory, path.split('?')[0].strip('/'), 'index.html')
+        try:
+            with open(target, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+def make_handler(source, latency=0.0, counters=None):
+    """
+    Args:
+        source: Anything with render(path) -> bytes or None (a Corpus or DirectorySource)
+        counters: Optional dict that's updated with 'requests' and 'not_modified'
+    """
+    counters = counters if counters is not None else {}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real site
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            with lock:
+                counters['requests'] = counters.get('requests', 0) + 1
+            content = source.render(self.path)
+            if content is None:
+                self._send(404, b'Not found')
+                return
+            tag = etag(content)
+            if self.headers.get('If-None-Match') == tag:
+                with lock:
+                    counters['not_modified'] = counters.get('not_modified', 0) + 1
+                self._send(304, b'', tag)
+                return
+            self._send(200, content, tag)
+
+        def _send(self, status, body, tag=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            if tag:
+                self.send_header('ETag', tag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # thousands of requests per run; counters say enough
+
+    return StubHandler
+
+def start(source, latency=0.0, host='127.0.0.1', port=0, counters=None):
+    """
+    Starts the stub on a background thread
+
+    Returns:
+        (server, base_url) - call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(source, latency, counters))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the benchmark corpus like letterboxd.com')
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--directory', help='Serve pages from this directory instead of generating them')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response')
+    args = parser.parse_args(argv)
+
+    source = DirectorySource(args.directory) if args.directory else Corpus(args.size)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(source, args.latency))
+    server.daemon_threads = True
+    print(f"Stub Letterboxd serving the {args.directory or args.size + ' corpus'} on http://{args.host}:{args.port}")
+    print(f"Users: {', '.join(source.users) if isinstance(source, Corpus) else '(from directory)'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""
+Shared test setup
+
+The backend modules import each other by bare name (like app.py sets up),
+and the benchmark stubs and corpus live in benchmarks/, so both go on the
+path. Every test run gets its own cache database.
+"""
+import os
+import pathlib
+import sys
+import tempfile
+
+project_root = pathlib.Path(__file__).parent.parent
+for folder in ('backend', 'benchmarks'):
+    sys.path.insert(0, str(project_root / folder))
+
+os.environ['LETTERBOXD_CACHE_DB'] = os.path.join(tempfile.mkdtemp(prefix='letterboxd-tests-'), 'cache.sqlite3')
@@ -0,0 +1,110 @@
+"""Model fallback and hedged requests, against benchmarks/stub_anthropic.py"""
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+from anthropic import Anthropic
+
+import ai_recommender
+import stub_anthropic
+
+API_KEY = 'sk-ant-stub'
+
+@pytest.fixture
+def stub(monkeypatch):
+    """
+    Starts a stub API and points ai_recommender at it
+
+    Returns a function taking the stub's settings (missing models, delays,
+    errors) that returns the handler class, whose `calls` lists the models
+    asked for.
+    """
+    servers = []
+
+    def start(missing=(), delays=None, errors=None, default_delay=0.0):
+        handler = stub_anthropic.make_handler(set(missing), delays or {}, default_delay, quiet=True, errors=errors)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        monkeypatch.setenv('ANTHROPIC_BASE_URL', base_url)
+        # No SDK retries, so every failure reaches the fallback logic at once
+        monkeypatch.setattr(ai_recommender, '_client', Anthropic(api_key=API_KEY, base_url=base_url, max_retries=0))
+        monkeypatch.setattr(ai_recommender, '_client_settings', (API_KEY, base_url))
+        return handler
+
+    monkeypatch.setattr(ai_recommender, 'MODELS_TO_TRY', ['model-a', 'model-b', 'model-c'])
+    monkeypatch.setattr(ai_recommender, '_missing_until', {})
+    monkeypatch.setattr(ai_recommender, 'AI_HEDGE_AFTER', 0.0)
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_missing_model_is_skipped_and_remembered(stub):
+    handler = stub(missing={'model-a'})
+
+    assert len(ai_recommender._ask_claude(API_KEY, 'prompt')) == 10
+    assert handler.calls == ['model-a', 'model-b']
+    assert 'model-a' in ai_recommender._missing_until
+
+    # The next request goes straight to the model that works
+    ai_recommender._ask_claude(API_KEY, 'prompt')
+    assert handler.calls == ['model-a', 'model-b', 'model-b']
+
+@pytest.mark.parametrize('status', [500, 529])
+def test_server_error_is_not_remembered_as_missing(stub, status):
+    handler = stub(errors={'model-a': status})
+
+    with pytest.raises(Exception):
+        ai_recommender._ask_claude(API_KEY, 'prompt')
+    assert handler.calls == ['model-a']
+    assert ai_recommender._missing_until == {}
+
+def test_timed_out_hedge_is_not_remembered_as_missing(stub, monkeypatch):
+    handler = stub(delays={'model-a': 0.6, 'model-b': 5.0})
+    monkeypatch.setattr(ai_recommender, 'MODELS_TO_TRY', ['model-a', 'model-b'])
+    monkeypatch.setattr(ai_recommender, 'AI_HEDGE_AFTER', 0.1)
+    monkeypatch.setattr(ai_recommender, 'AI_HEDGE_TIMEOUT', 0.2)
+    monkeypatch.setattr(ai_recommender, '_hedge_slots', threading.BoundedSemaphore(1))
+
+    assert len(ai_recommender._ask_claude(API_KEY, 'prompt')) == 10
+    assert handler.calls == ['model-a', 'model-b']
+    assert ai_recommender._missing_until == {}
+
+def test_slow_primary_triggers_a_hedge(stub, monkeypatch):
+    handler = stub(delays={'model-a': 3.0, 'model-b': 0.05})
+    monkeypatch.setattr(ai_recommender, 'AI_HEDGE_AFTER', 0.2)
+    monkeypatch.setattr(ai_recommender, '_hedge_slots', threading.BoundedSemaphore(1))
+
+    start = time.perf_counter()
+    assert len(ai_recommender._ask_claude(API_KEY, 'prompt')) == 10
+    assert time.perf_counter() - start < 2.0
+    assert handler.calls == ['model-a', 'model-b']
+
+def test_hedges_in_flight_are_capped(stub, monkeypatch):
+    handler = stub(delays={'model-a': 1.0, 'model-b': 0.3, 'model-c': 0.3})
+    monkeypatch.setattr(ai_recommender, 'AI_HEDGE_AFTER', 0.1)
+    monkeypatch.setattr(ai_recommender, 'AI_MAX_HEDGES', 2)
+    monkeypatch.setattr(ai_recommender, '_hedge_slots', threading.BoundedSemaphore(2))
+
+    results = []
+    requests = [
+        threading.Thread(target=lambda: results.append(ai_recommender._ask_claude(API_KEY, 'prompt')))
+        for _ in range(5)
+    ]
+    for thread in requests:
+        thread.start()
+    for thread in requests:
+        thread.join()
+
+    assert len(results) == 5 and all(len(result) == 10 for result in results)
+    # Every request started its primary, some hedged, but never more than
+    # AI_MAX_HEDGES hedges were running at the same time
+    assert handler.calls.count('model-a') == 5
+    hedges = [(start, end) for model, start, end in handler.intervals if model != 'model-a']
+    assert hedges
+    most_at_once = max(sum(1 for other_start, other_end in hedges if other_start <= start < other_end) for start, _ in hedges)
+    assert most_at_once <= ai_recommender.AI_MAX_HEDGES
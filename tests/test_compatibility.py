@@ -0,0 +1,43 @@
+"""Saving and reloading the compatibility matrix"""
+import os
+
+import compatibility
+import corpus as corpus_module
+from film_catalog import film_url
+from user_profile import UserProfile
+
+def roster(corpus):
+    """load_roster_profiles for the corpus users, without the profile cache"""
+    def load_roster_profiles(usernames, fetch=False):
+        profiles = []
+        for username in usernames:
+            movies = {
+                slug: {'title': corpus.films[slug]['title'], 'rating': half_stars / 2 if half_stars else None,
+                       'year': corpus.films[slug]['year'], 'url': film_url(slug), 'slug': slug}
+                for slug, half_stars in corpus.users[username]
+            }
+            profiles.append(UserProfile.from_movies(movies))
+        return list(usernames), profiles, []
+    return load_roster_profiles
+
+def test_build_without_npz_suffix_is_found_by_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(compatibility, 'load_roster_profiles', roster(corpus_module.Corpus('small')))
+    path = str(tmp_path / 'compatibility')
+
+    compatibility.build(corpus_module.USERS, path=path)
+    # NumPy didn't add ".npz", and the temporary file was renamed into place
+    assert os.listdir(tmp_path) == ['compatibility']
+    data = compatibility.load(path)
+    assert data['usernames'].tolist() == list(corpus_module.USERS)
+
+def test_rebuild_replaces_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(compatibility, 'load_roster_profiles', roster(corpus_module.Corpus('small')))
+    path = str(tmp_path / 'compatibility.npz')
+
+    compatibility.build(corpus_module.USERS[:1], path=path)
+    first = os.stat(path).st_ino
+    compatibility.build(corpus_module.USERS, path=path)
+    # A new file swapped in, not the old one rewritten under a reader
+    assert os.stat(path).st_ino != first
+    assert os.listdir(tmp_path) == ['compatibility.npz']
+    assert compatibility.load(path)['usernames'].tolist() == list(corpus_module.USERS)
@@ -0,0 +1,81 @@
+"""How much of the rated lists fast mode loads, against a fake scraper"""
+import pytest
+
+import fast_mode
+import film_ids
+from user_profile import UserProfile
+
+PAGE_SIZE = 72
+
+def bucket(prefix, rating, pages):
+    """A rating bucket of distinct films, as pages of scraper entries"""
+    result = []
+    for page in range(pages):
+        films = {}
+        for i in range(PAGE_SIZE):
+            slug = f'{prefix}-{rating}-{page}-{i}'
+            films[slug] = {'title': slug, 'rating': rating, 'year': 2000, 'slug': slug, 'id': film_ids.intern(slug, slug, 2000, None, slug)}
+        result.append(films)
+    return result
+
+@pytest.fixture
+def site(monkeypatch):
+    """{username: {rating: [page, ...]}} served by a fake iter_rating_bucket_pages, which logs the pages it yields"""
+    buckets = {}
+    loaded = []
+
+    def iter_rating_bucket_pages(username, rating_value, max_pages=100, progress=None):
+        pages = buckets[username].get(rating_value, [])
+        for page, films in enumerate(pages[:max(max_pages, 0)], 1):
+            loaded.append((username, rating_value, page))
+            yield films
+        if len(pages) > max(max_pages, 0):
+            yield None
+
+    monkeypatch.setattr(fast_mode, 'iter_rating_bucket_pages', iter_rating_bucket_pages)
+    return buckets, loaded
+
+def watched(buckets):
+    movies = {}
+    for pages in buckets.values():
+        for films in pages:
+            movies.update(films)
+    return UserProfile.from_movies(movies)
+
+def test_large_five_star_bucket_stops_once_recommends_settle(site):
+    buckets, loaded = site
+    buckets['alice'] = {1.0: bucket('alice', 1.0, 1), 0.5: bucket('alice', 0.5, 1), 5.0: bucket('alice', 5.0, 30),
+                        4.5: bucket('alice', 4.5, 3)}
+    buckets['bob'] = {1.0: bucket('bob', 1.0, 1), 5.0: bucket('bob', 5.0, 2)}
+
+    streams = [fast_mode.load_first(username) for username in ('alice', 'bob')]
+    status = fast_mode.finish(*streams, watched(buckets['alice']), watched(buckets['bob']))
+
+    # Page 1 of alice's 5.0s has 72 films bob hasn't seen - nothing further can change her top 10
+    assert [(rating, page) for username, rating, page in loaded if username == 'alice'] == [(1.0, 1), (0.5, 1), (5.0, 1)]
+    assert set(status.values()) == {'exact'}
+
+def test_four_and_a_half_still_gets_budget(site):
+    buckets, loaded = site
+    # Every one of alice's 5.0 films is one bob has seen, so her top 10 are 4.5s
+    buckets['alice'] = {1.0: bucket('alice', 1.0, 2), 5.0: bucket('shared', 5.0, 3), 4.5: bucket('alice', 4.5, 30)}
+    buckets['bob'] = {1.0: bucket('bob', 1.0, 1), 5.0: bucket('shared', 5.0, 3)}
+
+    streams = [fast_mode.load_first(username) for username in ('alice', 'bob')]
+    status = fast_mode.finish(*streams, watched(buckets['alice']), watched(buckets['bob']))
+
+    assert ('alice', 4.5, 1) in loaded and ('alice', 4.5, 2) not in loaded
+    assert status['user1_recommends'] == 'exact'
+
+def test_failed_watched_list_loads_five_star_buckets_in_full(site):
+    buckets, loaded = site
+    buckets['alice'] = {1.0: bucket('alice', 1.0, 1), 5.0: bucket('shared', 5.0, 4)}
+    buckets['bob'] = {1.0: bucket('bob', 1.0, 1), 5.0: bucket('shared', 5.0, 4)}
+
+    streams = [fast_mode.load_first(username) for username in ('alice', 'bob')]
+    status = fast_mode.finish(*streams, watched(buckets['alice']), None)
+
+    # both_enjoyed comes from the rated buckets: 288 films both rated 5.0
+    assert all(('alice', 5.0, page) in loaded and ('bob', 5.0, page) in loaded for page in range(1, 5))
+    assert status['both_enjoyed'] == 'exact'
+    assert status['user1_recommends'] == 'provisional'
@@ -0,0 +1,29 @@
+"""Saving and reloading the item neighbour index"""
+import os
+
+import item_similarity
+from film_catalog import film_url
+from user_profile import UserProfile
+
+def profile(ratings):
+    return UserProfile.from_movies({
+        slug: {'title': slug.title(), 'rating': rating, 'year': 2000, 'url': film_url(slug), 'slug': slug}
+        for slug, rating in ratings.items()
+    })
+
+def test_build_without_npz_suffix_is_found_by_load(tmp_path, monkeypatch):
+    profiles = [
+        profile({'alien': 5.0, 'aliens': 4.5, 'heat': 2.0}),
+        profile({'alien': 4.5, 'aliens': 5.0, 'heat': 1.0}),
+        profile({'alien': 1.0, 'aliens': 1.5, 'heat': 5.0})
+    ]
+    monkeypatch.setattr(item_similarity, 'load_roster_profiles', lambda usernames: (list(usernames), profiles, []))
+    monkeypatch.setattr(item_similarity, 'ITEM_MIN_SUPPORT', 1)
+    path = str(tmp_path / 'item-similarity')
+
+    item_similarity.build(['a', 'b', 'c'], path=path)
+    item_similarity.build(['a', 'b', 'c'], path=path)
+    # NumPy didn't add ".npz", and each temporary file was renamed into place
+    assert os.listdir(tmp_path) == ['item-similarity']
+    index = item_similarity.load(path)
+    assert sorted(index.rows_for(profiles[0].ids).tolist()) == [0, 1, 2]
@@ -0,0 +1,77 @@
+"""poster_parser against the old BeautifulSoup extraction (benchmarks/bench_parser.py)"""
+import os
+
+import pytest
+
+import poster_parser
+from bench_parser import FIXTURES, FIXTURES_DIR, beautifulsoup_films
+
+def grid(*posters):
+    return ('<html><body><ul class="poster-list">' + ''.join(posters) + '</ul></body></html>').encode('utf-8')
+
+# One poster per fallback, in each markup Letterboxd has used
+POSTERS = {
+    'link tooltip with year': grid(
+        '<li class="poster-container"><div class="poster film-poster" data-film-id="12" data-film-slug="heat-1995">'
+        '<img alt="Poster for Heat" /><a href="/film/heat-1995/" data-original-title="Heat (1995)"></a></div>'
+        '<p class="poster-viewingdata"><span class="rating rated-10">★★★★★</span></p></li>'
+    ),
+    'alt with "Poster for"': grid(
+        '<li class="poster-container"><div class="poster" data-film-id="13">'
+        '<img alt="Poster for Alien" /><a href="/film/alien/"></a></div></li>'
+    ),
+    'img title, stars without a rated class': grid(
+        '<li class="poster-container"><div class="poster" data-film-year="1982">'
+        '<img title="Tron" /></div><p class="poster-viewingdata"><span class="rating">★★★½</span></p></li>'
+    ),
+    'data-film-name on the parent': grid(
+        '<li class="posteritem" data-film-name="Ran" data-film-release-year="1985" data-film-slug="ran">'
+        '<img alt="" /><span class="rating -micro">★½</span></li>'
+    ),
+    'film-poster only, lazy link': grid(
+        '<li><div class="film-poster" data-target-link="/film/vertigo/" data-film-id="x9">'
+        '<img alt="Vertigo (1958)" /></div></li>'
+    ),
+    'data-film-id only, half star': grid(
+        '<li><div data-film-id="77" data-item-slug="m"><img alt="M" /><span class="rating">½</span></div></li>'
+    ),
+    'poster-container only, no rating': grid(
+        '<li class="poster-container" data-film-id="5"><img alt="Stalker" />'
+        '<a href="/film/stalker/?ref=grid"></a></li>'
+    ),
+    'no image, no title': grid(
+        '<li class="poster-container"><div class="poster"><a href="/film/x/"></a></div></li>'
+        '<li class="poster-container"><div class="poster"><img alt="" /></div></li>'
+    ),
+}
+
+@pytest.mark.parametrize('name', FIXTURES)
+def test_fixture_pages_match_beautifulsoup(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        content = f.read()
+    films, _ = poster_parser.parse_poster_grid(content)
+    assert len(films) == 72
+    assert films == beautifulsoup_films(content)
+
+@pytest.mark.parametrize('case', list(POSTERS))
+def test_fallbacks_match_beautifulsoup(case):
+    films, _ = poster_parser.parse_poster_grid(POSTERS[case])
+    assert films == beautifulsoup_films(POSTERS[case])
+
+def test_fallback_values():
+    films = {case: poster_parser.parse_poster_grid(content)[0] for case, content in POSTERS.items()}
+
+    heat = films['link tooltip with year'][0]
+    assert (heat['title'], heat['year'], heat['slug'], heat['film_id'], heat['rating']) == ('Heat', 1995, 'heat-1995', 12, 5.0)
+    assert films['alt with "Poster for"'][0]['title'] == 'Alien'
+    assert films['alt with "Poster for"'][0]['slug'] == 'alien'
+    tron = films['img title, stars without a rated class'][0]
+    assert (tron['title'], tron['year'], tron['rating'], tron['url']) == ('Tron', 1982, 3.5, None)
+    ran = films['data-film-name on the parent'][0]
+    assert (ran['title'], ran['year'], ran['slug'], ran['rating']) == ('Ran', 1985, 'ran', 1.5)
+    vertigo = films['film-poster only, lazy link'][0]
+    assert (vertigo['year'], vertigo['url'], vertigo['film_id']) == (1958, 'https://letterboxd.com/film/vertigo/', None)
+    assert films['data-film-id only, half star'][0]['rating'] == 0.5
+    stalker = films['poster-container only, no rating'][0]
+    assert (stalker['slug'], stalker['rating'], stalker['film_id']) == ('stalker', None, 5)
+    assert films['no image, no title'] == []
@@ -0,0 +1,193 @@
+"""
+The array-based recommender against the original loop-based one
+
+baseline_sections is the baseline generate_recommendations, copied as it
+was except that films are keyed by slug (titles come from the entries)
+and the AI section is left out. Both run on the benchmark corpora.
+"""
+import pytest
+
+import corpus as corpus_module
+import recommender
+from film_catalog import film_url
+from letterboxd_scraper import RATED_BUCKETS
+
+def corpus_movies(corpus, username):
+    """(rated, watched) dicts for a corpus user, as the scraper returns them"""
+    entries = corpus.users[username]
+
+    def entry(slug, half_stars):
+        film = corpus.films[slug]
+        return {
+            'title': film['title'],
+            'rating': half_stars / 2 if half_stars else None,
+            'year': film['year'],
+            'url': film_url(slug),
+            'slug': slug,
+            'film_id': film['film_id']
+        }
+
+    # Rated buckets are merged in bucket order, each in list order
+    rated = {}
+    for rating in RATED_BUCKETS:
+        for slug, half_stars in entries:
+            if half_stars == int(rating * 2):
+                rated[slug] = entry(slug, half_stars)
+    watched = {slug: entry(slug, half_stars) for slug, half_stars in entries}
+    return rated, watched
+
+def baseline_sections(user1_movies, user2_movies, user1_watched, user2_watched, average_rating):
+    """
+    The baseline's sections, with both_enjoyed and both_hated left uncut
+
+    The baseline walked a set of titles, so films that tie on the sort key
+    came out in no particular order - the cut is applied by the caller
+    (see assert_same_ranking).
+    """
+    both_watched = set(user1_movies) & set(user2_movies)
+
+    both_enjoyed = []
+    for key in both_watched:
+        rating1 = user1_movies[key].get('rating') or 0
+        rating2 = user2_movies[key].get('rating') or 0
+        if rating1 >= 4.0 and rating2 >= 4.0:
+            both_enjoyed.append({
+                'title': user1_movies[key]['title'],
+                'user1_rating': rating1,
+                'user2_rating': rating2,
+                'year': user1_movies[key].get('year'),
+                'url': user1_movies[key].get('url')
+            })
+
+    def enjoyed_key(movie):
+        r1 = movie['user1_rating']
+        r2 = movie['user2_rating']
+        average = average_rating(movie.get('url'))
+        average = average if average is not None else 5.0
+        if r1 == 5.0 and r2 == 5.0:
+            return (1, average)
+        elif (r1 == 5.0 and r2 in [4.5, 4.0]) or (r2 == 5.0 and r1 in [4.5, 4.0]):
+            return (2, average)
+        return (3, average)
+
+    both_hated = []
+    for key in both_watched:
+        rating1 = user1_movies[key].get('rating')
+        rating2 = user2_movies[key].get('rating')
+        if rating1 is not None and rating2 is not None:
+            if 0.0 < rating1 <= 1.0 and 0.0 < rating2 <= 1.0:
+                both_hated.append({
+                    'title': user1_movies[key]['title'],
+                    'user1_rating': rating1,
+                    'user2_rating': rating2,
+                    'year': user1_movies[key].get('year'),
+                    'url': user1_movies[key].get('url')
+                })
+
+    def hated_key(movie):
+        return ((movie['user1_rating'] or 0) + (movie['user2_rating'] or 0)) / 2
+
+    def recommends(movies, other_watched):
+        rows = []
+        for key, data in movies.items():
+            rating = data.get('rating') or 0
+            if key not in other_watched and rating >= 4.5:
+                rows.append({'title': data['title'], 'rating': rating, 'year': data.get('year'), 'url': data.get('url')})
+        rows.sort(key=lambda x: x['rating'] or 0, reverse=True)
+        return rows[:10]
+
+    return {
+        'both_enjoyed': (both_enjoyed, enjoyed_key),
+        'both_hated': (both_hated, hated_key),
+        'user1_recommends': recommends(user1_movies, user2_watched),
+        'user2_recommends': recommends(user2_movies, user1_watched),
+        'stats': {
+            'user1_total': len(user1_watched),
+            'user2_total': len(user2_watched),
+            'common_movies': len(set(user1_watched) & set(user2_watched))
+        }
+    }
+
+def assert_same_ranking(rows, baseline_rows, sort_key, limit=10):
+    """
+    rows must be the baseline's top `limit` - the same sort keys in the same
+    order, and each row one of the baseline's rows with that key (so only
+    the order among ties may differ)
+    """
+    baseline_rows = sorted(baseline_rows, key=sort_key)
+    assert [sort_key(row) for row in rows] == [sort_key(row) for row in baseline_rows[:limit]]
+    by_key = {}
+    for row in baseline_rows:
+        by_key.setdefault(sort_key(row), []).append(row)
+    for row in rows:
+        assert row in by_key[sort_key(row)]
+    assert len({row['url'] for row in rows}) == len(rows)
+
+@pytest.mark.parametrize('size', corpus_module.SIZES)
+def test_sections_match_baseline(size, monkeypatch):
+    corpus = corpus_module.Corpus(size)
+    averages = {film_url(slug): film['average_rating'] for slug, film in corpus.films.items()}
+    monkeypatch.setattr(recommender, 'get_average_ratings', lambda urls: {url: averages.get(url) for url in urls if averages.get(url) is not None})
+    # new_suggestions is the AI's answer - nothing to compare
+    monkeypatch.setattr(recommender, '_find_new_suggestions', lambda *args, **kwargs: [])
+
+    user1, user2 = corpus_module.USERS
+    rated1, watched1 = corpus_movies(corpus, user1)
+    rated2, watched2 = corpus_movies(corpus, user2)
+
+    sections = recommender.generate_recommendations(rated1, rated2, watched1, watched2)
+    baseline = baseline_sections(rated1, rated2, watched1, watched2, averages.get)
+
+    assert list(sections) == recommender.SECTIONS
+    for name in ('user1_recommends', 'user2_recommends', 'stats'):
+        assert sections[name] == baseline[name], name
+    for name in ('both_enjoyed', 'both_hated'):
+        baseline_rows, sort_key = baseline[name]
+        assert_same_ranking(sections[name], baseline_rows, sort_key)
+
+def test_watched_lists_default_to_rated_lists(monkeypatch):
+    corpus = corpus_module.Corpus('small')
+    monkeypatch.setattr(recommender, 'get_average_ratings', lambda urls: {})
+    monkeypatch.setattr(recommender, '_find_new_suggestions', lambda *args, **kwargs: [])
+
+    user1, user2 = corpus_module.USERS
+    rated1, _ = corpus_movies(corpus, user1)
+    rated2, _ = corpus_movies(corpus, user2)
+
+    sections = recommender.generate_recommendations(rated1, rated2)
+    baseline = baseline_sections(rated1, rated2, rated1, rated2, lambda url: None)
+    for name in ('user1_recommends', 'user2_recommends', 'stats'):
+        assert sections[name] == baseline[name], name
+    for name in ('both_enjoyed', 'both_hated'):
+        baseline_rows, sort_key = baseline[name]
+        assert_same_ranking(sections[name], baseline_rows, sort_key)
+
+def test_edge_cases_match_baseline(monkeypatch):
+    """Ties across the 10-film cut, 4.0s just below the recommend cut-off, unrated films"""
+    def movies(ratings):
+        return {
+            f'film-{n}': {'title': f'Film {n % 7}', 'rating': rating, 'year': 2000 + n % 3,
+                          'url': film_url(f'film-{n}'), 'slug': f'film-{n}', 'film_id': n}
+            for n, rating in ratings
+        }
+
+    # 12 films both hated with the same ratings, 3 both rated 5.0, and 4.0s
+    # and 4.5s only one of them has seen
+    rated1 = movies([(n, 1.0) for n in range(12)] + [(20, 5.0), (21, 5.0), (22, 5.0)]
+                    + [(30, 4.5), (31, 4.0), (32, 4.5), (33, 4.0)] + [(40, 0.5), (41, 4.5)])
+    rated2 = movies([(n, 1.0) for n in range(12)] + [(20, 5.0), (21, 4.0), (22, 4.5)]
+                    + [(50, 4.0), (51, 5.0), (52, 4.5)] + [(40, 0.5), (41, None)])
+    watched2 = dict(rated2, **movies([(33, None)]))
+    averages = {film_url('film-20'): 3.1, film_url('film-21'): 3.1, film_url('film-22'): 2.0}
+    monkeypatch.setattr(recommender, 'get_average_ratings', lambda urls: {url: averages[url] for url in urls if url in averages})
+    monkeypatch.setattr(recommender, '_find_new_suggestions', lambda *args, **kwargs: [])
+
+    sections = recommender.generate_recommendations(rated1, rated2, rated1, watched2)
+    baseline = baseline_sections(rated1, rated2, rated1, watched2, averages.get)
+    for name in ('user1_recommends', 'user2_recommends', 'stats'):
+        assert sections[name] == baseline[name], name
+    for name in ('both_enjoyed', 'both_hated'):
+        baseline_rows, sort_key = baseline[name]
+        assert_same_ranking(sections[name], baseline_rows, sort_key)
+    assert len(sections['both_hated']) == 10
+    assert [movie['url'] for movie in sections['user1_recommends']] == [film_url('film-30'), film_url('film-32')]
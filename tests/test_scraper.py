@@ -0,0 +1,94 @@
+"""The concurrent crawls against a plain serial crawl, on the benchmark corpus"""
+import threading
+
+import pytest
+import requests
+
+import cache_db
+import corpus as corpus_module
+import http_client
+import letterboxd_scraper
+import stub_letterboxd
+from letterboxd_scraper import RATED_BUCKETS
+
+@pytest.fixture(scope='module')
+def corpus():
+    return corpus_module.Corpus('heavy')
+
+@pytest.fixture
+def site(corpus, monkeypatch):
+    """Serves the corpus and points the scraper at it, with no cache and no rate limit"""
+    server, base_url = stub_letterboxd.start(corpus, latency=0.002)
+    monkeypatch.setattr(http_client, 'LETTERBOXD_BASE_URL', base_url)
+    monkeypatch.setattr(http_client, 'REQUEST_INTERVAL', 0)
+    monkeypatch.setattr(http_client, '_host_limiters', {})
+    monkeypatch.setattr(cache_db, 'CACHE_ENABLED', False)
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+def serial_crawl(url_for_page, parse_page):
+    """The baseline scraper's loop: one page after another until one is missing or empty"""
+    movies = {}
+    page = 1
+    while True:
+        response = requests.get(http_client.request_url(url_for_page(page)), timeout=10)
+        if response.status_code != 200:
+            break
+        page_movies, _ = parse_page(response.content)
+        if not page_movies:
+            break
+        movies.update(page_movies)
+        page += 1
+    return movies
+
+def without_ids(movies):
+    """The scraper's entries minus the process-local interned ids"""
+    return [(key, {field: value for field, value in data.items() if field != 'id'}) for key, data in movies.items()]
+
+@pytest.mark.parametrize('username', corpus_module.USERS)
+def test_rated_crawl_matches_serial_crawl(site, username):
+    serial = {}
+    for rating_value in RATED_BUCKETS:
+        serial.update(serial_crawl(
+            lambda page: letterboxd_scraper._rated_page_url(username, rating_value, page),
+            lambda content: letterboxd_scraper._parse_rated_page(content, rating_value)
+        ))
+
+    concurrent = letterboxd_scraper.get_user_movies(username)
+    # Same films, same entries, same order
+    assert without_ids(concurrent) == list(serial.items())
+
+def test_watched_crawl_matches_serial_crawl(site):
+    username = corpus_module.USERS[0]
+    serial = serial_crawl(
+        lambda page: letterboxd_scraper._watched_page_url(username, page),
+        letterboxd_scraper._parse_watched_page
+    )
+
+    concurrent = letterboxd_scraper.get_user_watched_movies(username, incremental=False)
+    assert without_ids(concurrent) == list(serial.items())
+
+def test_rated_crawl_uses_one_pool(site):
+    """Every bucket shares one pool of MAX_CONCURRENT_REQUESTS workers"""
+    def pool_threads():
+        return sum(1 for thread in threading.enumerate() if thread.name.startswith('ThreadPoolExecutor'))
+
+    before = pool_threads()
+    most = 0
+    done = threading.Event()
+
+    def sample():
+        nonlocal most
+        while not done.is_set():
+            most = max(most, pool_threads() - before)
+            done.wait(0.001)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        letterboxd_scraper.get_user_movies(corpus_module.USERS[0])
+    finally:
+        done.set()
+        sampler.join()
+    assert 0 < most <= http_client.MAX_CONCURRENT_REQUESTS
@@ -0,0 +1,38 @@
+"""Per-analysis metrics for the streaming endpoint and background jobs"""
+import time
+
+import analysis
+import jobs
+import metrics
+
+def fake_analysis(user1, user2=None, emit=None, fast=False):
+    with metrics.span('work'):
+        metrics.count('pages_total', 3)
+        emit({'type': 'section', 'name': 'stats', 'data': {}})
+    return {'stats': {}}
+
+def test_stream_sends_timings_before_done(monkeypatch):
+    monkeypatch.setattr(analysis, '_run_analysis', lambda user1, user2, emit, fast=False: fake_analysis(user1, user2, emit))
+
+    events = list(analysis.iter_analysis_events('alice', timings=True))
+    assert [event['type'] for event in events] == ['section', 'timings', 'done']
+    timings = events[1]['data']
+    assert timings['spans']['work']['count'] == 1
+    assert timings['counters'] == {'pages_total': 3}
+
+    # Only when asked for
+    events = list(analysis.iter_analysis_events('alice'))
+    assert [event['type'] for event in events] == ['section', 'done']
+
+def test_job_records_its_timings(monkeypatch):
+    monkeypatch.setattr(jobs, 'analyze', fake_analysis)
+    manager = jobs.JobManager(max_workers=1)
+
+    job, _ = manager.submit('alice')
+    deadline = time.time() + 5
+    while job.status != 'done' and time.time() < deadline:
+        time.sleep(0.01)
+    result = job.to_dict()
+    assert result['status'] == 'done'
+    assert result['timings']['spans']['work']['count'] == 1
+    assert result['timings']['counters'] == {'pages_total': 3}